@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Recall@k vs latency report for the IVF index, measured against exact search.
+
+Uses real embeddings when --embeddings points at an (N, 512) .npy file,
+otherwise a synthetic clustered set that behaves like CLIP embeddings.
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ann_index import IVFIndex
+
+
+def synthetic_embeddings(n, dim=512, clusters=100, spread=2.5, seed=0):
+    """Unit vectors drawn around random, overlapping cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centres[labels] + spread * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--embeddings', help='Path to an (N, 512) float32 .npy file')
+    parser.add_argument('--n', type=int, default=200000, help='Synthetic catalog size')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=1024)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.load(args.embeddings).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Hold out the query rows so a query never finds itself
+        rng = np.random.default_rng(1)
+        held_out = rng.choice(len(vectors), args.queries, replace=False)
+        queries = vectors[held_out]
+        vectors = np.delete(vectors, held_out, axis=0)
+    else:
+        everything = synthetic_embeddings(args.n + args.queries)
+        vectors, queries = everything[:args.n], everything[args.n:]
+
+    print(f"📊 IVF benchmark: {len(vectors)} vectors, {args.queries} queries, k={args.k}, nlist={args.nlist}")
+
+    # Ground truth and exact-search latency
+    truth = exact_top_k(vectors, queries, args.k)
+    start = time.perf_counter()
+    for query in queries:
+        scores = vectors @ query
+        np.argpartition(-scores, args.k - 1)[:args.k]
+    exact_ms = (time.perf_counter() - start) / args.queries * 1000
+
+    start = time.perf_counter()
+    index = IVFIndex(dim=vectors.shape[1], nlist=args.nlist, train_size=len(vectors) + 1)
+    index.add(list(range(len(vectors))), vectors)
+    index.train()
+    print(f"⏱️ Build + train: {time.perf_counter() - start:.1f}s")
+
+    print(f"\n{'nprobe':>8} {'recall@' + str(args.k):>10} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f} {1.0:>8.1f}")
+    for nprobe in args.nprobe:
+        hits = 0
+        start = time.perf_counter()
+        results = [index.search(query, args.k, nprobe=nprobe) for query in queries]
+        elapsed_ms = (time.perf_counter() - start) / args.queries * 1000
+        for found, expected in zip(results, truth):
+            hits += len({item_id for item_id, _ in found} & expected)
+        recall = hits / (args.k * args.queries)
+        print(f"{nprobe:>8} {recall:>10.3f} {elapsed_ms:>10.2f} {exact_ms / elapsed_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
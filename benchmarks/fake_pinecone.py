@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a Pinecone index's data plane, with injected latency and errors.
+
+Speaks the REST calls PineconeStore makes (query, upsert, fetch, delete,
+describe_index_stats) over a LocalStore, so the SDK and ResilientStore can be
+exercised without the hosted service:
+
+    python benchmarks/fake_pinecone.py --port 5081 --latency-ms 20 --slow-rate 0.05 --slow-ms 500 --error-rate 0.02
+    PINECONE_HOST=http://127.0.0.1:5081 PINECONE_API_KEY=fake python src/routes.py
+
+Faults can be changed while it runs: POST /_faults {"error_rate": 1.0} takes the index "down",
+{"error_status": 400} makes the injected failures client errors instead of 503s.
+"""
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from vector_store import LocalStore
+
+
+class Faults:
+    """Latency and error injection, shared by every request thread"""
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, slow_rate=0.0, slow_ms=0.0, error_rate=0.0, error_status=503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+
+    def update(self, settings):
+        for name, value in settings.items():
+            if hasattr(self, name):
+                setattr(self, name, int(value) if name == 'error_status' else float(value))
+
+    def delay(self):
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+        if random.random() < self.slow_rate:
+            seconds += self.slow_ms / 1000
+        return seconds
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _match(match, include_values):
+    item = {'id': match.id, 'score': float(match.score), 'metadata': match.metadata or {}}
+    if include_values and match.values is not None:
+        item['values'] = np.asarray(match.values, dtype=np.float32).tolist()
+    return item
+
+
+def make_handler(store, faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; without this, delayed ACKs add ~40ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _faulty(self):
+            faults.requests += 1
+            time.sleep(faults.delay())
+            if random.random() < faults.error_rate:
+                self._reply(faults.error_status, {'code': 14 if faults.error_status >= 500 else 3,
+                                                  'message': 'Injected failure'})
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/_faults':
+                return self._reply(200, faults.as_dict())
+            if self._faulty():
+                return
+            if url.path == '/vectors/fetch':
+                response = store.fetch(parse_qs(url.query).get('ids', []))
+                return self._reply(200, {'namespace': '', 'vectors': {
+                    item_id: {'id': item_id, 'values': np.asarray(match.values).tolist(), 'metadata': match.metadata or {}}
+                    for item_id, match in response.vectors.items()
+                }})
+            if url.path == '/describe_index_stats':
+                return self._describe()
+            self._reply(404, {'message': f'Unknown path {url.path}'})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self._body()
+            if path == '/_faults':
+                faults.update(body)
+                return self._reply(200, faults.as_dict())
+            if self._faulty():
+                return
+            if path == '/query':
+                response = store.query(np.asarray(body['vector'], dtype=np.float32), top_k=body.get('topK', 10),
+                                       include_metadata=body.get('includeMetadata', False),
+                                       include_values=body.get('includeValues', False), filter=body.get('filter'))
+                return self._reply(200, {'namespace': '', 'matches': [
+                    _match(match, body.get('includeValues', False)) for match in response.matches
+                ]})
+            if path == '/vectors/upsert':
+                vectors = body.get('vectors', [])
+                store.upsert([{'id': record['id'], 'values': np.asarray(record['values'], dtype=np.float32),
+                               'metadata': record.get('metadata')} for record in vectors])
+                return self._reply(200, {'upsertedCount': len(vectors)})
+            if path == '/vectors/delete':
+                store.delete(body.get('ids', []))
+                return self._reply(200, {})
+            if path == '/describe_index_stats':
+                return self._describe()
+            self._reply(404, {'message': f'Unknown path {path}'})
+
+        def _describe(self):
+            self._reply(200, {'namespaces': {'': {'vectorCount': store.count()}}, 'dimension': store.dim,
+                              'indexFullness': 0.0, 'totalVectorCount': store.count()})
+
+    return Handler
+
+
+def serve(port=0, store=None, faults=None):
+    """Start the fake index on a background thread; returns (server, url, faults)"""
+    store = store or LocalStore()
+    faults = faults or Faults()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(store, faults))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-pinecone', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", faults
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=5081)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Share of requests that get --slow-ms extra')
+    parser.add_argument('--slow-ms', type=float, default=500)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 503')
+    args = parser.parse_args()
+
+    server, url, _ = serve(args.port, faults=Faults(args.latency_ms, args.jitter_ms, args.slow_rate,
+                                                    args.slow_ms, args.error_rate))
+    print(f"🧪 Fake Pinecone index on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
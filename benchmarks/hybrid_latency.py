@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+What the lexical stage of hybrid search costs on top of the vector query.
+
+Builds a synthetic catalog of product-like descriptions, indexes it in BM25Index
+and a LocalStore, then times per query: the vector query alone, the BM25 search,
+and the fusion of both (top limit * depth from each side).
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ann_recall import synthetic_embeddings
+from lexical_index import BM25Index, fuse
+from vector_store import LocalStore
+
+MATERIALS = ['walnut', 'oak', 'pine', 'steel', 'velvet', 'linen', 'leather', 'rattan', 'marble', 'glass']
+ITEMS = ['sofa', 'armchair', 'table', 'lamp', 'rug', 'shelf', 'bed', 'desk', 'stool', 'cabinet']
+BRANDS = ['IKEA', 'Hay', 'Muuto', 'Vitra', 'Poäng', 'Kartell', 'Ferm', 'Menu']
+
+
+def synthetic_descriptions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        f"{rng.choice(BRANDS)} {rng.choice(MATERIALS)} {rng.choice(ITEMS)} {rng.integers(40, 240)}cm "
+        f"SKU{rng.integers(100000, 999999)}"
+        for _ in range(n)
+    ]
+
+
+def percentiles(seconds):
+    return np.percentile(seconds, 50) * 1000, np.percentile(seconds, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=100000, help='Catalog size')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=4, help='HYBRID_DEPTH')
+    args = parser.parse_args()
+
+    descriptions = synthetic_descriptions(args.n + args.queries)
+    vectors = synthetic_embeddings(args.n + args.queries)
+
+    started = time.perf_counter()
+    lexical = BM25Index()
+    for i in range(args.n):
+        lexical.add(str(i), {'description': descriptions[i]})
+    index_seconds = time.perf_counter() - started
+
+    store = LocalStore(initial_capacity=args.n)
+    store.upsert([{'id': str(i), 'values': vectors[i]} for i in range(args.n)])
+
+    depth = args.limit * args.depth
+    timings = {'vector': [], 'bm25': [], 'fusion': []}
+    for q in range(args.n, args.n + args.queries):
+        # Queries reuse catalog wording: brand + material + size
+        words = descriptions[q].split()
+        text = ' '.join(words[:2] + words[3:4])
+
+        t0 = time.perf_counter()
+        matches = store.query(vectors[q], top_k=depth, include_metadata=False).matches
+        t1 = time.perf_counter()
+        hits = lexical.search(text, depth)
+        t2 = time.perf_counter()
+        fuse([(match.id, match.score) for match in matches], hits, 0.3)[:args.limit]
+        t3 = time.perf_counter()
+        timings['vector'].append(t1 - t0)
+        timings['bm25'].append(t2 - t1)
+        timings['fusion'].append(t3 - t2)
+
+    stats = lexical.stats()
+    print(f"📊 Hybrid search: {args.n} items, {stats['terms']} terms, {stats['postings']} postings "
+          f"(indexed in {index_seconds:.1f}s), top {depth} from each side")
+    for stage, seconds in timings.items():
+        p50, p99 = percentiles(seconds)
+        print(f"{stage:>8}: p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+    vector_p50 = percentiles(timings['vector'])[0]
+    added_p50 = percentiles(np.add(timings['bm25'], timings['fusion']))[0]
+    print(f"Lexical stage adds {added_p50:.2f} ms p50 ({added_p50 / vector_p50 * 100:.0f}% of the vector query)")
+
+
+if __name__ == "__main__":
+    main()
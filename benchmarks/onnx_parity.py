@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime engine against the PyTorch model: embedding parity, token parity,
+latency and RSS.
+
+Each engine runs in its own subprocess so RSS and import cost are measured
+from a clean interpreter; the ONNX workers also report whether torch got
+imported. Exits non-zero when an engine fails to run, its embeddings fall
+below --min-cosine or drift past --max-abs, or its token ids differ
+(tests/test_onnx_parity.py applies the same tolerances).
+
+    python src/export_onnx.py --quantize
+    python benchmarks/onnx_parity.py [images...] [--engines torch onnx onnx-int8]
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from precision_benchmark import TEXTS, get_rss_mb, cosine
+
+ENGINES = ('torch', 'onnx', 'onnx-int8')
+# Per-vector cosine floor and per-element ceiling against the torch embeddings (unit vectors)
+MIN_COSINE = 0.999
+MAX_ABS = 2e-3
+MIN_COSINE_INT8 = 0.98
+MAX_ABS_INT8 = 0.05
+
+
+def parity_failures(result, reference, min_cosine, max_abs):
+    """What is out of tolerance in result ({'images', 'texts', 'tokens'}) against reference; [] when nothing"""
+    failures = []
+    for tower in ('images', 'texts'):
+        if result[tower].shape != reference[tower].shape:
+            failures.append(f"{tower}: shape {result[tower].shape} != {reference[tower].shape}")
+            continue
+        worst_cosine = cosine(result[tower], reference[tower]).min()
+        worst_abs = np.abs(result[tower] - reference[tower]).max()
+        if worst_cosine < min_cosine:
+            failures.append(f"{tower}: cosine {worst_cosine:.5f} < {min_cosine}")
+        if worst_abs > max_abs:
+            failures.append(f"{tower}: max abs difference {worst_abs:.2e} > {max_abs:g}")
+    if not np.array_equal(result['tokens'], reference['tokens']):
+        failures.append("tokens: ids differ from the torch tokenizer")
+    return failures
+
+
+def image_files(paths, count, workdir):
+    """Real images when given, otherwise synthetic JPEGs written to workdir"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+        else:
+            files.append(path)
+    if files:
+        return files[:count]
+
+    from preprocess_benchmark import synthetic_jpeg
+    for i in range(count):
+        path = os.path.join(workdir, f'synthetic_{i}.jpg')
+        with open(path, 'wb') as f:
+            f.write(synthetic_jpeg(1200, 900, seed=i))
+        files.append(path)
+    return files
+
+
+def run_engine(engine, files, repeats, output):
+    """Worker: load one engine, time it and dump embeddings and tokens for the parent"""
+    baseline_rss = get_rss_mb()
+    started = time.perf_counter()
+    if engine == 'torch':
+        from model import ModelCLIP
+        clip = ModelCLIP(precision='fp32')
+    else:
+        from onnx_engine import OnnxModelCLIP
+        clip = OnnxModelCLIP(quantized=engine == 'onnx-int8')
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model, preprocess, tokenizer = clip.load_mobileclip_model()
+    load_seconds = time.perf_counter() - started
+    model_rss = get_rss_mb()
+
+    clip.encode_images(files[:1], model, preprocess)
+    clip.encode_texts(TEXTS[:1], model, tokenizer)
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            result = fn()
+        return (time.perf_counter() - start) / repeats, result
+
+    image_single, _ = timed(lambda: clip.encode_images(files[:1], model, preprocess))
+    text_single, _ = timed(lambda: clip.encode_texts(TEXTS[:1], model, tokenizer))
+    image_batch, image_vectors = timed(lambda: clip.encode_images(files, model, preprocess, batch_size=len(files)))
+    text_batch, text_vectors = timed(lambda: clip.encode_texts(TEXTS, model, tokenizer))
+
+    np.save(output + '.images.npy', image_vectors)
+    np.save(output + '.texts.npy', text_vectors)
+    np.save(output + '.tokens.npy', np.asarray(tokenizer(TEXTS)))
+    with open(output + '.json', 'w') as f:
+        json.dump({
+            'engine': engine,
+            'torch_imported': 'torch' in sys.modules,
+            'import_s': import_seconds,
+            'load_s': load_seconds,
+            'model_mb': model_rss - baseline_rss,
+            'peak_rss_mb': get_rss_mb(),
+            'image_ms': image_single * 1000,
+            'text_ms': text_single * 1000,
+            'image_per_s': len(files) / image_batch,
+            'text_per_s': len(TEXTS) / text_batch,
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', nargs='*', help='Image files or directories')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=ENGINES)
+    parser.add_argument('--count', type=int, default=16, help='Images per batch')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--min-cosine', type=float, default=MIN_COSINE, help='fp32 parity threshold')
+    parser.add_argument('--max-abs', type=float, default=MAX_ABS, help='fp32 largest allowed element difference')
+    parser.add_argument('--min-cosine-int8', type=float, default=MIN_COSINE_INT8)
+    parser.add_argument('--max-abs-int8', type=float, default=MAX_ABS_INT8)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_engine(args.worker, args.images, args.repeats, args.output)
+        return 0
+
+    engines = ['torch'] + [engine for engine in args.engines if engine != 'torch']
+    results = {}
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        files = image_files(args.images, args.count, workdir)
+        for engine in engines:
+            output = os.path.join(workdir, engine)
+            command = [sys.executable, __file__, '--worker', engine, '--output', output,
+                       '--repeats', str(args.repeats)] + files
+            print(f"🔄 Measuring {engine}...")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"❌ {engine} failed:\n{completed.stderr[-2000:]}")
+                failed = True
+                continue
+            with open(output + '.json') as f:
+                results[engine] = json.load(f)
+            for name in ('images', 'texts', 'tokens'):
+                results[engine][name] = np.load(f'{output}.{name}.npy')
+
+    if 'torch' not in results:
+        print("❌ torch reference failed - nothing to compare against")
+        return 1
+
+    reference = results['torch']
+    problems = {}
+    print(f"\n{'engine':>9} {'torch?':>6} {'import s':>8} {'load s':>7} {'model MB':>9} {'RSS MB':>7} "
+          f"{'img ms':>7} {'txt ms':>7} {'img/s':>7} {'txt/s':>7} {'tokens':>7} {'img cos':>8} {'txt cos':>8}")
+    for engine, result in results.items():
+        image_cos = cosine(result['images'], reference['images']).min()
+        text_cos = cosine(result['texts'], reference['texts']).min()
+        tokens_match = np.array_equal(result['tokens'], reference['tokens'])
+        if engine != 'torch':
+            int8 = engine.endswith('int8')
+            problems[engine] = parity_failures(result, reference,
+                                               args.min_cosine_int8 if int8 else args.min_cosine,
+                                               args.max_abs_int8 if int8 else args.max_abs)
+            failed = failed or bool(problems[engine])
+        print(f"{engine:>9} {'yes' if result['torch_imported'] else 'no':>6} {result['import_s']:>8.2f} "
+              f"{result['load_s']:>7.2f} {result['model_mb']:>9.0f} {result['peak_rss_mb']:>7.0f} "
+              f"{result['image_ms']:>7.1f} {result['text_ms']:>7.1f} {result['image_per_s']:>7.1f} "
+              f"{result['text_per_s']:>7.1f} {'same' if tokens_match else 'DIFF':>7} {image_cos:>8.5f} {text_cos:>8.5f}")
+
+    for engine, failures in problems.items():
+        for failure in failures:
+            print(f"❌ {engine} {failure}")
+    print("\n❌ Parity check failed" if failed else "\n✅ ONNX engines match the torch model")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Query latency and error rate of PineconeStore with and without ResilientStore,
+against the fake index in fake_pinecone.py (injected latency, slow tail, 503s).
+
+Scenarios, each timed over the same queries:
+    raw       PineconeStore straight through the SDK
+    retries   ResilientStore: deadline + jittered retries
+    hedged    ResilientStore: same, plus a hedged duplicate after --hedge-ms
+    outage    every request fails; the breaker opens and the local replica answers
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ann_recall import synthetic_embeddings
+from fake_pinecone import serve, Faults
+from vector_store import PineconeStore, LocalStore
+from resilient_store import ResilientStore, CircuitBreaker, parse_hedge
+
+
+def run(store, queries, top_k, concurrency):
+    def one(vector):
+        started = time.perf_counter()
+        try:
+            store.query(vector, top_k=top_k, include_metadata=False)
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, queries))
+    seconds = np.array([elapsed for elapsed, _ in results]) * 1000
+    errors = sum(1 for _, error in results if error is not None)
+    return np.percentile(seconds, 50), np.percentile(seconds, 99), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=5000, help='Vectors in the fake index')
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=15)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-ms', type=float, default=300)
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--deadline-ms', type=float, default=1000)
+    parser.add_argument('--hedge-ms', default='60', help="Milliseconds or 'auto'")
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.n + args.queries)
+    records = [{'id': str(i), 'values': vectors[i]} for i in range(args.n)]
+    queries = list(vectors[args.n:])
+
+    faults = Faults()
+    server, url, faults = serve(faults=faults)
+    raw = PineconeStore(api_key='fake', host=url)
+    raw.upsert_chunked(records, chunk_size=500)
+    replica = LocalStore(initial_capacity=args.n)
+    replica.upsert(records)
+
+    def resilient(hedge):
+        return ResilientStore(raw, replica=replica, deadline=args.deadline_ms / 1000, hedge_after=hedge,
+                              breaker=CircuitBreaker(failure_threshold=5, reset_timeout=5))
+
+    print(f"📊 Fake Pinecone: {args.n} vectors, {args.latency_ms:g}±{args.jitter_ms:g}ms, "
+          f"{args.slow_rate:.0%} +{args.slow_ms:g}ms, {args.error_rate:.0%} 503s, concurrency {args.concurrency}")
+    scenarios = [
+        ('raw', raw, None),
+        ('retries', resilient(None), None),
+        ('hedged', resilient(parse_hedge(args.hedge_ms)), None),
+        ('outage', resilient(None), 1.0),
+    ]
+    for name, store, error_rate in scenarios:
+        faults.update({'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'slow_rate': args.slow_rate,
+                       'slow_ms': args.slow_ms, 'error_rate': args.error_rate if error_rate is None else error_rate})
+        p50, p99, errors = run(store, queries, args.top_k, args.concurrency)
+        line = f"{name:>8}: p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  errors {errors:4d}/{len(queries)}"
+        if isinstance(store, ResilientStore):
+            stats = store.stats()
+            line += (f"  retries {stats['retries']}  hedges {stats['hedges']} (won {stats['hedge_wins']})"
+                     f"  fallbacks {stats['fallbacks']}  breaker {stats['breaker']['state']}")
+        print(line)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Latency, throughput, RSS and fidelity of each ModelCLIP precision mode (fp32 / fp16 / bf16 / int8).
+
+Each mode runs in its own subprocess so RSS is not polluted by the others.
+Fidelity is the cosine similarity of every embedding against the fp32 one.
+
+    python benchmarks/precision_benchmark.py [images...] [--modes fp32 bf16 int8]
+"""
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+TEXTS = [
+    "modern grey sofa", "oak dining table", "walnut sideboard 180cm", "velvet armchair",
+    "scandinavian floor lamp", "rattan pendant light", "marble coffee table", "linen bed frame",
+    "industrial bookshelf", "ceramic table lamp", "wool area rug", "leather office chair",
+    "mid-century tv stand", "bamboo bar stool", "glass display cabinet", "outdoor teak bench",
+]
+
+
+def get_rss_mb():
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+    except ImportError:
+        return float('nan')
+
+
+def load_images(paths, count):
+    from PIL import Image
+    if paths:
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                             if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+            else:
+                files.append(path)
+        return [Image.open(file_path).convert('RGB') for file_path in files[:count]]
+
+    from preprocess_benchmark import synthetic_jpeg
+    return [Image.open(io.BytesIO(synthetic_jpeg(1200, 900, seed=i))).convert('RGB') for i in range(count)]
+
+
+def run_mode(mode, images, repeats, output):
+    """Worker: load one precision mode, time it and dump embeddings for the parent"""
+    import torch
+    from model import ModelCLIP
+
+    baseline_rss = get_rss_mb()
+    clip = ModelCLIP(precision=mode)
+    started = time.perf_counter()
+    model, preprocess, tokenizer = clip.load_mobileclip_model()
+    load_seconds = time.perf_counter() - started
+    model_rss = get_rss_mb()
+
+    # Warm up both towers
+    clip.encode_images(images[:1], model, preprocess)
+    clip.encode_texts(TEXTS[:1], model, tokenizer)
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            result = fn()
+        return (time.perf_counter() - start) / repeats, result
+
+    image_single, _ = timed(lambda: clip.encode_images(images[:1], model, preprocess))
+    text_single, _ = timed(lambda: clip.encode_texts(TEXTS[:1], model, tokenizer))
+    image_batch, image_vectors = timed(lambda: clip.encode_images(images, model, preprocess, batch_size=len(images)))
+    text_batch, text_vectors = timed(lambda: clip.encode_texts(TEXTS, model, tokenizer))
+
+    np.save(output + '.images.npy', image_vectors)
+    np.save(output + '.texts.npy', text_vectors)
+    with open(output + '.json', 'w') as f:
+        json.dump({
+            'mode': clip.precision,
+            'threads': torch.get_num_threads(),
+            'load_s': load_seconds,
+            'model_mb': model_rss - baseline_rss,
+            'peak_rss_mb': get_rss_mb(),
+            'image_ms': image_single * 1000,
+            'text_ms': text_single * 1000,
+            'image_per_s': len(images) / image_batch,
+            'text_per_s': len(TEXTS) / text_batch,
+        }, f)
+
+
+def cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', nargs='*', help='Image files or directories')
+    parser.add_argument('--modes', nargs='+', default=['fp32', 'fp16', 'bf16', 'int8'])
+    parser.add_argument('--count', type=int, default=16, help='Images per batch')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    if args.worker:
+        run_mode(args.worker, images, args.repeats, args.output)
+        return
+
+    modes = ['fp32'] + [mode for mode in args.modes if mode != 'fp32']
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in modes:
+            output = os.path.join(workdir, mode)
+            command = [sys.executable, __file__, '--worker', mode, '--output', output,
+                       '--count', str(args.count), '--repeats', str(args.repeats)] + args.images
+            print(f"🔄 Measuring {mode}...")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"❌ {mode} failed:\n{completed.stderr[-2000:]}")
+                continue
+            with open(output + '.json') as f:
+                results[mode] = json.load(f)
+            results[mode]['images'] = np.load(output + '.images.npy')
+            results[mode]['texts'] = np.load(output + '.texts.npy')
+
+    if 'fp32' not in results:
+        print("❌ fp32 baseline failed - nothing to compare against")
+        return
+
+    reference = results['fp32']
+    print(f"\n{'mode':>5} {'load s':>7} {'model MB':>9} {'RSS MB':>7} {'img ms':>7} {'txt ms':>7} "
+          f"{'img/s':>7} {'txt/s':>7} {'img cos min':>12} {'txt cos min':>12}")
+    for mode, result in results.items():
+        image_cos = cosine(result['images'], reference['images'])
+        text_cos = cosine(result['texts'], reference['texts'])
+        print(f"{mode:>5} {result['load_s']:>7.1f} {result['model_mb']:>9.0f} {result['peak_rss_mb']:>7.0f} "
+              f"{result['image_ms']:>7.1f} {result['text_ms']:>7.1f} {result['image_per_s']:>7.1f} "
+              f"{result['text_per_s']:>7.1f} {image_cos.min():>12.4f} {text_cos.min():>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Decode + preprocess time per megapixel: the MobileCLIP torchvision transform
+against FastPreprocess (draft JPEG decode, single resize+crop, preallocated buffer).
+
+Pass image files / directories to measure real catalog photos; otherwise
+synthetic JPEGs of several sizes are generated in memory.
+"""
+import sys
+import os
+import io
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms as T
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from preprocess import FastPreprocess
+
+
+def reference_transform(size=256):
+    """Same pipeline mobileclip.create_model_and_transforms builds for mobileclip_s1"""
+    return T.Compose([
+        T.Resize(size, interpolation=T.InterpolationMode.BILINEAR),
+        T.CenterCrop(size),
+        T.ToTensor(),
+    ])
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """Smooth gradients plus noise - about 1.3 bits/pixel, in the range of a q90 product photo"""
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 1, width, dtype=np.float32), np.linspace(0, 1, height, dtype=np.float32))
+    pixels = np.stack([x * 200 + y * 40, y * 220, (1 - x) * 150 + y * 80], axis=-1)
+    pixels += rng.normal(scale=5, size=pixels.shape).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def load_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.extend(os.path.join(directory, name) for name in sorted(names)
+                             if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+        else:
+            files.append(path)
+    blobs = []
+    for file_path in files:
+        with open(file_path, 'rb') as f:
+            blobs.append((os.path.basename(file_path), f.read()))
+    return blobs
+
+
+def megapixels(data):
+    width, height = Image.open(io.BytesIO(data)).size
+    return width * height / 1e6
+
+
+def time_per_image(fn, data, repeats):
+    fn(data)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(data)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', nargs='*', help='Image files or directories')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    reference = reference_transform(args.size)
+    fast = FastPreprocess.from_transform(reference)
+
+    if args.images:
+        inputs = load_inputs(args.images)
+    else:
+        inputs = [(f"{w}x{h}", synthetic_jpeg(w, h)) for w, h in ((800, 600), (1600, 1200), (3000, 2000), (4000, 3000))]
+
+    def slow(data):
+        return reference(Image.open(io.BytesIO(data)).convert('RGB'))
+
+    print(f"📊 Preprocess benchmark ({args.repeats} repeats, {args.size}px)")
+    print(f"\n{'image':>14} {'MP':>6} {'ref ms':>8} {'fast ms':>8} {'ref ms/MP':>10} {'fast ms/MP':>11} {'speedup':>8} {'max |Δ|':>8} {'mean |Δ|':>9}")
+    totals = [0.0, 0.0, 0.0]
+    for name, data in inputs:
+        mp = megapixels(data)
+        slow_s = time_per_image(slow, data, args.repeats)
+        fast_s = time_per_image(fast, data, args.repeats)
+        difference = (slow(data) - fast(data)).abs()
+        totals[0] += mp
+        totals[1] += slow_s
+        totals[2] += fast_s
+        print(f"{name[:14]:>14} {mp:>6.2f} {slow_s * 1000:>8.1f} {fast_s * 1000:>8.1f} "
+              f"{slow_s * 1000 / mp:>10.2f} {fast_s * 1000 / mp:>11.2f} {slow_s / fast_s:>8.1f} "
+              f"{difference.max().item():>8.3f} {difference.mean().item():>9.4f}")
+
+    print(f"\n⏱️ Overall: {totals[1] * 1000 / totals[0]:.2f} ms/MP before, "
+          f"{totals[2] * 1000 / totals[0]:.2f} ms/MP after ({totals[1] / totals[2]:.1f}x)")
+
+    # Batched form used by ingest
+    blobs = [data for _, data in inputs]
+    start = time.perf_counter()
+    fast.batch(blobs)
+    print(f"📦 Batched fast path: {(time.perf_counter() - start) * 1000 / len(blobs):.1f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
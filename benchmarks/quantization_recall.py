@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Memory, latency and recall@k of fp16 / int8 vector storage against the fp32 baseline.
+
+Pass --embeddings with an (N, 512) .npy dump of our catalog embeddings to
+measure on real data; otherwise a synthetic clustered set is used.
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from vector_store import LocalStore
+from ann_recall import synthetic_embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--embeddings', help='Path to an (N, 512) float32 .npy file')
+    parser.add_argument('--n', type=int, default=100000, help='Synthetic catalog size')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.load(args.embeddings).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        rng = np.random.default_rng(1)
+        held_out = rng.choice(len(vectors), args.queries, replace=False)
+        queries = vectors[held_out]
+        vectors = np.delete(vectors, held_out, axis=0)
+    else:
+        everything = synthetic_embeddings(args.n + args.queries)
+        vectors, queries = everything[:args.n], everything[args.n:]
+
+    records = [{"id": str(i), "values": vector} for i, vector in enumerate(vectors)]
+    print(f"📊 Quantization benchmark: {len(vectors)} vectors, {args.queries} queries, k={args.k}")
+
+    baseline = None
+    print(f"\n{'mode':>6} {'MB':>8} {'bytes/vec':>10} {'ms/query':>10} {'recall@' + str(args.k):>10}")
+    for mode in ('fp32', 'fp16', 'int8'):
+        store = LocalStore(dim=vectors.shape[1], initial_capacity=len(vectors), quantization=mode)
+        store.upsert(records)
+
+        start = time.perf_counter()
+        results = [{match.id for match in store.query(query, top_k=args.k, include_metadata=False).matches}
+                   for query in queries]
+        elapsed_ms = (time.perf_counter() - start) / args.queries * 1000
+
+        if baseline is None:
+            baseline = results
+        recall = sum(len(found & expected) for found, expected in zip(results, baseline)) / (args.k * args.queries)
+
+        memory = store.memory_bytes()
+        print(f"{mode:>6} {memory / 1024 / 1024:>8.1f} {memory / len(vectors):>10.0f} {elapsed_ms:>10.2f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
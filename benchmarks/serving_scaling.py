@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Throughput and memory of the pre-fork gunicorn server as the worker count grows.
+
+For each worker count a server is started with gunicorn.conf.py on a free port,
+waited on until /ready, then driven by concurrent keep-alive clients sending text
+searches (unique queries, so the text cache never answers). Memory is summed over
+master + workers: RSS counts the shared copy-on-write weights once per process,
+PSS splits shared pages between the processes using them, USS is private memory only.
+
+    python benchmarks/serving_scaling.py --workers 1 2 4 --clients 8 --duration 20 [--flask]
+
+Runs with VECTOR_STORE=local (empty) unless overridden, so only serving and inference are measured.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.append(os.path.join(ROOT, 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from precision_benchmark import TEXTS
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=600):
+    deadline = time.time() + timeout
+    consecutive = 0
+    while time.time() < deadline and process.poll() is None:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/ready')
+            consecutive = consecutive + 1 if connection.getresponse().status == 200 else 0
+            connection.close()
+            if consecutive >= 5:
+                return True
+        except OSError:
+            consecutive = 0
+        time.sleep(0.2)
+    return False
+
+
+def memory(pid):
+    """(rss, pss, uss) in MB summed over a process and its children"""
+    import psutil
+    root = psutil.Process(pid)
+    totals = np.zeros(3)
+    for process in [root] + root.children(recursive=True):
+        try:
+            info = process.memory_full_info()
+            totals += [info.rss, getattr(info, 'pss', float('nan')), info.uss]
+        except psutil.Error:
+            pass
+    return totals / 1024 / 1024
+
+
+def drive(port, clients, duration):
+    """Closed-loop load: each client sends its next search as soon as the last one returns"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client(number):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        sent = 0
+        while time.perf_counter() < stop:
+            body = json.dumps({'query': f"{TEXTS[sent % len(TEXTS)]} {number}-{sent}", 'limit': 5})
+            started = time.perf_counter()
+            try:
+                connection.request('POST', '/search', body=body, headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[0] += 1
+            sent += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), errors[0], time.perf_counter() - started
+
+
+def measure(label, command, env, port, clients, duration, warmup):
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        started = time.perf_counter()
+        if not wait_ready(port, server):
+            print(f"❌ {label}: server never became ready")
+            return None
+        ready_s = time.perf_counter() - started
+        idle = memory(server.pid)
+        drive(port, clients, warmup)
+        latencies, errors, elapsed = drive(port, clients, duration)
+        loaded = memory(server.pid)
+        return {
+            'label': label,
+            'ready_s': ready_s,
+            'rps': len(latencies) / elapsed,
+            'p50_ms': np.percentile(latencies, 50) * 1000 if len(latencies) else float('nan'),
+            'p99_ms': np.percentile(latencies, 99) * 1000 if len(latencies) else float('nan'),
+            'errors': errors,
+            'idle': idle,
+            'loaded': loaded,
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent closed-loop clients')
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds of load first')
+    parser.add_argument('--flask', action='store_true', help='Also measure the single-process Flask dev server')
+    args = parser.parse_args()
+
+    base_env = dict(os.environ)
+    base_env.setdefault('VECTOR_STORE', 'local')
+    base_env.setdefault('IMAGE_CACHE_PATH', '')
+    base_env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'ml-mobileclip'),
+                                                           base_env.get('PYTHONPATH')]))
+
+    configurations = []
+    if args.flask:
+        configurations.append(('flask dev', [sys.executable, 'src/routes.py'], {}))
+    for workers in args.workers:
+        configurations.append((f'{workers} worker{"s" if workers > 1 else ""}',
+                               [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'routes:app'],
+                               {'WEB_CONCURRENCY': str(workers)}))
+
+    print(f"📊 Serving scaling ({args.clients} clients, {args.duration:.0f}s each, {os.cpu_count()} CPUs)")
+    results = []
+    for label, command, extra in configurations:
+        port = free_port()
+        env = dict(base_env, PORT=str(port), **extra)
+        print(f"🔄 Measuring {label}...")
+        result = measure(label, command, env, port, args.clients, args.duration, args.warmup)
+        if result:
+            results.append(result)
+
+    print(f"\n{'server':>10} {'ready s':>8} {'req/s':>7} {'p50 ms':>7} {'p99 ms':>7} {'errors':>6} "
+          f"{'RSS MB':>7} {'PSS MB':>7} {'USS MB':>7} {'idle PSS':>9}")
+    for result in results:
+        rss, pss, uss = result['loaded']
+        print(f"{result['label']:>10} {result['ready_s']:>8.1f} {result['rps']:>7.1f} {result['p50_ms']:>7.1f} "
+              f"{result['p99_ms']:>7.1f} {result['errors']:>6} {rss:>7.0f} {pss:>7.0f} {uss:>7.0f} {result['idle'][1]:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
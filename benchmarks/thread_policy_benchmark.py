@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Per-request latency and aggregate throughput of each MODEL_THREADS_POLICY.
+
+For every (worker count, policy) pair, that many single-process encoders run side
+by side (as gunicorn workers would), each sending one image (or text) at a time in
+a closed loop for --duration seconds. Latency is per request; throughput is summed
+over the workers.
+
+    python benchmarks/thread_policy_benchmark.py [--workers 1 4] [--policies single auto all] [--mode image]
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from precision_benchmark import TEXTS
+from thread_policy import POLICIES, usable_cpus, cgroup_cpu_limit, affinity_cpus
+
+
+def run_worker(args):
+    """Worker: load the model under the policy in the environment, then encode until the deadline"""
+    from model import ModelCLIP
+
+    clip = ModelCLIP()
+    model, preprocess, tokenizer = clip.load_mobileclip_model()
+    if args.mode == 'image':
+        encode = lambda i: clip.encode_images([args.image], model, preprocess)
+    else:
+        encode = lambda i: clip.encode_texts([f"{TEXTS[i % len(TEXTS)]} {i}"], model, tokenizer)
+    for i in range(3):
+        encode(i)
+
+    # Start together with the other workers
+    time.sleep(max(0.0, args.start_at - time.time()))
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        encode(len(latencies))
+        latencies.append(time.perf_counter() - started)
+
+    with open(args.output, 'w') as f:
+        json.dump({'intra_op': clip.threads.intra_op, 'latencies': latencies}, f)
+
+
+def measure(workers, policy, args, image, workdir):
+    env = dict(os.environ, MODEL_THREADS_POLICY=policy, WEB_CONCURRENCY=str(workers))
+    start_at = time.time() + args.load_seconds
+    outputs = [os.path.join(workdir, f'{policy}-{workers}-{i}.json') for i in range(workers)]
+    processes = [
+        subprocess.Popen([sys.executable, __file__, '--worker', '--output', output, '--image', image,
+                          '--mode', args.mode, '--duration', str(args.duration), '--start-at', str(start_at)],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        for output in outputs
+    ]
+    for process in processes:
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            print(f"❌ {policy} x{workers} failed:\n{stderr[-2000:]}")
+            return None
+
+    results = []
+    for output in outputs:
+        with open(output) as f:
+            results.append(json.load(f))
+    latencies = np.concatenate([result['latencies'] for result in results])
+    return {
+        'intra_op': results[0]['intra_op'],
+        'p50_ms': np.percentile(latencies, 50) * 1000,
+        'p99_ms': np.percentile(latencies, 99) * 1000,
+        'per_s': len(latencies) / args.duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, usable_cpus()}))
+    parser.add_argument('--policies', nargs='+', default=list(POLICIES), choices=POLICIES)
+    parser.add_argument('--mode', choices=('image', 'text'), default='image')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--load-seconds', type=float, default=30.0, help='Time allowed for workers to load before the clock starts')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    parser.add_argument('--image', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    from preprocess_benchmark import synthetic_jpeg
+
+    print(f"📊 Thread policy benchmark ({args.mode}, {args.duration:.0f}s per run) - "
+          f"{affinity_cpus()} CPUs in affinity mask, cgroup limit {cgroup_cpu_limit() or 'none'}, "
+          f"{usable_cpus()} usable")
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        image = os.path.join(workdir, 'query.jpg')
+        with open(image, 'wb') as f:
+            f.write(synthetic_jpeg(1600, 1200))
+        for workers in args.workers:
+            for policy in args.policies:
+                print(f"🔄 {workers} worker(s), policy {policy}...")
+                result = measure(workers, policy, args, image, workdir)
+                if result:
+                    rows.append((workers, policy, result))
+
+    print(f"\n{'workers':>7} {'policy':>7} {'threads':>7} {'p50 ms':>8} {'p99 ms':>8} {'total/s':>8}")
+    for workers, policy, result in rows:
+        print(f"{workers:>7} {policy:>7} {result['intra_op']:>7} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['per_s']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
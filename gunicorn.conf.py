@@ -0,0 +1,62 @@
+"""
+Production serving: pre-fork gunicorn with the model loaded once in the master.
+
+    gunicorn -c gunicorn.conf.py routes:app
+
+The master loads and warms MobileCLIP before forking (see indexer.preload_model),
+so the weights are shared copy-on-write by every worker instead of loaded N times.
+Everything that owns sockets, files or threads (vector store client, SQLite cache,
+micro-batchers) is still created per worker, after the fork.
+
+Environment:
+    WEB_CONCURRENCY           worker processes (default: usable cores, at most 4)
+    GUNICORN_THREADS          request threads per worker (default 4) - lets the micro-batcher coalesce
+    MODEL_THREADS_POLICY      per-worker intra-op threads, see src/thread_policy.py
+                              (default auto: usable cores / workers)
+
+VECTOR_STORE=local / ivf / mmap are in-process, so each worker gets its own
+copy that the others never see; use Pinecone when running more than one worker.
+"""
+import os
+import gc
+import sys
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), path) for path in ('src', 'ml-mobileclip')]
+
+from thread_policy import ThreadConfig, thread_config, usable_cpus
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(usable_cpus(), 4)))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Split the cores between workers so N workers x M intra-op threads never oversubscribes
+worker_threads = thread_config(workers=workers)
+
+
+def on_starting(server):
+    # onnxruntime thread pools do not survive fork; sessions built here must run single-threaded
+    if os.environ.get('INFERENCE_ENGINE', 'torch').lower() == 'onnx':
+        os.environ['ORT_INTRA_OP_THREADS'] = '1'
+        os.environ['ORT_INTER_OP_THREADS'] = '1'
+    if workers > 1 and os.environ.get('VECTOR_STORE', 'pinecone').lower() != 'pinecone':
+        server.log.warning("VECTOR_STORE=%s is per-process: each of the %d workers keeps its own copy",
+                           os.environ.get('VECTOR_STORE'), workers)
+
+    from indexer import preload_model
+    # The master stays single-threaded: forking with a live multi-thread OpenMP pool is unsafe
+    preload_model(threads=ThreadConfig(1, 1, policy='pre-fork master', usable_cpus=usable_cpus(), workers=workers))
+    # Move everything allocated so far out of the collector's reach, so the
+    # workers' garbage collections don't write to (and un-share) those pages
+    gc.freeze()
+    server.log.info("Model preloaded; forking %d workers x %d request threads, each with %s",
+                    workers, threads, worker_threads.describe())
+
+
+def post_fork(server, worker):
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(worker_threads.intra_op)
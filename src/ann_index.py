@@ -0,0 +1,282 @@
+import os
+import threading
+import numpy as np
+
+from vector_store import VectorStore, Match, QueryResponse, FetchResponse
+from metadata_filter import matches_filter, parse_filter
+
+
+def _assign(vectors, centroids, chunk_size=4096):
+    """Index of the closest (highest dot product) centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        block = vectors[start:start + chunk_size]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(vectors, k, iterations=10, seed=0):
+    """
+    Spherical k-means - centroids are kept unit length so they can be
+    compared with the same dot product the index uses for scoring
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(vectors[order], starts[nonempty], axis=0)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+
+    return centroids.astype(np.float32)
+
+
+class _InvertedList:
+    """Growable float32 block of vectors plus their ids for one coarse cell"""
+    def __init__(self, dim, capacity=16):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, item_id, vector):
+        position = len(self.ids)
+        if position == self.vectors.shape[0]:
+            grown = np.zeros((position * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:position] = self.vectors
+            self.vectors = grown
+        self.vectors[position] = vector
+        self.ids.append(item_id)
+        return position
+
+    def remove(self, position):
+        """Swap-remove; returns the id that moved into position (or None)"""
+        last = len(self.ids) - 1
+        moved_id = None
+        if position != last:
+            moved_id = self.ids[last]
+            self.vectors[position] = self.vectors[last]
+            self.ids[position] = moved_id
+        self.ids.pop()
+        return moved_id
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit vectors.
+    Until train_size vectors have arrived everything lives in one list (exact search);
+    after that k-means centroids partition the space and a query scans only the
+    nprobe closest cells.
+    """
+    def __init__(self, dim=512, nlist=256, nprobe=8, train_size=None, kmeans_iterations=10, seed=0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or nlist * 39
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids = None
+        self._lists = [_InvertedList(dim)]
+        self._where = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self._where)
+
+    def _all_vectors(self):
+        ids = []
+        blocks = []
+        for inverted_list in self._lists:
+            ids.extend(inverted_list.ids)
+            blocks.append(inverted_list.vectors[:len(inverted_list)])
+        vectors = np.concatenate(blocks) if blocks else np.empty((0, self.dim), dtype=np.float32)
+        return ids, vectors
+
+    def train(self, sample_size=None):
+        """(Re)build the coarse quantizer from the vectors currently in the index"""
+        with self._lock:
+            ids, vectors = self._all_vectors()
+            if len(ids) == 0:
+                return
+
+            sample_size = sample_size or self.nlist * 256
+            sample = vectors
+            if len(vectors) > sample_size:
+                rng = np.random.default_rng(self.seed)
+                sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+            self.centroids = train_kmeans(sample, self.nlist, self.kmeans_iterations, self.seed)
+            self._lists = [_InvertedList(self.dim) for _ in range(len(self.centroids))]
+            self._where = {}
+            self._insert(ids, vectors)
+
+    def _insert(self, ids, vectors):
+        if self.centroids is None:
+            cells = np.zeros(len(ids), dtype=np.int64)
+        else:
+            cells = _assign(vectors, self.centroids)
+        for item_id, vector, cell in zip(ids, vectors, cells):
+            position = self._lists[cell].append(item_id, vector)
+            self._where[item_id] = (int(cell), position)
+
+    def add(self, ids, vectors):
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        if len(set(ids)) < len(ids):
+            # An id repeated within the batch keeps its last vector, as separate upserts would
+            last = sorted({item_id: position for position, item_id in enumerate(ids)}.values())
+            ids = [ids[position] for position in last]
+            vectors = vectors[last]
+        with self._lock:
+            # Replacing an id means removing its old entry first
+            self.remove([item_id for item_id in ids if item_id in self._where])
+            self._insert(ids, vectors)
+            if self.centroids is None and len(self._where) >= self.train_size:
+                print(f"🔄 Training IVF index with {len(self._where)} vectors ({self.nlist} lists)...")
+                self.train()
+
+    def remove(self, ids):
+        with self._lock:
+            for item_id in ids:
+                location = self._where.pop(item_id, None)
+                if location is None:
+                    continue
+                cell, position = location
+                moved_id = self._lists[cell].remove(position)
+                if moved_id is not None:
+                    self._where[moved_id] = (cell, position)
+
+    def get(self, item_id):
+        with self._lock:
+            location = self._where.get(item_id)
+            if location is None:
+                return None
+            cell, position = location
+            return self._lists[cell].vectors[position].copy()
+
+    def search(self, query, k, nprobe=None, allow=None):
+        """
+        Return [(id, score), ...] for the k best matches in the nprobe closest cells.
+        allow(id) -> bool restricts the candidates (filtered results may number fewer than k).
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self.centroids is None:
+                probe = [0]
+            else:
+                nprobe = min(nprobe or self.nprobe, len(self.centroids))
+                centroid_scores = self.centroids @ query
+                probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+            cells = [cell for cell in probe if len(self._lists[cell])]
+            if not cells or k <= 0:
+                return []
+
+            scores = np.concatenate([
+                self._lists[cell].vectors[:len(self._lists[cell])] @ query for cell in cells
+            ])
+            offsets = np.cumsum([0] + [len(self._lists[cell]) for cell in cells])
+            if allow is not None:
+                allowed = np.fromiter((allow(item_id) for cell in cells for item_id in self._lists[cell].ids),
+                                      dtype=bool, count=len(scores))
+                scores = np.where(allowed, scores, -np.inf)
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            results = []
+            for flat in top:
+                if not np.isfinite(scores[flat]):
+                    break
+                slot = np.searchsorted(offsets, flat, side='right') - 1
+                results.append((self._lists[cells[slot]].ids[flat - offsets[slot]], float(scores[flat])))
+            return results
+
+
+class IVFStore(VectorStore):
+    """Vector store backend on top of IVFIndex - approximate, tunable per query with nprobe"""
+    name = 'ivf'
+    lexical_bootstrap = True
+
+    def __init__(self, dim=512, nlist=256, nprobe=8, train_size=None):
+        self.dim = dim
+        self.ann = IVFIndex(dim=dim, nlist=nlist, nprobe=nprobe, train_size=train_size)
+        self._metadata = {}
+
+    def upsert(self, vectors):
+        ids = [record["id"] for record in vectors]
+        matrix = np.asarray([record["values"] for record in vectors], dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+
+        self.ann.add(ids, matrix)
+        for record in vectors:
+            self._metadata[record["id"]] = record.get("metadata") or {}
+        return {"upserted_count": len(ids)}
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, nprobe=None, filter=None,
+              **search_params):
+        # Filters apply within the probed cells, so a selective filter may need a larger nprobe
+        filter = parse_filter(filter)
+        allow = (lambda item_id: matches_filter(self._metadata.get(item_id), filter)) if filter else None
+        matches = []
+        for item_id, score in self.ann.search(vector, top_k, nprobe=nprobe, allow=allow):
+            values = self.ann.get(item_id) if include_values else None
+            matches.append(Match(
+                id=item_id,
+                score=score,
+                metadata=self._metadata.get(item_id) if include_metadata else None,
+                values=values.tolist() if values is not None else None
+            ))
+        return QueryResponse(matches)
+
+    def delete(self, ids):
+        self.ann.remove(ids)
+        for item_id in ids:
+            self._metadata.pop(item_id, None)
+        return {}
+
+    def fetch(self, ids):
+        vectors = {}
+        for item_id in ids:
+            values = self.ann.get(item_id)
+            if values is not None:
+                vectors[item_id] = Match(id=item_id, metadata=self._metadata.get(item_id), values=values.tolist())
+        return FetchResponse(vectors)
+
+    def count(self):
+        return len(self.ann)
+
+    def scan_metadata(self):
+        """(id, metadata) of every record, e.g. to rebuild the lexical index"""
+        return list(self._metadata.items())
+
+
+def create_ivf_store():
+    return IVFStore(
+        dim=int(os.environ.get('VECTOR_DIM', 512)),
+        nlist=int(os.environ.get('IVF_NLIST', 256)),
+        nprobe=int(os.environ.get('IVF_NPROBE', 8)),
+        train_size=int(os.environ['IVF_TRAIN_SIZE']) if os.environ.get('IVF_TRAIN_SIZE') else None
+    )
@@ -0,0 +1,110 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into one batched call.
+
+    The worker takes the first waiting item, then keeps collecting for up to
+    max_wait seconds or until max_batch items are in hand, calls
+    batch_fn(items) once and hands every caller its own result.
+    With max_wait=0 it only batches what is already queued.
+    If a batch fails, its items are retried one by one, so only the
+    failing item's caller sees the error.
+    """
+    def __init__(self, batch_fn, max_batch=16, max_wait=0.003, name='batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}
+        # Failed batches re-run one item at a time
+        self.isolated_batches = 0
+        self._total_wait = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def submit(self, item):
+        """Queue one item; returns a Future resolving to its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._stats_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+        return future
+
+    def __call__(self, item):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            dispatched = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self._total_wait += sum(dispatched - submitted for _, _, submitted in batch)
+
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # One bad item (e.g. an undecodable upload) must not fail the requests batched with it
+                with self._stats_lock:
+                    self.isolated_batches += 1
+                for item, future, _ in batch:
+                    try:
+                        future.set_result(self.batch_fn([item])[0])
+                    except Exception as item_error:
+                        future.set_exception(item_error)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+                'avg_wait_ms': round(self._total_wait / self.items * 1000, 3) if self.items else 0.0,
+                'isolated_batches': self.isolated_batches,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())}
+            }
@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with an optional time-to-live.
+    Tracks hits, misses, evictions and expirations.
+    """
+    def __init__(self, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def normalize_query(text):
+    """Cache key for a text query - the tokenizer lowercases and collapses whitespace anyway"""
+    return ' '.join(text.lower().split())
+
+
+class ImageEmbeddingCache:
+    """
+    Embeddings keyed by a hash of the raw image bytes.
+    A bounded in-memory LRU sits in front of a persistent SQLite table,
+    so a hit skips decode, preprocessing and inference entirely.
+    """
+    def __init__(self, path='data/image_cache.sqlite', namespace='mobileclip_s1', memory_entries=1024, max_entries=100000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.memory = LRUCache(max_entries=memory_entries)
+        self.disk_hits = 0
+        self.disk_misses = 0
+        # The size bound is enforced every trim_every writes rather than on each insert
+        self.trim_every = 256
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps each put from forcing a full fsync
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)')
+        self._db.commit()
+
+    def key(self, data):
+        """Cache key for raw image bytes - includes the model so weights changes don't serve stale vectors"""
+        return f"{self.namespace}:{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, key):
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        with self._lock:
+            row = self._db.execute('SELECT vector FROM embeddings WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+            self._db.execute('UPDATE embeddings SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+
+        vector = np.frombuffer(row[0], dtype=np.float32).copy()
+        self.memory.put(key, vector)
+        return vector
+
+    def put(self, key, vector):
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        self.memory.put(key, vector)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)',
+                             (key, vector.tobytes(), time.time()))
+            self._writes += 1
+            if self._writes % self.trim_every == 0:
+                overflow = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    # Drop the least recently used entries
+                    self._db.execute('DELETE FROM embeddings WHERE key IN '
+                                     '(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)', (overflow,))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            disk_lookups = self.disk_hits + self.disk_misses
+        memory = self.memory.stats()
+        lookups = memory['hits'] + memory['misses']
+        return {
+            'memory': memory,
+            'disk_entries': entries,
+            'disk_max_entries': self.max_entries,
+            'disk_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'disk_hits': self.disk_hits,
+            'disk_misses': self.disk_misses,
+            'disk_hit_rate': round(self.disk_hits / disk_lookups, 4) if disk_lookups else 0.0,
+            'hit_rate': round((memory['hits'] + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+class QueryResultCache:
+    """
+    Final search results keyed by (query fingerprint, limit, filter, search knobs),
+    each tagged with the index generation it was computed at.
+
+    Every write to the index bumps the generation, and a lookup only returns an
+    entry of the current generation, so nothing computed before a write is served
+    after it. A bounded in-memory LRU answers hot queries; with a path, a SQLite
+    table shared by every worker (and the ingest process) holds both the entries
+    and the generation counter, so one worker's writes invalidate all of them.
+    """
+    def __init__(self, path=None, memory_entries=2048, max_entries=50000, ttl=None):
+        self.path = path or None
+        self.max_entries = max_entries
+        # Stale generations age out of the LRU; the TTL bounds staleness the generation can't see
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+        self._generation = 0
+        self.trim_every = 256
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, generation INTEGER NOT NULL, '
+                             'matches TEXT NOT NULL, stored_at REAL NOT NULL, last_used REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)')
+            self._db.execute('INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)')
+            self._db.commit()
+
+    @staticmethod
+    def fingerprint(kind, query):
+        """Query identity: normalized text, or a hash of the image bytes"""
+        if kind == 'text':
+            return f"text:{normalize_query(query)}"
+        return f"image:{hashlib.sha256(query).hexdigest()}"
+
+    @staticmethod
+    def key(fingerprint, *params):
+        """Cache key for a fingerprint plus everything that shapes the result"""
+        return hashlib.sha1(repr((fingerprint,) + params).encode('utf-8')).hexdigest()
+
+    def generation(self):
+        """Current index generation (read from the shared table when there is one)"""
+        if self._db is None:
+            return self._generation
+        with self._lock:
+            return self._db.execute('SELECT value FROM generation WHERE id = 0').fetchone()[0]
+
+    def invalidate(self):
+        """Bump the generation after a write - every cached result becomes stale"""
+        with self._lock:
+            self.invalidations += 1
+            if self._db is None:
+                self._generation += 1
+                generation = self._generation
+            else:
+                self._db.execute('UPDATE generation SET value = value + 1 WHERE id = 0')
+                generation = self._db.execute('SELECT value FROM generation WHERE id = 0').fetchone()[0]
+                self._db.execute('DELETE FROM results WHERE generation < ?', (generation,))
+                self._db.commit()
+        self.memory.clear()
+        return generation
+
+    def get(self, key, generation):
+        """[(id, score, metadata)] cached at this generation, or None"""
+        entry = self.memory.get(key)
+        if entry is None and self._db is not None:
+            with self._lock:
+                row = self._db.execute('SELECT generation, matches, stored_at FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None and self.ttl is not None and time.time() - row[2] > self.ttl:
+                    row = None
+                if row is not None and row[0] == generation:
+                    self._db.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+                    self._db.commit()
+            if row is not None:
+                entry = (row[0], [tuple(match) for match in json.loads(row[1])])
+                if row[0] == generation:
+                    self.memory.put(key, entry)
+        if entry is None:
+            return None
+        if entry[0] != generation:
+            with self._lock:
+                self.stale += 1
+            return None
+        return entry[1]
+
+    def put(self, key, generation, matches):
+        """Store [(id, score, metadata)] computed at generation"""
+        self.memory.put(key, (generation, matches))
+        if self._db is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO results (key, generation, matches, stored_at, last_used) '
+                             'VALUES (?, ?, ?, ?, ?)', (key, generation, json.dumps(matches), now, now))
+            self._writes += 1
+            if self._writes % self.trim_every == 0:
+                overflow = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    self._db.execute('DELETE FROM results WHERE key IN '
+                                     '(SELECT key FROM results ORDER BY last_used LIMIT ?)', (overflow,))
+            self._db.commit()
+
+    def record(self, hit, seconds):
+        """Count a lookup and how long answering it took (lookup only for hits, full search for misses)"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._hit_seconds += seconds
+            else:
+                self.misses += 1
+                self._miss_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            hit_ms = self._hit_seconds / self.hits * 1000 if self.hits else 0.0
+            miss_ms = self._miss_seconds / self.misses * 1000 if self.misses else 0.0
+            shared = None
+            if self._db is not None:
+                shared = {
+                    'entries': self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0],
+                    'max_entries': self.max_entries,
+                    'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                }
+        return {
+            'generation': self.generation(),
+            'memory_entries': len(self.memory),
+            'shared': shared,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'avg_hit_ms': round(hit_ms, 3),
+            'avg_miss_ms': round(miss_ms, 3),
+            # Each hit saved roughly what an average miss cost, minus its own lookup
+            'saved_ms': round(self.hits * max(miss_ms - hit_ms, 0.0), 1)
+        }
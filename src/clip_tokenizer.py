@@ -0,0 +1,135 @@
+"""
+CLIP byte-level BPE tokenizer without torch.
+
+Produces the same token ids as the open_clip SimpleTokenizer MobileCLIP uses,
+as an (N, context_length) int64 numpy array. `regex` and `ftfy` are used when
+installed (exact parity); otherwise the stdlib `re` approximation of the
+Unicode letter/number classes and plain HTML unescaping are used.
+"""
+import gzip
+import html
+import functools
+import numpy as np
+
+try:
+    import regex as re
+    _PATTERN = r"""|'s|'t|'re|'ve|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+"""
+except ImportError:
+    import re
+    _PATTERN = r"""|'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|(?:[^\s\w]|_)+"""
+
+try:
+    from ftfy import fix_text
+except ImportError:
+    def fix_text(text):
+        return text
+
+SPECIAL_TOKENS = ('<start_of_text>', '<end_of_text>')
+
+
+@functools.lru_cache()
+def bytes_to_unicode():
+    """Reversible map from utf-8 bytes to printable unicode characters"""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(2 ** 8):
+        if b not in bs:
+            bs.append(b)
+            cs.append(2 ** 8 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def get_pairs(word):
+    return set(zip(word[:-1], word[1:]))
+
+
+def clean_text(text):
+    text = fix_text(text)
+    text = html.unescape(html.unescape(text))
+    return " ".join(text.split()).strip().lower()
+
+
+class ClipTokenizer:
+    def __init__(self, bpe_path, context_length=77, cache_size=10000):
+        self.context_length = context_length
+        self.cache_size = cache_size
+
+        merges = gzip.open(bpe_path).read().decode("utf-8").split('\n')
+        merges = [tuple(merge.split()) for merge in merges[1:49152 - 256 - 2 + 1]]
+        vocab = list(bytes_to_unicode().values())
+        vocab = vocab + [v + '</w>' for v in vocab]
+        vocab.extend(''.join(merge) for merge in merges)
+        vocab.extend(SPECIAL_TOKENS)
+
+        self.byte_encoder = bytes_to_unicode()
+        self.encoder = dict(zip(vocab, range(len(vocab))))
+        self.bpe_ranks = dict(zip(merges, range(len(merges))))
+        self.cache = {token: token for token in SPECIAL_TOKENS}
+        self.pattern = re.compile("|".join(SPECIAL_TOKENS) + _PATTERN, re.IGNORECASE)
+        self.sot_token_id = self.encoder[SPECIAL_TOKENS[0]]
+        self.eot_token_id = self.encoder[SPECIAL_TOKENS[1]]
+
+    def bpe(self, token):
+        if token in self.cache:
+            return self.cache[token]
+        word = tuple(token[:-1]) + (token[-1] + '</w>',)
+        pairs = get_pairs(word)
+        if not pairs:
+            return token + '</w>'
+
+        while True:
+            bigram = min(pairs, key=lambda pair: self.bpe_ranks.get(pair, float('inf')))
+            if bigram not in self.bpe_ranks:
+                break
+            first, second = bigram
+            new_word = []
+            i = 0
+            while i < len(word):
+                try:
+                    j = word.index(first, i)
+                except ValueError:
+                    new_word.extend(word[i:])
+                    break
+                new_word.extend(word[i:j])
+                i = j
+                if i < len(word) - 1 and word[i + 1] == second:
+                    new_word.append(first + second)
+                    i += 2
+                else:
+                    new_word.append(word[i])
+                    i += 1
+            word = tuple(new_word)
+            if len(word) == 1:
+                break
+            pairs = get_pairs(word)
+
+        word = ' '.join(word)
+        if len(self.cache) >= self.cache_size:
+            # Query vocabularies are small; a full reset is cheaper than tracking recency
+            self.cache = {token: token for token in SPECIAL_TOKENS}
+        self.cache[token] = word
+        return word
+
+    def encode(self, text):
+        tokens = []
+        for piece in self.pattern.findall(clean_text(text)):
+            piece = ''.join(self.byte_encoder[b] for b in piece.encode('utf-8'))
+            tokens.extend(self.encoder[bpe_token] for bpe_token in self.bpe(piece).split(' '))
+        return tokens
+
+    def __call__(self, texts, context_length=None):
+        """One string or a list of strings -> (N, context_length) int64, truncated with a closing EOT"""
+        if isinstance(texts, str):
+            texts = [texts]
+        context_length = context_length or self.context_length
+
+        result = np.zeros((len(texts), context_length), dtype=np.int64)
+        for i, text in enumerate(texts):
+            tokens = [self.sot_token_id] + self.encode(text) + [self.eot_token_id]
+            if len(tokens) > context_length:
+                tokens = tokens[:context_length]
+                tokens[-1] = self.eot_token_id
+            result[i, :len(tokens)] = tokens
+        return result
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Export the MobileCLIP image and text towers to ONNX for the onnxruntime engine.
+
+    python src/export_onnx.py                   # fp32 graphs into models/onnx/
+    python src/export_onnx.py --quantize        # plus dynamic int8 copies (ONNX_QUANTIZED=1)
+
+Writes <model>_image.onnx, <model>_text.onnx, the BPE vocabulary and <model>.json
+(preprocessing, context length, graph files). Serve them with INFERENCE_ENGINE=onnx;
+torch is only needed for this step.
+"""
+import os
+import sys
+import json
+import shutil
+import inspect
+import argparse
+import numpy as np
+import torch
+
+from model import ModelCLIP
+from preprocess import FastPreprocess
+
+
+class ImageTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixels):
+        return self.model.encode_image(pixels)
+
+
+class TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens):
+        return self.model.encode_text(tokens)
+
+
+def reparameterize(model):
+    """Fold MobileOne train-time branches into single convolutions - same outputs, fewer ops"""
+    try:
+        from mobileclip.modules.common.mobileone import reparameterize_model
+    except ImportError:
+        return model
+    return reparameterize_model(model)
+
+
+def default_bpe():
+    try:
+        from open_clip.tokenizer import default_bpe as open_clip_bpe
+        return open_clip_bpe()
+    except ImportError:
+        return None
+
+
+def export_graph(module, example, path, input_name, opset):
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter handles dynamic_axes on every supported torch version
+        kwargs['dynamo'] = False
+    torch.onnx.export(
+        module, (example,), path,
+        input_names=[input_name],
+        output_names=['embedding'],
+        dynamic_axes={input_name: {0: 'batch'}, 'embedding': {0: 'batch'}},
+        opset_version=opset,
+        do_constant_folding=True,
+        **kwargs
+    )
+    print(f"✅ Exported {path} ({os.path.getsize(path) / 1024 / 1024:.1f}MB)")
+
+
+def quantize_graph(source, target, op_types):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(source, target, op_types_to_quantize=op_types, weight_type=QuantType.QInt8)
+    print(f"✅ Quantized {target} ({os.path.getsize(target) / 1024 / 1024:.1f}MB)")
+
+
+def check_parity(image_path, text_path, pixels, tokens, expected_image, expected_text):
+    """Cosine between torch and onnxruntime outputs on the export examples"""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("⚠️ onnxruntime not installed - skipping parity check")
+        return
+    for name, path, example, expected in (('image', image_path, pixels, expected_image),
+                                          ('text', text_path, tokens, expected_text)):
+        session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        actual = session.run(None, {session.get_inputs()[0].name: example})[0]
+        cosine = np.sum(actual * expected, axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+        print(f"🔍 {os.path.basename(path)}: min cosine vs torch {cosine.min():.6f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export MobileCLIP to ONNX')
+    parser.add_argument('--output', default=os.path.join('models', 'onnx'))
+    parser.add_argument('--model-name', default='mobileclip_s1')
+    parser.add_argument('--checkpoint', help='Defaults to the ModelCLIP checkpoint search')
+    parser.add_argument('--bpe', help='CLIP BPE vocabulary (defaults to the one shipped with open_clip)')
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--quantize', action='store_true', help='Also write dynamic int8 graphs')
+    parser.add_argument('--quantize-ops', nargs='+', default=['MatMul'],
+                        help='ONNX op types to quantize (MatMul mirrors MODEL_PRECISION=int8)')
+    args = parser.parse_args()
+
+    bpe = args.bpe or default_bpe()
+    if not bpe or not os.path.exists(bpe):
+        print("❌ CLIP BPE vocabulary not found - pass --bpe path/to/bpe_simple_vocab_16e6.txt.gz")
+        return 1
+
+    clip = ModelCLIP(model_name=args.model_name, checkpoint=args.checkpoint, precision='fp32')
+    model, preprocess, tokenizer = clip.load_mobileclip_model()
+    if not isinstance(preprocess, FastPreprocess):
+        preprocess = FastPreprocess.from_transform(preprocess)
+    if preprocess is None:
+        print("❌ Model preprocessing is not expressible as FastPreprocess - cannot serve it without torch")
+        return 1
+    model = reparameterize(model)
+
+    os.makedirs(args.output, exist_ok=True)
+    image_path = os.path.join(args.output, f'{args.model_name}_image.onnx')
+    text_path = os.path.join(args.output, f'{args.model_name}_text.onnx')
+
+    pixels = torch.rand(2, 3, preprocess.crop, preprocess.crop)
+    tokens = tokenizer(["a photo of a modern grey sofa", "oak dining table"])
+    with torch.no_grad():
+        expected_image = model.encode_image(pixels).numpy()
+        expected_text = model.encode_text(tokens).numpy()
+        export_graph(ImageTower(model).eval(), pixels, image_path, 'pixels', args.opset)
+        export_graph(TextTower(model).eval(), tokens, text_path, 'tokens', args.opset)
+    check_parity(image_path, text_path, pixels.numpy(), tokens.numpy(), expected_image, expected_text)
+
+    graphs = {'fp32': {'image': os.path.basename(image_path), 'text': os.path.basename(text_path)}}
+    if args.quantize:
+        quantized = {}
+        for tower, source in (('image', image_path), ('text', text_path)):
+            target = source.replace('.onnx', '.int8.onnx')
+            quantize_graph(source, target, args.quantize_ops)
+            quantized[tower] = os.path.basename(target)
+        graphs['int8'] = quantized
+
+    shutil.copyfile(bpe, os.path.join(args.output, os.path.basename(bpe)))
+    config = {
+        'model_name': args.model_name,
+        'embedding_dim': int(expected_image.shape[1]),
+        'context_length': int(tokens.shape[1]),
+        'opset': args.opset,
+        'preprocess': preprocess.to_config(),
+        'bpe': os.path.basename(bpe),
+        'graphs': graphs,
+    }
+    config_path = os.path.join(args.output, f'{args.model_name}.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"✅ Wrote {config_path} - serve with INFERENCE_ENGINE=onnx ONNX_MODEL_DIR={args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
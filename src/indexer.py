@@ -1,26 +1,44 @@
 import os
+import io
 import uuid
-import torch
+import time
+import atexit
+import threading
+import numpy as np
+from PIL import Image
 import gc
 from dotenv import load_dotenv
-from pinecone import Pinecone
+from vector_store import create_vector_store, Match
+from cache import LRUCache, ImageEmbeddingCache, QueryResultCache, normalize_query
+from batcher import MicroBatcher
+from lexical_index import BM25Index, FIELDS, FUSIONS, fuse
+from rerank import exact_scores, mmr
+from metadata_filter import filter_key, parse_filter
+from write_buffer import WriteBehindBuffer
+from resilient_store import StoreUnavailable
 
-# Try to import the full model first, fallback to minimal
-try:
-    from model import ModelCLIP
-    print("✅ Using full ModelCLIP implementation")
+load_dotenv()
+
+# INFERENCE_ENGINE=onnx serves exported graphs through onnxruntime and never imports torch
+if os.environ.get('INFERENCE_ENGINE', 'torch').lower() == 'onnx':
+    from onnx_engine import OnnxModelCLIP as ModelCLIP
+    print("✅ Using ONNX Runtime ModelCLIP implementation")
     USE_MINIMAL = False
-except ImportError as e:
-    print(f"⚠️ Full model import failed: {e}")
+else:
+    # Try to import the full model first, fallback to minimal
     try:
-        from model_minimal import ModelCLIP
-        print("🚨 Using MINIMAL ModelCLIP for emergency deployment")
-        USE_MINIMAL = True
-    except ImportError:
-        print("❌ No model implementation available!")
-        raise
-
-load_dotenv()
+        from model import ModelCLIP
+        print("✅ Using full ModelCLIP implementation")
+        USE_MINIMAL = False
+    except ImportError as e:
+        print(f"⚠️ Full model import failed: {e}")
+        try:
+            from model_minimal import ModelCLIP
+            print("🚨 Using MINIMAL ModelCLIP for emergency deployment")
+            USE_MINIMAL = True
+        except ImportError:
+            print("❌ No model implementation available!")
+            raise
 
 def get_memory_usage():
     """Get current memory usage"""
@@ -34,60 +52,381 @@ def get_memory_usage():
     except:
         return "Unknown"
 
+def get_memory_mb():
+    """Current RSS in MB, or None when psutil is unavailable"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+    except Exception:
+        return None
+
+def parse_towers(value):
+    """MODEL_TOWERS: 'both' (default), 'text' for search replicas, 'image' for ingest workers"""
+    value = (value or 'both').strip().lower()
+    towers = ('image', 'text') if value in ('both', 'all') else tuple(part.strip() for part in value.split(','))
+    if not towers or set(towers) - {'image', 'text'}:
+        raise ValueError(f"Unknown MODEL_TOWERS '{value}', expected both, image or text")
+    return towers
+
+# Set by preload_model() in a pre-fork server master; indexers created in the
+# forked workers adopt it, so every worker shares one copy-on-write set of weights
+_preloaded = None
+
+def preload_model(model_name='mobileclip_s1', towers=None, threads=None):
+    """Load the model and run each tower once in this process, before forking workers"""
+    global _preloaded
+    started = time.perf_counter()
+    towers = towers or parse_towers(os.environ.get('MODEL_TOWERS'))
+    clip = ModelCLIP(model_name=model_name, device='cpu', towers=towers, threads=threads)
+    model, preprocess, tokenizer = clip.load_mobileclip_model()
+    if clip.has_tower('text'):
+        clip.encode_texts(['warm up'], model, tokenizer)
+    if clip.has_tower('image'):
+        clip.encode_images([Image.new('RGB', (640, 480), (128, 128, 128))], model, preprocess)
+    _preloaded = (clip, model, preprocess, tokenizer)
+    print(f"✅ Model preloaded for workers in {time.perf_counter() - started:.1f}s (Memory: {get_memory_usage()})")
+    return _preloaded
+
 class SimpleIndexer:
-    def __init__(self):
-        """Initialize Pinecone only - defer model loading to save memory"""
-        # Setup Pinecone
-        self.pc = Pinecone(api_key=os.environ.get('PINECONE_API_KEY'))
-        self.index = self.pc.Index('decormate')
+    def __init__(self, towers=None, lexical=None):
+        """Initialize the vector store only - defer model loading to save memory"""
+        # Setup vector store (Pinecone by default, VECTOR_STORE=local for in-process search)
+        self.index = create_vector_store()
         
+        # Pinecone recommends upserting around 100 vectors per request
+        self.upsert_chunk_size = int(os.environ.get('UPSERT_CHUNK_SIZE', 100))
+
         # Model components - load on demand
+        self.model_name = 'mobileclip_s1'
+        # Towers loaded up front; a request for the other one loads it on demand
+        self.towers = towers or parse_towers(os.environ.get('MODEL_TOWERS'))
+        self._tower_lock = threading.Lock()
+        self._model_lock = threading.Lock()
         self.clip = None
         self.model = None
         self.preprocess = None
         self.tokenizer = None
-        print(f"✅ Pinecone ready - Model will load on first use (Memory: {get_memory_usage()})")
 
-    def _get_model(self):
-        """Load model only when needed with memory optimization"""
+        # Boot warm-up (start_warm_up) and the readiness it reports
+        self._created = time.perf_counter()
+        self._ready = threading.Event()
+        self._warmup_lock = threading.Lock()
+        self._warmup_thread = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.time_to_ready = None
+        self.warmup_error = None
+
+        # Hot text queries skip the text tower entirely
+        ttl = os.environ.get('TEXT_CACHE_TTL', '3600')
+        self.text_cache = LRUCache(
+            max_entries=int(os.environ.get('TEXT_CACHE_SIZE', 10000)),
+            ttl=float(ttl) if float(ttl) > 0 else None
+        )
+
+        # Duplicate uploads are recognised by content hash before decoding
+        image_cache_path = os.environ.get('IMAGE_CACHE_PATH', 'data/image_cache.sqlite')
+        self.image_cache = ImageEmbeddingCache(
+            path=image_cache_path,
+            namespace=self.model_name,
+            memory_entries=int(os.environ.get('IMAGE_CACHE_SIZE', 1024)),
+            max_entries=int(os.environ.get('IMAGE_CACHE_MAX_ENTRIES', 100000))
+        ) if image_cache_path else None
+
+        # Final results of repeated searches, tagged with the index generation that every write bumps.
+        # The SQLite file shares entries and the generation between workers (RESULT_CACHE_SIZE=0 disables)
+        result_cache_size = int(os.environ.get('RESULT_CACHE_SIZE', 2048))
+        result_ttl = float(os.environ.get('RESULT_CACHE_TTL', 300))
+        self.result_cache = QueryResultCache(
+            path=os.environ.get('RESULT_CACHE_PATH', 'data/result_cache.sqlite'),
+            memory_entries=result_cache_size,
+            max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 50000)),
+            ttl=result_ttl if result_ttl > 0 else None
+        ) if result_cache_size > 0 else None
+        # Per request thread: was the last search answered by a fallback replica (see served_degraded)
+        self._search_state = threading.local()
+
+        # WRITE_BEHIND=1: add_image / add_text journal the vector and return at once, a background
+        # thread upserts in batches; flush() is the barrier for read-your-writes
+        self.write_buffer = None
+        if os.environ.get('WRITE_BEHIND', '0') == '1':
+            self.write_buffer = WriteBehindBuffer(
+                self.index,
+                journal_path=os.environ.get('WRITE_BEHIND_JOURNAL', 'data/write_journal.sqlite'),
+                max_pending=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 10000)),
+                flush_size=int(os.environ.get('WRITE_BEHIND_BATCH', self.upsert_chunk_size)),
+                flush_interval=float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 200)) / 1000,
+                max_retries=int(os.environ.get('WRITE_BEHIND_RETRIES', 5)),
+                on_flushed=self._stored
+            )
+            atexit.register(self.write_buffer.close)
+
+        # Concurrent single queries are coalesced into one forward pass (MICRO_BATCH=0 disables)
+        self.text_batcher = None
+        self.image_batcher = None
+        if os.environ.get('MICRO_BATCH', '1') == '1':
+            max_batch = int(os.environ.get('MICRO_BATCH_MAX', 16))
+            max_wait = float(os.environ.get('MICRO_BATCH_WAIT_MS', 3)) / 1000
+            self.text_batcher = MicroBatcher(self._encode_text_batch, max_batch, max_wait, name='text-batcher')
+            self.image_batcher = MicroBatcher(self._encode_image_batch, max_batch, max_wait, name='image-batcher')
+
+        # BM25 over descriptions / content / categories, fused into text search rankings.
+        # HYBRID_WEIGHT is the default lexical share (0 = vector only); LEXICAL_INDEX=0 drops the index.
+        # Both default to off for stores the index can't be rebuilt from at boot (Pinecone, mmap):
+        # a per-worker index of recent uploads would rank differently in every worker
+        lexical_bootstrap = self.index.lexical_bootstrap
+        self.lexical_weight = float(os.environ.get('HYBRID_WEIGHT', 0.3 if lexical_bootstrap else 0.0))
+        self.fusion = os.environ.get('HYBRID_FUSION', 'rrf').lower()
+        if self.fusion not in FUSIONS:
+            raise ValueError(f"Unknown HYBRID_FUSION '{self.fusion}', expected one of {FUSIONS}")
+        # Both rankings are cut at limit * HYBRID_DEPTH before fusing
+        self.hybrid_depth = int(os.environ.get('HYBRID_DEPTH', 4))
+
+        # Second stage: over-fetch limit * RERANK_FACTOR candidates, re-score them exactly in fp32,
+        # and diversify with MMR when MMR_LAMBDA is set (both overridable per request)
+        self.rerank_factor = int(os.environ.get('RERANK_FACTOR', 1))
+        self.max_rerank_factor = int(os.environ.get('RERANK_MAX_FACTOR', 20))
+        self.mmr_lambda = float(os.environ['MMR_LAMBDA']) if os.environ.get('MMR_LAMBDA') else None
+        # Over-fetch used when MMR is asked for without a factor
+        self.mmr_factor = int(os.environ.get('MMR_FACTOR', 4))
+        self._rerank_lock = threading.Lock()
+        self.rerank_searches = 0
+        self._rerank_seconds = 0.0
+        self.lexical = None
+        if lexical is None:
+            lexical = os.environ.get('LEXICAL_INDEX', '1' if lexical_bootstrap else '0') == '1'
+        if lexical:
+            fields = [field.strip() for field in os.environ.get('LEXICAL_FIELDS', ','.join(FIELDS)).split(',') if field.strip()]
+            self.lexical = BM25Index(fields)
+            if lexical_bootstrap:
+                # In-memory stores hand back the metadata they already hold
+                self.lexical.add_many(self.index.scan_metadata())
+            else:
+                print(f"⚠️ Lexical index on '{self.index.name}' only covers items added by this process")
+        print(f"✅ Vector store '{self.index.name}' ready - Model will load on first use (Memory: {get_memory_usage()})")
+
+    def _get_model(self, tower=None):
+        """Load model only when needed with memory optimization; tower='image'/'text' also ensures that tower"""
         if self.model is None:
-            print(f"🔄 Loading model... (Memory: {get_memory_usage()})")
-            
-            # Force garbage collection before loading
-            import gc
-            gc.collect()
-            
-            self.clip = ModelCLIP(device='cpu')
-            self.model, self.preprocess, self.tokenizer = self.clip.load_mobileclip_model()
-            
-            # Force another cleanup after loading
-            gc.collect()
-            
-            print(f"✅ Model loaded (Memory: {get_memory_usage()})")
+            # Requests that arrive mid-load wait here for the one load in progress
+            with self._model_lock:
+                if self.model is None:
+                    self._load_model()
+        if tower and not self.clip.has_tower(tower):
+            self._load_tower(tower)
         return self.model, self.preprocess, self.tokenizer
 
+    def _load_model(self):
+        started = time.perf_counter()
+        if _preloaded is not None and _preloaded[0].model_name == self.model_name:
+            self.clip, model, self.preprocess, self.tokenizer = _preloaded
+            self.model = model
+            self.load_seconds = time.perf_counter() - started
+            print(f"✅ Using model preloaded before fork (Memory: {get_memory_usage()})")
+            return
+
+        print(f"🔄 Loading model... (Memory: {get_memory_usage()})")
+
+        # Force garbage collection before loading
+        import gc
+        gc.collect()
+
+        self.clip = ModelCLIP(model_name=self.model_name, device='cpu', towers=self.towers)
+        model, self.preprocess, self.tokenizer = self.clip.load_mobileclip_model()
+        # Published last: other threads only check self.model
+        self.model = model
+
+        # Force another cleanup after loading
+        gc.collect()
+
+        self.load_seconds = time.perf_counter() - started
+        print(f"✅ Model loaded in {self.load_seconds:.1f}s (Memory: {get_memory_usage()})")
+
+    def warm_up(self):
+        """Load the model and run one dummy forward pass per loaded tower, then mark the indexer ready"""
+        try:
+            self._get_model()
+            started = time.perf_counter()
+            if self.clip.has_tower('text'):
+                self._encode_text_batch(['warm up'])
+            if self.clip.has_tower('image'):
+                self._encode_image_batch([Image.new('RGB', (640, 480), (128, 128, 128))])
+            self.warmup_seconds = time.perf_counter() - started
+            self.time_to_ready = time.perf_counter() - self._created
+            self._ready.set()
+            print(f"🔥 Ready in {self.time_to_ready:.1f}s (model load {self.load_seconds:.1f}s, "
+                  f"warm-up {self.warmup_seconds:.1f}s, Memory: {get_memory_usage()})")
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"❌ Warm-up failed: {e}")
+
+    def start_warm_up(self):
+        """Run warm_up() once on a background thread; later calls return the same thread"""
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self.warm_up, name='model-warmup', daemon=True)
+                self._warmup_thread.start()
+        return self._warmup_thread
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def readiness(self):
+        """Warm-up state and timings for the /ready endpoint"""
+        def seconds(value):
+            return round(value, 3) if value is not None else None
+
+        if self._ready.is_set():
+            status = 'ready'
+        elif self.warmup_error:
+            status = 'failed'
+        elif self._warmup_thread is not None:
+            status = 'warming_up'
+        else:
+            status = 'idle'
+        return {
+            'ready': self._ready.is_set(),
+            'status': status,
+            'towers': list(self.clip.towers) if self.clip else None,
+            'load_s': seconds(self.load_seconds),
+            'warmup_s': seconds(self.warmup_seconds),
+            'time_to_ready_s': seconds(self.time_to_ready),
+            'error': self.warmup_error
+        }
+
+    def _load_tower(self, tower):
+        """Materialize a tower this process skipped at load time and log what it cost"""
+        with self._tower_lock:
+            if self.clip.has_tower(tower):
+                return
+            print(f"🔄 Loading {tower} tower on demand (Memory: {get_memory_usage()})")
+            before = get_memory_mb()
+            started = time.perf_counter()
+            self.model = self.clip.load_tower(self.model, tower)
+            after = get_memory_mb()
+            cost = f"+{after - before:.1f}MB" if before is not None and after is not None else "memory cost unknown"
+            print(f"✅ {tower.capitalize()} tower loaded in {time.perf_counter() - started:.1f}s "
+                  f"({cost}, Memory: {get_memory_usage()})")
+
+    def encode_query_text(self, text):
+        """Text query embedding, served from the LRU cache when possible"""
+        key = normalize_query(text)
+        vector = self.text_cache.get(key)
+        if vector is None:
+            if self.text_batcher:
+                vector = self.text_batcher(text)
+            else:
+                vector = self._encode_text_batch([text])[0]
+            self.text_cache.put(key, vector)
+        return vector
+
+    def _encode_text_batch(self, texts):
+        model, _, tokenizer = self._get_model('text')
+        return self.clip.encode_texts(texts, model, tokenizer)
+
+    def _encode_image_batch(self, images, batch_size=32):
+        model, preprocess, _ = self._get_model('image')
+        return self.clip.encode_images(images, model, preprocess, batch_size=batch_size)
+
+    def encode_query_image(self, image):
+        """Embedding for raw image bytes (bytes / bytearray / memoryview) or a PIL image - no disk I/O"""
+        if isinstance(image, Image.Image):
+            # Already decoded, so there are no bytes to hash
+            return self.image_batcher(image) if self.image_batcher else self._encode_image_batch([image])[0]
+        return self.encode_image_files([image])[0]
+
+    def encode_image_file(self, image_path):
+        """Image embedding, looked up by content hash before any decoding"""
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        return self.encode_image_files([data])[0]
+
+    def encode_image_files(self, blobs, batch_size=32):
+        """(N, 512) embeddings for raw image bytes - only cache misses reach the model"""
+        keys = [self.image_cache.key(data) for data in blobs] if self.image_cache else [None] * len(blobs)
+        vectors = [self.image_cache.get(key) if key else None for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            images = [io.BytesIO(blobs[i]) for i in missing]
+            if len(images) == 1 and self.image_batcher:
+                # Single query images share a forward pass with concurrent requests
+                encoded = [self.image_batcher(images[0])]
+            else:
+                encoded = self._encode_image_batch(images, batch_size=batch_size)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                if keys[i]:
+                    self.image_cache.put(keys[i], vector)
+
+        if not vectors:
+            return np.empty((0, 512), dtype=np.float32)
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+
+    def stats(self):
+        """Runtime counters for the /stats endpoint"""
+        return {
+            'memory': get_memory_usage(),
+            'towers': list(self.clip.towers) if self.clip else None,
+            'readiness': self.readiness(),
+            'text_cache': self.text_cache.stats(),
+            'image_cache': self.image_cache.stats() if self.image_cache else None,
+            'text_batcher': self.text_batcher.stats() if self.text_batcher else None,
+            'image_batcher': self.image_batcher.stats() if self.image_batcher else None,
+            'lexical': self.lexical.stats() if self.lexical else None,
+            'result_cache': self.result_cache.stats() if self.result_cache else None,
+            'write_buffer': self.write_buffer.stats() if self.write_buffer else None,
+            'vector_store': self.index.stats() if hasattr(self.index, 'stats') else None,
+            'rerank': {
+                'searches': self.rerank_searches,
+                'avg_ms': round(self._rerank_seconds / self.rerank_searches * 1000, 3) if self.rerank_searches else 0.0
+            }
+        }
+
+    @staticmethod
+    def _image_metadata(image_path, description=None):
+        return {
+            'type': 'image',
+            'name': os.path.basename(image_path),
+            'description': description or '',
+            'path': image_path
+        }
+
+    @staticmethod
+    def _text_metadata(text, category=None):
+        return {
+            'type': 'text',
+            'content': text,
+            'category': category or ''
+        }
+
     def add_image(self, image_path, description=None, custom_id=None):
-        """Add an image to the database"""
+        """Add an image file to the database"""
         try:
-            model, preprocess, _ = self._get_model()
-            # Create embedding
-            vector = self.clip.encode_image(image_path, model, preprocess)
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return None
+        return self.add_image_data(data, image_path, description, custom_id)
+
+    def add_image_data(self, data, name, description=None, custom_id=None):
+        """Add an image from in-memory bytes (e.g. straight from the request body)"""
+        try:
+            # Create embedding (skipped for bytes we have seen before)
+            vector = self.encode_query_image(data)
             
             # Use custom ID or generate one
             item_id = custom_id or str(uuid.uuid4())
-            metadata = {
-                'type': 'image',
-                'name': os.path.basename(image_path),
-                'description': description or '',
-                'path': image_path
-            }
+            metadata = self._image_metadata(name, description)
             
             # Save to database
-            self.index.upsert([{
+            record = {
                 "id": item_id,
-                "values": vector.tolist(),
+                "values": vector,
                 "metadata": metadata
-            }])
+            }
+            self._write([record])
             
             print(f"✅ Added image: {item_id}")
             return item_id
@@ -99,24 +438,21 @@ class SimpleIndexer:
     def add_text(self, text, category=None, custom_id=None):
         """Add text to the database"""
         try:
-            model, _, tokenizer = self._get_model()
+            model, _, tokenizer = self._get_model('text')
             # Create embedding
             vector = self.clip.encode_text(text, model, tokenizer)
             
             # Use custom ID or generate one
             item_id = custom_id or str(uuid.uuid4())
-            metadata = {
-                'type': 'text',
-                'content': text,
-                'category': category or ''
-            }
+            metadata = self._text_metadata(text, category)
             
             # Save to database
-            self.index.upsert([{
+            record = {
                 "id": item_id,
-                "values": vector.tolist(),
+                "values": vector,
                 "metadata": metadata
-            }])
+            }
+            self._write([record])
             
             print(f"✅ Added text: {item_id}")
             return item_id
@@ -125,46 +461,520 @@ class SimpleIndexer:
             print(f"❌ Error: {e}")
             return None
 
-    def search(self, query, limit=5):
-        """Search for similar items"""
+    def add_images(self, image_paths, descriptions=None, custom_ids=None, batch_size=32):
+        """Add many images to the database using batched encoding"""
         try:
-            model, preprocess, tokenizer = self._get_model()
-            
-            # Check if query is an image file
-            if os.path.exists(query) and query.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                # Search with image
-                vector = self.clip.encode_image(query, model, preprocess)
-                print(f"🔍 Searching with image: {os.path.basename(query)}")
+            # Create all embeddings in batched forward passes, skipping cached duplicates
+            blobs = []
+            for image_path in image_paths:
+                with open(image_path, 'rb') as f:
+                    blobs.append(f.read())
+            vectors = self.encode_image_files(blobs, batch_size=batch_size)
+
+            descriptions = descriptions or [None] * len(image_paths)
+            custom_ids = custom_ids or [None] * len(image_paths)
+
+            records = []
+            for image_path, vector, description, custom_id in zip(image_paths, vectors, descriptions, custom_ids):
+                records.append({
+                    "id": custom_id or str(uuid.uuid4()),
+                    "values": vector,
+                    "metadata": self._image_metadata(image_path, description)
+                })
+
+            # Save to database in chunks
+            failed = self.upsert_records(records)
+            if failed:
+                raise RuntimeError(f"{len(failed)} of {len(records)} vectors failed to upsert")
+
+            print(f"✅ Added {len(records)} images")
+            return [record["id"] for record in records]
+
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return None
+
+    def add_texts(self, texts, categories=None, custom_ids=None, batch_size=64):
+        """Add many texts to the database using batched encoding"""
+        try:
+            model, _, tokenizer = self._get_model('text')
+            # Create all embeddings in batched forward passes
+            vectors = self.clip.encode_texts(texts, model, tokenizer, batch_size=batch_size)
+
+            categories = categories or [None] * len(texts)
+            custom_ids = custom_ids or [None] * len(texts)
+
+            records = []
+            for text, vector, category, custom_id in zip(texts, vectors, categories, custom_ids):
+                records.append({
+                    "id": custom_id or str(uuid.uuid4()),
+                    "values": vector,
+                    "metadata": self._text_metadata(text, category)
+                })
+
+            # Save to database in chunks
+            failed = self.upsert_records(records)
+            if failed:
+                raise RuntimeError(f"{len(failed)} of {len(records)} vectors failed to upsert")
+
+            print(f"✅ Added {len(records)} texts")
+            return [record["id"] for record in records]
+
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return None
+
+    def upsert_records(self, records):
+        """Chunked (and for Pinecone, parallel) upsert - returns {id: error} for failed records"""
+        # Buffered single writes go first, so a batch never gets overwritten by older ones
+        self.flush()
+        failed = {}
+        for chunk, error in self.index.upsert_chunked(records, chunk_size=self.upsert_chunk_size):
+            if error is not None:
+                print(f"❌ Upsert of {len(chunk)} vectors failed: {error}")
+                for record in chunk:
+                    failed[record["id"]] = str(error)
             else:
-                # Search with text
-                vector = self.clip.encode_text(query, model, tokenizer)
-                print(f"🔍 Searching for: {query}")
-            
-            # Find similar items
-            results = self.index.query(
-                vector=vector.tolist(),
-                top_k=limit,
-                include_metadata=True
-            )
-            
-            # Show results
-            print(f"Found {len(results.matches)} results:")
-            for i, match in enumerate(results.matches, 1):
-                score = match.score
-                metadata = match.metadata
-                if metadata.get('type') == 'image':
-                    print(f"{i}. 📷 {metadata.get('name', 'Unknown')} (score: {score:.3f})")
-                else:
-                    content = metadata.get('content', metadata.get('name', 'Unknown'))
-                    print(f"{i}. 📝 {content[:50]}... (score: {score:.3f})")
-            
-            return results.matches
-            
+                self._index_lexical(chunk)
+            # Failed chunks may still have been partly written
+            self.invalidate_results()
+        return failed
+
+    def _write(self, records):
+        """Single-item write path: straight to the store, or through the write-behind buffer"""
+        if self.write_buffer is not None:
+            self.write_buffer.submit(records)
+        else:
+            self.index.upsert(records)
+            self._stored(records)
+
+    def _stored(self, records):
+        """Runs once the store holds records"""
+        self._index_lexical(records)
+        self.invalidate_results()
+
+    def flush(self, timeout=None):
+        """Wait until buffered writes are in the store (read-your-writes); False on timeout"""
+        if self.write_buffer is None:
+            return True
+        return self.write_buffer.flush(timeout)
+
+    def delete(self, ids):
+        """Remove items from the vector store and the lexical index"""
+        ids = list(ids)
+        # A buffered upsert of the same id must not land after its delete
+        self.flush()
+        try:
+            self.index.delete(ids)
+        finally:
+            self.invalidate_results()
+        if self.lexical is not None:
+            for item_id in ids:
+                self.lexical.remove(item_id)
+        print(f"🗑️ Deleted {len(ids)} items")
+        return ids
+
+    def invalidate_results(self):
+        """Call after any write to the index so cached search results are never served stale"""
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def _index_lexical(self, records):
+        """Keep the BM25 index in step with what the vector store accepted"""
+        if self.lexical is not None:
+            for record in records:
+                self.lexical.add(record["id"], record.get("metadata"))
+
+    def _encode_blobs_isolated(self, blobs, batch_size=32):
+        """Batched encode; if the batch fails, retry one by one so a bad file only fails itself"""
+        try:
+            return list(self.encode_image_files(blobs, batch_size=batch_size))
+        except Exception:
+            vectors = []
+            for data in blobs:
+                try:
+                    vectors.append(self.encode_image_files([data])[0])
+                except Exception as e:
+                    vectors.append(e)
+            return vectors
+
+    def _finish_batch(self, items, results, records, kind):
+        failed = self.upsert_records(records)
+        for item, result in zip(items, results):
+            if result['id'] in failed:
+                result['error'] = failed[result['id']]
+            # Never hand back a generated id that was not stored
+            if result['error'] and not item.get('id'):
+                result['id'] = None
+
+        print(f"✅ Batch added {sum(1 for r in results if not r['error'])}/{len(results)} {kind}")
+        return results
+
+    def add_image_batch(self, items, batch_size=32):
+        """
+        Add many uploaded images. items are dicts with 'data' (bytes), 'name',
+        optional 'description' and 'id'. Returns [{'id': ..., 'error': ...}] in input order.
+        """
+        results = [{'id': item.get('id') or str(uuid.uuid4()), 'error': None} for item in items]
+        vectors = self._encode_blobs_isolated([item['data'] for item in items], batch_size=batch_size)
+
+        records = []
+        for item, result, vector in zip(items, results, vectors):
+            if isinstance(vector, Exception):
+                result['error'] = f"Could not encode image: {vector}"
+                continue
+            records.append({
+                "id": result['id'],
+                "values": vector,
+                "metadata": self._image_metadata(item['name'], item.get('description'))
+            })
+
+        return self._finish_batch(items, results, records, 'images')
+
+    def add_text_batch(self, items, batch_size=64):
+        """
+        Add many texts. items are dicts with 'text', optional 'category' and 'id'.
+        Returns [{'id': ..., 'error': ...}] in input order.
+        """
+        results = [{'id': item.get('id') or str(uuid.uuid4()), 'error': None} for item in items]
+        valid = [i for i, item in enumerate(items) if isinstance(item.get('text'), str) and item['text'].strip()]
+        for i in set(range(len(items))) - set(valid):
+            results[i]['error'] = 'No text provided'
+
+        records = []
+        if valid:
+            model, _, tokenizer = self._get_model('text')
+            vectors = self.clip.encode_texts([items[i]['text'] for i in valid], model, tokenizer, batch_size=batch_size)
+            for i, vector in zip(valid, vectors):
+                records.append({
+                    "id": results[i]['id'],
+                    "values": vector,
+                    "metadata": self._text_metadata(items[i]['text'], items[i].get('category'))
+                })
+
+        return self._finish_batch(items, results, records, 'texts')
+
+    def search(self, query, limit=5, nprobe=None, filter=None, include_metadata=True, lexical_weight=None,
+               rerank_factor=None, mmr_lambda=None):
+        """Search for similar items - query is an image file path or text"""
+        if os.path.exists(query) and query.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+            try:
+                with open(query, 'rb') as f:
+                    data = f.read()
+            except Exception as e:
+                return self._search_failed(e)
+            return self.search_image(data, limit, nprobe, filter, include_metadata, rerank_factor, mmr_lambda)
+        return self.search_text(query, limit, nprobe, filter, include_metadata, lexical_weight, rerank_factor, mmr_lambda)
+
+    def search_text(self, text, limit=5, nprobe=None, filter=None, include_metadata=True, lexical_weight=None,
+                    rerank_factor=None, mmr_lambda=None):
+        """
+        Search with a text query, optionally restricted by a metadata filter.
+        lexical_weight (default HYBRID_WEIGHT) is the share of BM25 in the fused ranking;
+        rerank_factor / mmr_lambda control the second stage (see _rank).
+        """
+        self._search_state.degraded = False
+        try:
+            filter = parse_filter(filter)
+            plan = self._plan(limit, self._lexical_share(lexical_weight), rerank_factor, mmr_lambda)
+            return self._cached_search('text', text, plan, nprobe, filter, include_metadata,
+                                       lambda: self._text_matches(text, plan, nprobe, filter, include_metadata))
+        except StoreUnavailable:
+            # An outage is the caller's to report, not an empty result
+            raise
         except Exception as e:
-            print(f"❌ Search error: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            return self._search_failed(e)
+
+    def _text_matches(self, text, plan, nprobe, filter, include_metadata):
+        vector = self.encode_query_text(text)
+        print(f"🔍 Searching for: {text}")
+        matches = self._search_vector(vector, plan['depth'], nprobe, filter, include_metadata,
+                                      include_values=plan['staged'] and self.index.rerank_needs_values)
+        return self._rank(vector, matches, plan, text, filter)
+
+    def search_image(self, image, limit=5, nprobe=None, filter=None, include_metadata=True,
+                     rerank_factor=None, mmr_lambda=None):
+        """Search with an image given as raw bytes or a PIL image (nprobe tunes the IVF store)"""
+        self._search_state.degraded = False
+        try:
+            filter = parse_filter(filter)
+            plan = self._plan(limit, 0.0, rerank_factor, mmr_lambda)
+            search = lambda: self._image_matches(image, plan, nprobe, filter, include_metadata)
+            if isinstance(image, Image.Image):
+                # Already decoded, so there are no bytes to fingerprint
+                return search()
+            return self._cached_search('image', bytes(image), plan, nprobe, filter, include_metadata, search)
+        except StoreUnavailable:
+            # An outage is the caller's to report, not an empty result
+            raise
+        except Exception as e:
+            return self._search_failed(e)
+
+    def _image_matches(self, image, plan, nprobe, filter, include_metadata):
+        vector = self.encode_query_image(image)
+        print("🔍 Searching with image")
+        matches = self._search_vector(vector, plan['depth'], nprobe, filter, include_metadata,
+                                      include_values=plan['staged'] and self.index.rerank_needs_values)
+        return self._rank(vector, matches, plan)
+
+    def _result_key(self, kind, query, plan, nprobe, filter, include_metadata):
+        """Result cache key: the query plus every parameter that changes its answer"""
+        return self.result_cache.key(self.result_cache.fingerprint(kind, query), plan['limit'], plan['weight'],
+                                     plan['factor'], plan['mmr_lambda'], self.fusion, nprobe, filter_key(filter),
+                                     bool(include_metadata))
+
+    @staticmethod
+    def _cacheable(matches, include_metadata):
+        return [(match.id, float(match.score), (match.metadata or None) if include_metadata else None)
+                for match in matches]
+
+    def _cached_search(self, kind, query, plan, nprobe, filter, include_metadata, search):
+        """Answer from the result cache when the index hasn't changed since, else run search() and cache it"""
+        if self.result_cache is None:
+            return search()
+        started = time.perf_counter()
+        key = self._result_key(kind, query, plan, nprobe, filter, include_metadata)
+        # Read before searching: a write landing mid-search leaves this entry already stale
+        generation = self.result_cache.generation()
+        cached = self.result_cache.get(key, generation)
+        if cached is not None:
+            self.result_cache.record(True, time.perf_counter() - started)
+            print(f"⚡ Result cache hit ({len(cached)} matches, generation {generation})")
+            return [Match(id=item_id, score=score, metadata=metadata) for item_id, score, metadata in cached]
+        matches = search()
+        if not self.served_degraded():
+            # Replica answers may be stale, so they are never cached
+            self.result_cache.put(key, generation, self._cacheable(matches, include_metadata))
+        self.result_cache.record(False, time.perf_counter() - started)
+        return matches
+
+    def encode_query_texts(self, texts):
+        """(N, 512) text query embeddings - cache misses share one forward pass"""
+        keys = [normalize_query(text) for text in texts]
+        vectors = [self.text_cache.get(key) for key in keys]
+
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            encoded = self._encode_text_batch([texts[positions[0]] for positions in missing.values()])
+            for (key, positions), vector in zip(missing.items(), encoded):
+                self.text_cache.put(key, vector)
+                for i in positions:
+                    vectors[i] = vector
+
+        if not vectors:
+            return np.empty((0, 512), dtype=np.float32)
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+
+    def search_batch(self, queries, nprobe=None):
+        """
+        Answer many queries together. queries are dicts with 'text' (str) or 'image'
+        (raw bytes), optional 'limit', 'filter', 'rerank_factor', 'mmr_lambda' and (text
+        only) 'lexical_weight'. All texts share one forward pass, all images another,
+        and the store answers every vector in one call.
+        Returns [{'matches': [...], 'error': ..., 'degraded': bool}] in input order; degraded
+        results were answered by the fallback replica.
+        """
+        results = [{'matches': [], 'error': None, 'degraded': False} for _ in queries]
+        vectors = [None] * len(queries)
+        # Shorthands like {'type': 'text'} become operator form once, for every store and the cache key
+        filters = [None] * len(queries)
+        for i, query in enumerate(queries):
+            try:
+                filters[i] = parse_filter(query.get('filter'))
+            except ValueError as e:
+                results[i]['error'] = f"Invalid filter: {e}"
+        valid = [i for i in range(len(queries)) if results[i]['error'] is None]
+        plans = [
+            self._plan(int(query.get('limit', 5)),
+                       self._lexical_share(query.get('lexical_weight')) if query.get('text') is not None else 0.0,
+                       query.get('rerank_factor'), query.get('mmr_lambda'))
+            for query in queries
+        ]
+
+        # Repeated queries are answered from the result cache and skip encoding entirely
+        started = time.perf_counter()
+        keys = [None] * len(queries)
+        pending = list(valid)
+        if self.result_cache is not None:
+            generation = self.result_cache.generation()
+            pending = []
+            for i in valid:
+                query = queries[i]
+                kind = 'text' if query.get('text') is not None else 'image'
+                keys[i] = self._result_key(kind, query.get(kind), plans[i], nprobe, filters[i], False)
+                cached = self.result_cache.get(keys[i], generation)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    results[i]['matches'] = [Match(id=item_id, score=score) for item_id, score, _ in cached]
+            hits = len(valid) - len(pending)
+            for _ in range(hits):
+                self.result_cache.record(True, (time.perf_counter() - started) / hits)
+
+        texts = [i for i in pending if queries[i].get('text') is not None]
+        if texts:
+            for i, vector in zip(texts, self.encode_query_texts([queries[i]['text'] for i in texts])):
+                vectors[i] = vector
+
+        images = [i for i in pending if queries[i].get('text') is None]
+        if images:
+            for i, vector in zip(images, self._encode_blobs_isolated([queries[i]['image'] for i in images])):
+                if isinstance(vector, Exception):
+                    results[i]['error'] = f"Could not encode image: {vector}"
+                else:
+                    vectors[i] = vector
+
+        encoded = [i for i, vector in enumerate(vectors) if vector is not None]
+        if encoded:
+            search_params = {'nprobe': nprobe} if nprobe else {}
+            responses = self.index.query_batch(
+                np.stack([vectors[i] for i in encoded]),
+                top_k=[plans[i]['depth'] for i in encoded],
+                filter=[filters[i] for i in encoded],
+                # Only ids are returned, so skip shipping metadata back
+                include_metadata=False,
+                include_values=self.index.rerank_needs_values and any(plans[i]['staged'] for i in encoded),
+                **search_params
+            )
+            for i, response in zip(encoded, responses):
+                results[i]['degraded'] = getattr(response, 'degraded', False)
+                results[i]['matches'] = self._rank(vectors[i], response.matches, plans[i],
+                                                   queries[i].get('text'), filters[i])
+
+        if self.result_cache is not None and encoded:
+            # The misses shared one pass, so each is charged an equal part of it
+            seconds = (time.perf_counter() - started) / len(encoded)
+            for i in encoded:
+                if not results[i]['degraded']:
+                    self.result_cache.put(keys[i], generation, self._cacheable(results[i]['matches'], False))
+                self.result_cache.record(False, seconds)
+
+        print(f"🔍 Batch search: {len(texts)} text + {len(images)} image queries, "
+              f"{len(valid) - len(pending)} from the result cache")
+        return results
+
+    def served_degraded(self):
+        """True when this thread's last search_text / search_image came from a fallback replica"""
+        return getattr(self._search_state, 'degraded', False)
+
+    def _search_vector(self, vector, limit, nprobe=None, filter=None, include_metadata=True, include_values=False):
+        # Find similar items
+        search_params = {'nprobe': nprobe} if nprobe else {}
+        results = self.index.query(
+            vector=vector,
+            top_k=limit,
+            include_metadata=include_metadata,
+            include_values=include_values,
+            filter=filter,
+            **search_params
+        )
+        if getattr(results, 'degraded', False):
+            self._search_state.degraded = True
+        
+        # Show results
+        print(f"Found {len(results.matches)} results:")
+        for i, match in enumerate(results.matches, 1):
+            score = match.score
+            metadata = match.metadata
+            if not metadata:
+                print(f"{i}. {match.id} (score: {score:.3f})")
+            elif metadata.get('type') == 'image':
+                print(f"{i}. 📷 {metadata.get('name', 'Unknown')} (score: {score:.3f})")
+            else:
+                content = metadata.get('content', metadata.get('name', 'Unknown'))
+                print(f"{i}. 📝 {content[:50]}... (score: {score:.3f})")
+        
+        return results.matches
+
+    def _lexical_share(self, weight=None):
+        """Lexical share of the fused ranking for one request, 0 when hybrid search is off"""
+        if self.lexical is None or not len(self.lexical):
+            return 0.0
+        weight = self.lexical_weight if weight is None else float(weight)
+        return min(max(weight, 0.0), 1.0)
+
+    def _fuse(self, text, matches, limit, filter, weight, depth):
+        """Merge vector matches with the top depth BM25 hits for text into the top limit matches"""
+        lexical_hits = self.lexical.search(text, depth, filter=filter)
+        fused = fuse([(match.id, match.score) for match in matches], lexical_hits, weight, self.fusion)
+        print(f"🔀 Fused {len(matches)} vector + {len(lexical_hits)} lexical hits ({self.fusion}, weight {weight:g})")
+        return self._rescored(matches, fused[:limit])
+
+    @staticmethod
+    def _rescored(matches, ranking):
+        """Matches in the order of ranking [(id, score)], keeping metadata and values where known"""
+        by_id = {match.id: match for match in matches}
+        return [
+            Match(id=item_id, score=float(score),
+                  metadata=getattr(by_id.get(item_id), 'metadata', None),
+                  values=getattr(by_id.get(item_id), 'values', None))
+            for item_id, score in ranking
+        ]
+
+    def _plan(self, limit, weight, rerank_factor=None, mmr_lambda=None):
+        """
+        How deep one search goes: the over-fetch factor (RERANK_FACTOR, 1 = no re-ranking),
+        the MMR lambda (MMR_LAMBDA, unset = no diversification) and the lexical share
+        """
+        factor = int(rerank_factor if rerank_factor is not None else self.rerank_factor)
+        mmr_lambda = mmr_lambda if mmr_lambda is not None else self.mmr_lambda
+        mmr_lambda = None if mmr_lambda is None else min(max(float(mmr_lambda), 0.0), 1.0)
+        if mmr_lambda is not None and factor < 2:
+            # Diversifying needs a pool to choose from
+            factor = self.mmr_factor
+        factor = min(max(factor, 1), self.max_rerank_factor)
+        return {
+            'limit': limit,
+            'weight': weight,
+            'factor': factor,
+            'mmr_lambda': mmr_lambda,
+            'staged': factor > 1 or mmr_lambda is not None,
+            'depth': limit * max(factor, self.hybrid_depth if weight else 1),
+        }
+
+    def _rank(self, vector, matches, plan, text=None, filter=None):
+        """
+        Second stage over the over-fetched candidates: exact fp32 re-scoring,
+        lexical fusion for text queries, then MMR or a plain cut to the limit
+        """
+        limit = plan['limit']
+        pool = limit * plan['factor']
+        rerank_seconds = 0.0
+        if plan['staged'] and matches:
+            started = time.perf_counter()
+            scores = exact_scores(vector, self.index.candidate_vectors(matches))
+            order = np.argsort(-scores, kind='stable')
+            matches = self._rescored(matches, [(matches[i].id, scores[i]) for i in order])
+            rerank_seconds += time.perf_counter() - started
+        if plan['weight']:
+            matches = self._fuse(text, matches, pool if plan['mmr_lambda'] is not None else limit,
+                                 filter, plan['weight'], plan['depth'])
+        if plan['mmr_lambda'] is not None and len(matches) > 1:
+            started = time.perf_counter()
+            # Relevance is the exact (or fused) score; similarity is between candidate vectors
+            chosen = mmr([match.score for match in matches], self.index.candidate_vectors(matches),
+                         limit, plan['mmr_lambda'])
+            matches = [matches[i] for i in chosen]
+            rerank_seconds += time.perf_counter() - started
+        matches = matches[:limit]
+
+        if plan['staged']:
+            with self._rerank_lock:
+                self.rerank_searches += 1
+                self._rerank_seconds += rerank_seconds
+            print(f"🎯 Re-ranked {pool} candidates in {rerank_seconds * 1000:.2f}ms "
+                  f"(factor {plan['factor']}, mmr lambda {plan['mmr_lambda']})")
+        return matches
+
+    @staticmethod
+    def _search_failed(error):
+        print(f"❌ Search error: {error}")
+        import traceback
+        traceback.print_exc()
+        return []
 
 # Simple usage examples
 if __name__ == "__main__":
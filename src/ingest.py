@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Resumable bulk ingest of image catalogs.
+
+    python src/ingest.py --dir catalog/
+    python src/ingest.py --manifest catalog.csv     # columns: id, path, description
+    python src/ingest.py --manifest catalog.jsonl   # one {"id", "path", "description"} per line
+
+Pipeline (every hop is a bounded queue, so memory stays flat):
+
+    walk/manifest -> reader threads (read, hash, decode, preprocess)
+                  -> inference thread (batched MobileCLIP forward passes)
+                  -> upsert threads (chunked upserts)
+
+Progress is checkpointed as a watermark: every item before it has been stored.
+A killed run restarts from the watermark; the few items after it are simply upserted again.
+"""
+import os
+import io
+import csv
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+from PIL import Image
+
+from indexer import SimpleIndexer, get_memory_usage
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def walk_directory(root):
+    """Deterministic (sorted) walk so sequence numbers are stable across runs"""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(directory, name)
+                yield {'id': os.path.relpath(path, root), 'path': path, 'description': ''}
+
+
+def read_manifest(manifest):
+    """
+    Stream rows from a CSV or JSONL manifest; relative paths are resolved against its folder.
+    A malformed row is yielded with an 'error' instead of ending the stream, so it keeps its
+    sequence number and lands in the errors file like any other failed item.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline='', encoding='utf-8') as f:
+        jsonl = manifest.endswith('.jsonl')
+        rows = (line for line in f if line.strip()) if jsonl else csv.DictReader(f)
+        for number, row in enumerate(rows, 1):
+            try:
+                if jsonl:
+                    row = json.loads(row)
+                path = row['path']
+                if not isinstance(path, str) or not path:
+                    raise ValueError("'path' must be a non-empty string")
+                item = {'id': row.get('id') or path, 'path': path, 'description': row.get('description') or ''}
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield {'id': f"{manifest}:{number}", 'path': '',
+                       'error': f"Malformed manifest row {number}: {type(e).__name__}: {e}"}
+                continue
+            if not os.path.isabs(path):
+                item['path'] = os.path.join(base, path)
+            yield item
+
+
+def stack_pixels(pixels):
+    """Batch per-image pixels: numpy arrays for the ONNX engine, tensors for torch"""
+    if isinstance(pixels[0], np.ndarray):
+        return np.stack(pixels)
+    import torch
+    return torch.stack(pixels)
+
+
+class Checkpoint:
+    """Contiguous watermark of finished sequence numbers, written atomically"""
+    def __init__(self, path, source, restart=False):
+        self.path = path
+        self.source = source
+        self.watermark = 0
+        self._finished = set()
+        self._lock = threading.Lock()
+        self._last_write = 0
+
+        if os.path.exists(path) and not restart:
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('source') != source:
+                raise ValueError(f"Checkpoint {path} belongs to {saved.get('source')}, use --restart to start over")
+            self.watermark = saved['watermark']
+
+    def finish(self, sequences):
+        with self._lock:
+            self._finished.update(sequences)
+            while self.watermark in self._finished:
+                self._finished.remove(self.watermark)
+                self.watermark += 1
+            if time.monotonic() - self._last_write > 1.0:
+                self._write()
+
+    def _write(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'source': self.source, 'watermark': self.watermark}, f)
+        os.replace(temporary, self.path)
+        self._last_write = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._write()
+
+
+class StageMeter:
+    """Items processed and busy time for one pipeline stage"""
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def rate(self):
+        """Items/sec this stage could sustain with all its workers busy"""
+        with self._lock:
+            return self.items / self.busy * self.workers if self.busy else 0.0
+
+
+class IngestPipeline:
+    def __init__(self, indexer, checkpoint, batch_size=32, readers=4, upserters=4, queue_size=256, chunk_size=100):
+        self.indexer = indexer
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.readers = readers
+        self.upserters = upserters
+        self.chunk_size = chunk_size
+
+        self.work = queue.Queue(maxsize=queue_size)
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.chunks = queue.Queue(maxsize=max(2, upserters * 2))
+
+        self.meters = {
+            'read+decode': StageMeter('read+decode', readers),
+            'inference': StageMeter('inference', 1),
+            'upsert': StageMeter('upsert', upserters),
+        }
+        self.submitted = 0
+        self.stored = 0
+        self.cached = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._errors_path = checkpoint.path + '.errors.jsonl'
+
+    def _record_error(self, sequence, item, error):
+        with self._lock:
+            self.errors += 1
+            with open(self._errors_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'id': item['id'], 'path': item['path'], 'error': str(error)}) + '\n')
+        self.checkpoint.finish([sequence])
+
+    # ---- stages --------------------------------------------------------------
+
+    def _produce(self, items):
+        try:
+            for sequence, item in enumerate(items):
+                if sequence < self.checkpoint.watermark:
+                    continue
+                self.submitted += 1
+                if 'error' in item:
+                    self._record_error(sequence, item, item['error'])
+                    continue
+                self.work.put((sequence, item))
+        finally:
+            # Even if the source itself fails, the readers (and everything after them) must stop
+            for _ in range(self.readers):
+                self.work.put(None)
+
+    def _read(self):
+        _, preprocess, _ = self.indexer._get_model('image')
+        cache = self.indexer.image_cache
+        meter = self.meters['read+decode']
+        while True:
+            job = self.work.get()
+            if job is None:
+                self.decoded.put(None)
+                return
+            sequence, item = job
+            started = time.perf_counter()
+            try:
+                with open(item['path'], 'rb') as f:
+                    data = f.read()
+                key = cache.key(data) if cache else None
+                vector = cache.get(key) if key else None
+                pixels = None
+                if vector is None:
+                    if hasattr(preprocess, 'batch'):
+                        # FastPreprocess takes the raw bytes so JPEGs decode at reduced size
+                        pixels = preprocess(data)
+                    else:
+                        pixels = preprocess(Image.open(io.BytesIO(data)).convert('RGB'))
+                self.decoded.put((sequence, item, key, vector, pixels))
+            except Exception as e:
+                self._record_error(sequence, item, e)
+            meter.record(1, time.perf_counter() - started)
+
+    def _infer(self):
+        model, _, _ = self.indexer._get_model('image')
+        cache = self.indexer.image_cache
+        meter = self.meters['inference']
+        finished_readers = 0
+        pending = []
+        records = []
+
+        def run_batch():
+            if not pending:
+                return
+            batch = list(pending)
+            pending.clear()
+            started = time.perf_counter()
+            try:
+                vectors = self.indexer.clip.encode_pixels(stack_pixels([entry[4] for entry in batch]), model)
+            except Exception as e:
+                # The batch is lost, the pipeline is not
+                for sequence, item, _, _, _ in batch:
+                    self._record_error(sequence, item, e)
+                return
+            finally:
+                meter.record(len(batch), time.perf_counter() - started)
+            for (sequence, item, key, _, _), vector in zip(batch, vectors):
+                if key:
+                    try:
+                        cache.put(key, vector)
+                    except Exception as e:
+                        # A cache miss next run, not a lost item
+                        print(f"⚠️ Image cache write failed: {e}")
+                add_record(sequence, item, vector)
+
+        def add_record(sequence, item, vector):
+            records.append((sequence, {
+                "id": item['id'],
+                "values": vector,
+                "metadata": self.indexer._image_metadata(item['path'], item['description'])
+            }))
+            if len(records) >= self.chunk_size:
+                self.chunks.put(list(records))
+                records.clear()
+
+        try:
+            while finished_readers < self.readers:
+                try:
+                    entry = self.decoded.get(timeout=0.5)
+                except queue.Empty:
+                    # Don't sit on a partial batch while readers are slow
+                    run_batch()
+                    continue
+                if entry is None:
+                    finished_readers += 1
+                    continue
+                sequence, item, key, vector, pixels = entry
+                if vector is not None:
+                    self.cached += 1
+                    add_record(sequence, item, vector)
+                else:
+                    pending.append(entry)
+                    if len(pending) >= self.batch_size:
+                        run_batch()
+
+            run_batch()
+            if records:
+                self.chunks.put(list(records))
+        finally:
+            # Upserters always get their sentinels, so run() can finish even after a failure here
+            for _ in range(self.upserters):
+                self.chunks.put(None)
+
+    def _upsert(self):
+        meter = self.meters['upsert']
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            started = time.perf_counter()
+            try:
+                self.indexer.index.upsert([record for _, record in chunk])
+                # Serving workers sharing RESULT_CACHE_PATH stop serving results from before this chunk
+                self.indexer.invalidate_results()
+                with self._lock:
+                    self.stored += len(chunk)
+                self.checkpoint.finish([sequence for sequence, _ in chunk])
+            except Exception as e:
+                for sequence, record in chunk:
+                    self._record_error(sequence, {'id': record['id'], 'path': record['metadata']['path']}, e)
+            meter.record(len(chunk), time.perf_counter() - started)
+
+    # ---- driver --------------------------------------------------------------
+
+    def _report(self, started):
+        elapsed = time.perf_counter() - started
+        stages = ' | '.join(f"{name}: {meter.rate():.1f}/s" for name, meter in self.meters.items())
+        print(f"📈 {self.stored + self.errors}/{self.submitted} done ({(self.stored + self.errors) / elapsed:.1f} items/s) "
+              f"| {stages} | queues {self.work.qsize()}/{self.decoded.qsize()}/{self.chunks.qsize()} "
+              f"| cached {self.cached} | errors {self.errors} | Memory: {get_memory_usage()}")
+
+    def run(self, items, report_every=10.0):
+        # Load the model once, before any worker asks for it
+        self.indexer._get_model('image')
+        started = time.perf_counter()
+
+        threads = [threading.Thread(target=self._produce, args=(items,), name='ingest-producer')]
+        threads += [threading.Thread(target=self._read, name=f'ingest-reader-{i}') for i in range(self.readers)]
+        threads += [threading.Thread(target=self._infer, name='ingest-inference')]
+        threads += [threading.Thread(target=self._upsert, name=f'ingest-upsert-{i}') for i in range(self.upserters)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        last_report = time.perf_counter()
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.2)
+            if time.perf_counter() - last_report >= report_every:
+                self._report(started)
+                last_report = time.perf_counter()
+
+        self.checkpoint.close()
+        self._report(started)
+        print(f"✅ Ingest finished: {self.stored} stored, {self.errors} errors, watermark {self.checkpoint.watermark}")
+        if self.errors:
+            print(f"⚠️ Failed items logged to {self._errors_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable bulk image ingest')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help='Directory tree of images (ids are paths relative to it)')
+    source.add_argument('--manifest', help='CSV or JSONL manifest with id, path, description')
+    parser.add_argument('--checkpoint', default='data/ingest.checkpoint.json')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--upserters', type=int, default=4)
+    parser.add_argument('--queue-size', type=int, default=256)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--report-every', type=float, default=10.0, help='Seconds between progress lines')
+    args = parser.parse_args()
+
+    source_name = os.path.abspath(args.dir or args.manifest)
+    os.makedirs(os.path.dirname(args.checkpoint) or '.', exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint, source_name, restart=args.restart)
+    if checkpoint.watermark:
+        print(f"🔄 Resuming after {checkpoint.watermark} items")
+
+    items = walk_directory(args.dir) if args.dir else read_manifest(args.manifest)
+    pipeline = IngestPipeline(
+        # Ingest only embeds images, so the text tower is never loaded (nor the search-only lexical index)
+        SimpleIndexer(towers=('image',), lexical=False),
+        checkpoint,
+        batch_size=args.batch_size,
+        readers=args.readers,
+        upserters=args.upserters,
+        queue_size=args.queue_size,
+        chunk_size=args.chunk_size
+    )
+    pipeline.run(items, report_every=args.report_every)
+    return 0 if pipeline.errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+In-process BM25 over item metadata, fused with vector search results.
+
+MobileCLIP embeds meaning, not spelling, so SKU-like terms and brand names
+("IKEA Poäng", "walnut 180cm") rank poorly on similarity alone. BM25Index
+scores the metadata text fields lexically, and fuse() merges its ranking
+with the vector ranking by reciprocal rank or by normalized score.
+"""
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter
+import numpy as np
+
+from metadata_filter import matches_filter
+
+# Metadata fields indexed by default (image descriptions, text content and categories)
+FIELDS = ('description', 'content', 'category')
+FUSIONS = ('rrf', 'weighted')
+
+_WORD = re.compile(r'[^\W_]+')
+_PARTS = re.compile(r'\d+|[^\W\d_]+')
+
+
+def tokenize(text):
+    """
+    Lowercased, accent-folded word tokens; mixed words also yield their digit and
+    letter runs, so "180cm" matches "180 cm" and "Poäng" matches "poang"
+    """
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word)
+        parts = _PARTS.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class _Postings:
+    """Growable doc-number / term-frequency arrays for one term"""
+    def __init__(self, capacity=4):
+        self.docs = np.zeros(capacity, dtype=np.int32)
+        self.freqs = np.zeros(capacity, dtype=np.uint16)
+        self.size = 0
+
+    def append(self, doc, freq):
+        if self.size == len(self.docs):
+            self.docs = np.concatenate([self.docs, np.zeros(self.size, dtype=np.int32)])
+            self.freqs = np.concatenate([self.freqs, np.zeros(self.size, dtype=np.uint16)])
+        self.docs[self.size] = doc
+        self.freqs[self.size] = min(freq, np.iinfo(np.uint16).max)
+        self.size += 1
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the text of a few metadata fields, updated one item at a time.
+
+    Every document gets a sequential number; postings are append-only arrays of
+    (doc, tf). Replacing or removing an item only marks its old number dead, and
+    the postings are rewritten without dead documents once those outnumber the
+    live ones. A query touches only the postings of its own terms.
+    """
+    def __init__(self, fields=FIELDS, k1=1.2, b=0.75):
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self.b = b
+        self._terms = {}
+        self._ids = []
+        self._metadata = []
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._live = np.zeros(1024, dtype=bool)
+        self._doc_of = {}
+        self._total_length = 0.0
+        self._lock = threading.RLock()
+
+        self.searches = 0
+        self._search_seconds = 0.0
+
+    def __len__(self):
+        return len(self._doc_of)
+
+    def _text(self, metadata):
+        return ' '.join(str(metadata[field]) for field in self.fields if metadata.get(field))
+
+    def add(self, item_id, metadata):
+        """Index (or re-index) one item from its metadata"""
+        terms = Counter(tokenize(self._text(metadata or {})))
+        with self._lock:
+            self._remove(item_id)
+            doc = len(self._ids)
+            if doc == len(self._lengths):
+                self._lengths = np.concatenate([self._lengths, np.zeros(doc, dtype=np.float32)])
+                self._live = np.concatenate([self._live, np.zeros(doc, dtype=bool)])
+            self._ids.append(item_id)
+            self._metadata.append(metadata or {})
+            self._doc_of[item_id] = doc
+            self._live[doc] = True
+            length = sum(terms.values())
+            self._lengths[doc] = length
+            self._total_length += length
+            for term, freq in terms.items():
+                postings = self._terms.get(term)
+                if postings is None:
+                    postings = self._terms[term] = _Postings()
+                postings.append(doc, freq)
+
+    def add_many(self, items):
+        """Index (id, metadata) pairs"""
+        for item_id, metadata in items:
+            self.add(item_id, metadata)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        doc = self._doc_of.pop(item_id, None)
+        if doc is None:
+            return
+        self._live[doc] = False
+        self._total_length -= float(self._lengths[doc])
+        self._metadata[doc] = None
+        dead = len(self._ids) - len(self._doc_of)
+        if dead > max(1024, len(self._doc_of)):
+            self._compact()
+
+    def _compact(self):
+        """Renumber the live documents and drop dead ones from every posting list"""
+        count = len(self._ids)
+        live = self._live[:count]
+        renumber = np.cumsum(live, dtype=np.int32) - 1
+        for term in list(self._terms):
+            postings = self._terms[term]
+            keep = live[postings.docs[:postings.size]]
+            if not keep.any():
+                del self._terms[term]
+                continue
+            postings.docs = renumber[postings.docs[:postings.size][keep]].astype(np.int32)
+            postings.freqs = postings.freqs[:postings.size][keep]
+            postings.size = len(postings.docs)
+
+        survivors = np.flatnonzero(live)
+        self._ids = [self._ids[doc] for doc in survivors]
+        self._metadata = [self._metadata[doc] for doc in survivors]
+        capacity = max(1024, len(survivors) * 2)
+        lengths = np.zeros(capacity, dtype=np.float32)
+        lengths[:len(survivors)] = self._lengths[survivors]
+        self._lengths = lengths
+        self._live = np.zeros(capacity, dtype=bool)
+        self._live[:len(survivors)] = True
+        self._doc_of = {item_id: doc for doc, item_id in enumerate(self._ids)}
+
+    def search(self, text, k=10, filter=None):
+        """[(id, score), ...] for the k best BM25 matches of text, best first"""
+        started = time.perf_counter()
+        terms = set(tokenize(text))
+        with self._lock:
+            live_docs = len(self._doc_of)
+            results = []
+            if terms and live_docs and k > 0:
+                count = len(self._ids)
+                live = self._live[:count]
+                average_length = max(self._total_length / live_docs, 1e-6)
+                scores = np.zeros(count, dtype=np.float32)
+                for term in terms:
+                    postings = self._terms.get(term)
+                    if postings is None:
+                        continue
+                    docs = postings.docs[:postings.size]
+                    frequency = live[docs].sum()
+                    if not frequency:
+                        continue
+                    idf = math.log(1 + (live_docs - frequency + 0.5) / (frequency + 0.5))
+                    tf = postings.freqs[:postings.size].astype(np.float32)
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[docs] / average_length)
+                    # A term occurs once per document in its postings, so plain fancy-index += is safe
+                    scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+                scores[~live] = 0
+
+                candidates = np.flatnonzero(scores > 0)
+                if filter:
+                    # Walk the hits best first and keep the first k that pass
+                    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+                    for doc in order:
+                        if matches_filter(self._metadata[doc], filter):
+                            results.append((self._ids[doc], float(scores[doc])))
+                            if len(results) == k:
+                                break
+                else:
+                    if len(candidates) > k:
+                        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+                    results = [(self._ids[doc], float(scores[doc])) for doc in candidates]
+
+            self.searches += 1
+            self._search_seconds += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self._doc_of),
+                'terms': len(self._terms),
+                'postings': sum(postings.size for postings in self._terms.values()),
+                'searches': self.searches,
+                'avg_search_ms': round(self._search_seconds / self.searches * 1000, 3) if self.searches else 0.0
+            }
+
+
+def fuse(vector_hits, lexical_hits, weight, method='rrf', rrf_k=60):
+    """
+    Merge two rankings of (id, score) into [(id, fused score), ...], best first.
+    weight is the lexical share (0 keeps the vector ranking, 1 the lexical one).
+    rrf sums weight / (rrf_k + rank); weighted min-max normalizes each list's
+    scores and sums them with the same weights.
+    """
+    if method not in FUSIONS:
+        raise ValueError(f"Unknown fusion '{method}', expected one of {FUSIONS}")
+    fused = {}
+    for hits, share in ((vector_hits, 1.0 - weight), (lexical_hits, weight)):
+        if not hits or share <= 0:
+            continue
+        if method == 'rrf':
+            for rank, (item_id, _) in enumerate(hits, 1):
+                fused[item_id] = fused.get(item_id, 0.0) + share / (rrf_k + rank)
+        else:
+            scores = [score for _, score in hits]
+            low, span = min(scores), max(scores) - min(scores)
+            for item_id, score in hits:
+                normalized = (score - low) / span if span > 0 else 1.0
+                fused[item_id] = fused.get(item_id, 0.0) + share * normalized
+    return sorted(fused.items(), key=lambda item: -item[1])
@@ -0,0 +1,368 @@
+"""
+Metadata filters in Pinecone's filter language, for every vector store backend.
+
+    {"type": "image"}                                   equality shorthand
+    {"category": {"$in": ["sofa", "chair"]}}            $eq $ne $in $nin
+    {"price": {"$gte": 100, "$lt": 500}}                $gt $gte $lt $lte (numbers only)
+    {"$or": [{"type": "text"}, {"category": "lamp"}]}   $and / $or of sub-filters
+
+Top-level conditions are ANDed. A list metadata value matches an equality
+condition when any element does; range conditions only match single numbers.
+$ne / $nin also match records that lack the field.
+
+Pinecone evaluates filters server side; local stores keep a FilterIndex of
+per-field inverted bitmaps (for the FILTER_FIELDS fields) so a filtered query
+only scores matching rows.
+"""
+import os
+import json
+import numpy as np
+
+EQUALITY_OPS = ('$eq', '$ne', '$in', '$nin')
+RANGE_OPS = ('$gt', '$gte', '$lt', '$lte')
+LOGICAL_OPS = ('$and', '$or')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_scalar(value):
+    return isinstance(value, (str, bool, int, float))
+
+
+def _key(value):
+    """Bitmap key - keeps True, 1 and '1' apart"""
+    if isinstance(value, bool):
+        return ('b', value)
+    if _is_number(value):
+        return ('n', float(value))
+    return ('s', value)
+
+
+def parse_filter(filter):
+    """
+    Validate a filter and expand equality shorthands; None or {} means no filter.
+    Raises ValueError describing the first problem.
+    """
+    if not filter:
+        return None
+    if not isinstance(filter, dict):
+        raise ValueError("Filter must be an object")
+
+    parsed = {}
+    for field, condition in filter.items():
+        if field in LOGICAL_OPS:
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{field} expects a non-empty list of filters")
+            parsed[field] = [parse_filter(sub) or {} for sub in condition]
+            continue
+        if field.startswith('$'):
+            raise ValueError(f"Unknown filter operator '{field}'")
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        if not condition:
+            raise ValueError(f"Empty condition for '{field}'")
+
+        for op, value in condition.items():
+            if op in ('$eq', '$ne'):
+                if not _is_scalar(value):
+                    raise ValueError(f"{op} on '{field}' expects a string, number or boolean")
+            elif op in ('$in', '$nin'):
+                if not isinstance(value, list) or not all(_is_scalar(item) for item in value):
+                    raise ValueError(f"{op} on '{field}' expects a list of strings, numbers or booleans")
+            elif op in RANGE_OPS:
+                if not _is_number(value):
+                    raise ValueError(f"{op} on '{field}' expects a number")
+            else:
+                raise ValueError(f"Unknown filter operator '{op}' on '{field}'")
+        parsed[field] = dict(condition)
+    return parsed
+
+
+def filter_key(filter):
+    """Stable string for grouping or caching identical filters"""
+    return json.dumps(filter, sort_keys=True, separators=(',', ':')) if filter else ''
+
+
+def _values(metadata, field):
+    value = (metadata or {}).get(field)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def matches_filter(metadata, filter):
+    """Evaluate a parsed filter against one metadata dict"""
+    if not filter:
+        return True
+    for field, condition in filter.items():
+        if field == '$and':
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if field == '$or':
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        keys = {_key(item) for item in _values(metadata, field) if _is_scalar(item)}
+        # Range conditions compare single numbers, never list elements
+        stored = (metadata or {}).get(field)
+        numbers = [stored] if _is_number(stored) else []
+        for op, value in condition.items():
+            if op == '$eq':
+                ok = _key(value) in keys
+            elif op == '$ne':
+                ok = _key(value) not in keys
+            elif op == '$in':
+                ok = any(_key(item) in keys for item in value)
+            elif op == '$nin':
+                ok = not any(_key(item) in keys for item in value)
+            elif op == '$gt':
+                ok = any(number > value for number in numbers)
+            elif op == '$gte':
+                ok = any(number >= value for number in numbers)
+            elif op == '$lt':
+                ok = any(number < value for number in numbers)
+            else:
+                ok = any(number <= value for number in numbers)
+            if not ok:
+                return False
+    return True
+
+
+def indexed_fields():
+    """FILTER_FIELDS: comma-separated metadata fields that get bitmaps ('*' for all)"""
+    value = os.environ.get('FILTER_FIELDS', 'type,category').strip()
+    if value == '*':
+        return None
+    return {field.strip() for field in value.split(',') if field.strip()}
+
+
+class FilterIndex:
+    """
+    Per-field inverted bitmaps over the rows of a local store.
+
+    Only the fields in FILTER_FIELDS are indexed, since free-text fields such
+    as names, paths and descriptions would cost a posting per row. A value's
+    posting is a row set while rare and a boolean bitmap once it covers more
+    than 1/64 of the capacity; a field that grows past max_values distinct
+    values (FILTER_MAX_VALUES) drops its postings. Single numeric values of
+    indexed fields also land in a per-field float column (NaN when absent)
+    for range conditions. Each row's single value is remembered as an int32
+    code per field, so clearing a row needs neither its metadata nor a
+    per-row Python list (only list values keep one).
+
+    mask() combines them with vectorized and/or/not. Conditions it cannot
+    answer count as true, so the mask is a superset of the matches; when
+    exact() is False the store checks the masked rows with matches_filter.
+    """
+    def __init__(self, capacity=1024, fields=None, max_values=None):
+        self.capacity = max(1, capacity)
+        # fields: names to index, '*' for all, None for FILTER_FIELDS; self.fields is None when all are indexed
+        if fields is None:
+            fields = indexed_fields()
+        self.fields = None if fields in (None, '*') else set(fields)
+        self.max_values = max_values or int(os.environ.get('FILTER_MAX_VALUES', 1024))
+        self._postings = {}
+        self._numbers = {}
+        self._overflowed = set()
+        # field -> int32 value code per row (-1: none), plus the code <-> key tables
+        self._codes = {}
+        self._code_of = {}
+        self._key_of = {}
+        # row -> [(field, key)] for list values
+        self._lists = {}
+
+    def _indexed(self, field):
+        return self.fields is None or field in self.fields
+
+    def _posted(self, field):
+        return self._indexed(field) and field not in self._overflowed
+
+    def grow(self, capacity):
+        if capacity <= self.capacity:
+            return
+        for values in self._postings.values():
+            for key, posting in values.items():
+                if isinstance(posting, np.ndarray):
+                    grown = np.zeros(capacity, dtype=bool)
+                    grown[:self.capacity] = posting
+                    values[key] = grown
+        for field, column in self._numbers.items():
+            grown = np.full(capacity, np.nan)
+            grown[:self.capacity] = column
+            self._numbers[field] = grown
+        for field, column in self._codes.items():
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[:self.capacity] = column
+            self._codes[field] = grown
+        self.capacity = capacity
+
+    def _code(self, field, key):
+        codes = self._code_of.setdefault(field, {})
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(codes)
+            self._key_of.setdefault(field, []).append(key)
+        return code
+
+    def _set(self, field, key, row):
+        values = self._postings.setdefault(field, {})
+        posting = values.get(key)
+        if posting is None:
+            if len(values) >= self.max_values:
+                self._overflow(field)
+                return
+            posting = values[key] = set()
+        if isinstance(posting, set):
+            posting.add(row)
+            if len(posting) > max(64, self.capacity // 64):
+                bitmap = np.zeros(self.capacity, dtype=bool)
+                bitmap[list(posting)] = True
+                values[key] = bitmap
+        else:
+            posting[row] = True
+
+    def _overflow(self, field):
+        """Too many distinct values to be worth bitmaps - filter this field by scanning instead"""
+        self._overflowed.add(field)
+        for table in (self._postings, self._codes, self._code_of, self._key_of):
+            table.pop(field, None)
+        for row in list(self._lists):
+            entries = [entry for entry in self._lists[row] if entry[0] != field]
+            if entries:
+                self._lists[row] = entries
+            else:
+                del self._lists[row]
+        print(f"⚠️ Filter field '{field}' has over {self.max_values} values; filters on it scan the candidate rows")
+
+    def _clear(self, field, key, row):
+        values = self._postings.get(field)
+        posting = values.get(key) if values else None
+        if posting is None:
+            return
+        if isinstance(posting, set):
+            posting.discard(row)
+            if not posting:
+                # Forget values no row has anymore, e.g. retired ids or categories
+                del values[key]
+        else:
+            posting[row] = False
+
+    def add(self, row, metadata):
+        self.remove(row)
+        for field, value in (metadata or {}).items():
+            if not self._indexed(field):
+                continue
+            if field not in self._overflowed:
+                keys = {_key(item) for item in (value if isinstance(value, list) else [value]) if _is_scalar(item)}
+                for key in keys:
+                    self._set(field, key, row)
+                if keys and field not in self._overflowed:
+                    if isinstance(value, list):
+                        self._lists.setdefault(row, []).extend((field, key) for key in keys)
+                    else:
+                        column = self._codes.get(field)
+                        if column is None:
+                            column = self._codes[field] = np.full(self.capacity, -1, dtype=np.int32)
+                        column[row] = self._code(field, _key(value))
+            if _is_number(value):
+                column = self._numbers.get(field)
+                if column is None:
+                    column = self._numbers[field] = np.full(self.capacity, np.nan)
+                column[row] = value
+
+    def _entries(self, row):
+        """(field, key) pairs posted for row"""
+        entries = [(field, self._key_of[field][column[row]]) for field, column in self._codes.items() if column[row] >= 0]
+        return entries + self._lists.get(row, [])
+
+    def remove(self, row):
+        for field, key in self._entries(row):
+            self._clear(field, key, row)
+        for column in self._codes.values():
+            column[row] = -1
+        self._lists.pop(row, None)
+        for column in self._numbers.values():
+            column[row] = np.nan
+
+    def move(self, source, target):
+        """Re-point source's entries at target (LocalStore fills holes with its last row)"""
+        self.remove(target)
+        for field, key in self._entries(source):
+            self._clear(field, key, source)
+            self._set(field, key, target)
+        for columns, empty in ((self._codes, -1), (self._numbers, np.nan)):
+            for column in columns.values():
+                column[target], column[source] = column[source], empty
+        entries = self._lists.pop(source, None)
+        if entries:
+            self._lists[target] = entries
+
+    def _rows(self, field, key, count):
+        posting = self._postings.get(field, {}).get(key)
+        if posting is None:
+            return None
+        if isinstance(posting, np.ndarray):
+            return posting[:count]
+        rows = np.fromiter(posting, dtype=np.int64, count=len(posting))
+        hit = np.zeros(count, dtype=bool)
+        hit[rows[rows < count]] = True
+        return hit
+
+    def exact(self, filter):
+        """True when mask(filter) is exactly the matching rows, not a superset"""
+        for field, condition in filter.items():
+            if field in LOGICAL_OPS:
+                if not all(self.exact(sub) for sub in condition):
+                    return False
+                continue
+            for op in condition:
+                if not (self._indexed(field) if op in RANGE_OPS else self._posted(field)):
+                    return False
+        return True
+
+    def mask(self, filter, count):
+        """Boolean mask over the first count rows; a superset of the matches unless exact(filter)"""
+        mask = np.ones(count, dtype=bool)
+        for field, condition in filter.items():
+            if field == '$and':
+                for sub in condition:
+                    mask &= self.mask(sub, count)
+                continue
+            if field == '$or':
+                either = np.zeros(count, dtype=bool)
+                for sub in condition:
+                    either |= self.mask(sub, count)
+                mask &= either
+                continue
+
+            column = self._numbers.get(field)
+            for op, value in condition.items():
+                if op in EQUALITY_OPS:
+                    if not self._posted(field):
+                        continue
+                    hit = np.zeros(count, dtype=bool)
+                    for item in (value if op in ('$in', '$nin') else [value]):
+                        rows = self._rows(field, _key(item), count)
+                        if rows is not None:
+                            hit |= rows
+                    mask &= hit if op in ('$eq', '$in') else ~hit
+                elif not self._indexed(field):
+                    continue
+                elif column is None:
+                    mask[:] = False
+                else:
+                    numbers = column[:count]
+                    with np.errstate(invalid='ignore'):
+                        if op == '$gt':
+                            mask &= numbers > value
+                        elif op == '$gte':
+                            mask &= numbers >= value
+                        elif op == '$lt':
+                            mask &= numbers < value
+                        else:
+                            mask &= numbers <= value
+        return mask
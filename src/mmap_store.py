@@ -0,0 +1,421 @@
+import os
+import json
+import struct
+import sqlite3
+import threading
+import numpy as np
+
+from vector_store import VectorStore, Match, QueryResponse, FetchResponse
+from metadata_filter import FilterIndex, matches_filter, parse_filter
+
+_UPSERT = 1
+_DELETE = 2
+# op, id length, metadata length
+_HEADER = struct.Struct('<BHI')
+
+
+class MmapStore(VectorStore):
+    """
+    Persistent vector store for small-RAM hosts.
+
+    - vectors.f32: fixed-stride np.memmap of unit vectors, one row per item
+    - live.u8: one byte per row, 0 for free/deleted rows
+    - ids.sqlite: id <-> row mapping plus metadata, free row list
+    - append.log: every write lands here first and in a small in-memory delta;
+      a background thread folds the delta into the mapped files and truncates the log
+
+    Cold start maps the files and replays whatever is left in the log; the
+    metadata filter bitmaps are read from ids.sqlite on the first filtered query.
+    Search scans the mapping in chunks, so resident memory stays bounded by the
+    chunk size and the delta rather than the catalog size.
+
+    The store is single-writer. read_only=True opens a snapshot of an existing
+    store for other processes: no log, no compactor, writes raise.
+    """
+    name = 'mmap'
+
+    def __init__(self, path='data/vectors', dim=512, compact_threshold=4096, compact_interval=30.0,
+                 chunk_rows=65536, fsync=False, read_only=False):
+        self.read_only = read_only
+        if read_only and not os.path.exists(os.path.join(path, 'ids.sqlite')):
+            raise FileNotFoundError(f"No mmap store at {path} to open read-only")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.chunk_rows = chunk_rows
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, 'vectors.f32')
+        self._live_path = os.path.join(path, 'live.u8')
+        self._log_path = os.path.join(path, 'append.log')
+
+        if read_only:
+            self._db = sqlite3.connect(f"file:{os.path.join(path, 'ids.sqlite')}?mode=ro", uri=True,
+                                       check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(os.path.join(path, 'ids.sqlite'), check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, metadata TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value INTEGER)')
+            self._db.commit()
+
+        found = self._db.execute("SELECT value FROM settings WHERE key = 'rows'").fetchone()
+        self._rows = found[0] if found else 0
+        existing = os.path.getsize(self._vectors_path) // (dim * 4) if os.path.exists(self._vectors_path) else 0
+        if read_only and existing == 0:
+            raise ValueError(f"mmap store at {path} has no compacted rows to open read-only")
+        # Filter bitmaps over the mapped rows, built on the first filtered query so
+        # opening the store never reads every row's metadata; the delta is filtered directly
+        self._filter_index = None
+        self._map_files(existing if read_only else max(existing, self._rows, 1024))
+
+        # id -> (vector or None for delete, metadata, base row or None)
+        self._delta = {}
+        self._shadowed = set()
+        self._replay_log()
+
+        self._wake = threading.Event()
+        self._closed = False
+        if not read_only:
+            self._log = open(self._log_path, 'ab')
+            self._compactor = threading.Thread(target=self._compact_loop, name='mmap-compactor', daemon=True)
+            self._compactor.start()
+        print(f"✅ Mapped {self.count()} vectors from {path}")
+
+    # ---- files -------------------------------------------------------------
+
+    def _map_files(self, capacity):
+        mode = 'r' if self.read_only else 'r+'
+        for file_path, row_bytes in ((self._vectors_path, self.dim * 4), (self._live_path, 1)):
+            if self.read_only:
+                continue
+            with open(file_path, 'ab'):
+                pass
+            if os.path.getsize(file_path) < capacity * row_bytes:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(capacity * row_bytes)
+
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+        self._live = np.memmap(self._live_path, dtype=np.uint8, mode=mode, shape=(capacity,))
+        self._capacity = capacity
+        if self._filter_index is not None:
+            self._filter_index.grow(capacity)
+
+    def _allocate_row(self):
+        free = self._db.execute('SELECT row FROM free_rows LIMIT 1').fetchone()
+        if free:
+            self._db.execute('DELETE FROM free_rows WHERE row = ?', free)
+            return free[0]
+
+        row = self._rows
+        self._rows += 1
+        if self._rows > self._capacity:
+            self._vectors.flush()
+            self._live.flush()
+            self._map_files(self._capacity * 2)
+        return row
+
+    # ---- append log --------------------------------------------------------
+
+    def _encode(self, op, item_id, metadata=None, vector=None):
+        id_bytes = item_id.encode('utf-8')
+        meta_bytes = json.dumps(metadata or {}).encode('utf-8') if op == _UPSERT else b''
+        record = _HEADER.pack(op, len(id_bytes), len(meta_bytes)) + id_bytes + meta_bytes
+        if op == _UPSERT:
+            record += vector.astype(np.float32).tobytes()
+        return record
+
+    def _replay_log(self):
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        replayed = 0
+        while offset + _HEADER.size <= len(data):
+            op, id_length, meta_length = _HEADER.unpack_from(data, offset)
+            end = offset + _HEADER.size + id_length + meta_length + (self.dim * 4 if op == _UPSERT else 0)
+            if end > len(data):
+                break
+            cursor = offset + _HEADER.size
+            item_id = data[cursor:cursor + id_length].decode('utf-8')
+            cursor += id_length
+            if op == _UPSERT:
+                metadata = json.loads(data[cursor:cursor + meta_length].decode('utf-8'))
+                cursor += meta_length
+                vector = np.frombuffer(data, dtype=np.float32, count=self.dim, offset=cursor).copy()
+                self._apply(item_id, vector, metadata)
+            else:
+                self._apply(item_id, None, None)
+            offset = end
+            replayed += 1
+
+        # Drop a torn record left by a crash mid-write (the writer's to do when read-only)
+        if offset < len(data) and not self.read_only:
+            with open(self._log_path, 'r+b') as f:
+                f.truncate(offset)
+        if replayed:
+            print(f"🔄 Replayed {replayed} log records")
+
+    def _write_log(self, records):
+        self._log.write(b''.join(records))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    # ---- delta -------------------------------------------------------------
+
+    def _base_row(self, item_id):
+        found = self._db.execute('SELECT row FROM items WHERE id = ?', (item_id,)).fetchone()
+        return found[0] if found else None
+
+    def _apply(self, item_id, vector, metadata):
+        pending = self._delta.get(item_id)
+        base_row = pending[2] if pending else self._base_row(item_id)
+        if base_row is not None:
+            self._shadowed.add(base_row)
+        self._delta[item_id] = (vector, metadata, base_row)
+
+    # ---- compaction --------------------------------------------------------
+
+    def compact(self):
+        """Fold the delta into the mapped files and truncate the log"""
+        with self._lock:
+            if not self._delta or self.read_only:
+                return
+            for item_id, (vector, metadata, base_row) in self._delta.items():
+                if vector is None:
+                    if base_row is not None:
+                        self._live[base_row] = 0
+                        if self._filter_index is not None:
+                            self._filter_index.remove(base_row)
+                        self._db.execute('DELETE FROM items WHERE id = ?', (item_id,))
+                        self._db.execute('INSERT OR IGNORE INTO free_rows (row) VALUES (?)', (base_row,))
+                    continue
+
+                row = base_row
+                if row is None:
+                    row = self._allocate_row()
+                    self._db.execute('INSERT INTO items (id, row, metadata) VALUES (?, ?, ?)',
+                                     (item_id, row, json.dumps(metadata)))
+                else:
+                    self._db.execute('UPDATE items SET metadata = ? WHERE id = ?', (json.dumps(metadata), item_id))
+                self._vectors[row] = vector
+                self._live[row] = 1
+                if self._filter_index is not None:
+                    self._filter_index.add(row, metadata)
+
+            # Data first, then the mapping, then drop the log - replay is idempotent
+            self._vectors.flush()
+            self._live.flush()
+            self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('rows', ?)", (self._rows,))
+            self._db.commit()
+            self._log.close()
+            self._log = open(self._log_path, 'wb')
+
+            compacted = len(self._delta)
+            self._delta.clear()
+            self._shadowed.clear()
+        print(f"🗜️ Compacted {compacted} writes into {self.path}")
+
+    def _compact_loop(self):
+        while not self._closed:
+            self._wake.wait(self.compact_interval)
+            self._wake.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"❌ Compaction error: {e}")
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.compact()
+        with self._lock:
+            if not self.read_only:
+                self._log.close()
+            self._db.close()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"mmap store at {self.path} is open read-only")
+
+    # ---- VectorStore -------------------------------------------------------
+
+    def upsert(self, vectors):
+        self._check_writable()
+        records = []
+        prepared = []
+        for record in vectors:
+            vector = np.asarray(record["values"], dtype=np.float32).reshape(-1)
+            if vector.shape[0] != self.dim:
+                raise ValueError(f"Vector for {record['id']} has dimension {vector.shape[0]}, expected {self.dim}")
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm > 0 else vector
+            metadata = record.get("metadata") or {}
+            prepared.append((record["id"], vector, metadata))
+            records.append(self._encode(_UPSERT, record["id"], metadata, vector))
+
+        with self._lock:
+            self._write_log(records)
+            for item_id, vector, metadata in prepared:
+                self._apply(item_id, vector, metadata)
+            pending = len(self._delta)
+
+        if pending >= self.compact_threshold * 4:
+            # Compactor is falling behind - apply backpressure
+            self.compact()
+        elif pending >= self.compact_threshold:
+            self._wake.set()
+        return {"upserted_count": len(prepared)}
+
+    def delete(self, ids):
+        self._check_writable()
+        with self._lock:
+            self._write_log([self._encode(_DELETE, item_id) for item_id in ids])
+            for item_id in ids:
+                self._apply(item_id, None, None)
+        return {}
+
+    def _base_candidates(self, query, top_k, filter=None):
+        """Top rows of the mapped file, excluding dead and shadowed rows"""
+        rows = self._rows
+        if rows == 0:
+            return []
+        if filter:
+            return self._filtered_candidates(query, top_k, filter)
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, self.chunk_rows):
+            end = min(start + self.chunk_rows, rows)
+            # Zero-copy slice of the mapping
+            scores[start:end] = self._vectors[start:end] @ query
+        scores[self._live[:rows] == 0] = -np.inf
+        if self._shadowed:
+            scores[list(self._shadowed)] = -np.inf
+
+        k = min(top_k, rows)
+        top = np.argpartition(-scores, k - 1)[:k] if k < rows else np.arange(rows)
+        return [(float(scores[row]), int(row)) for row in top if np.isfinite(scores[row])]
+
+    def _filter_bitmaps(self):
+        """The FilterIndex over the mapped rows, read from the id table on first use"""
+        if self._filter_index is None:
+            index = FilterIndex(self._capacity)
+            for row, metadata in self._db.execute('SELECT row, metadata FROM items'):
+                index.add(row, json.loads(metadata))
+            self._filter_index = index
+            print(f"🧮 Built filter bitmaps for {self.path}")
+        return self._filter_index
+
+    def _filtered_candidates(self, query, top_k, filter):
+        """Like _base_candidates, but only reads the rows the filter bitmaps allow"""
+        index = self._filter_bitmaps()
+        mask = index.mask(filter, self._rows) & (self._live[:self._rows] != 0)
+        if not index.exact(filter):
+            # Fields without bitmaps: stream the id table and check the candidates' metadata
+            exact = np.zeros_like(mask)
+            for row, metadata in self._db.execute('SELECT row, metadata FROM items'):
+                if row < len(mask) and mask[row] and matches_filter(json.loads(metadata), filter):
+                    exact[row] = True
+            mask = exact
+        if self._shadowed:
+            mask[list(self._shadowed)] = False
+        allowed = np.flatnonzero(mask)
+        if len(allowed) == 0:
+            return []
+        scores = np.empty(len(allowed), dtype=np.float32)
+        for start in range(0, len(allowed), self.chunk_rows):
+            end = min(start + self.chunk_rows, len(allowed))
+            scores[start:end] = self._vectors[allowed[start:end]] @ query
+
+        k = min(top_k, len(allowed))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(allowed) else np.arange(len(allowed))
+        return [(float(scores[position]), int(allowed[position])) for position in top]
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        filter = parse_filter(filter)
+        if top_k <= 0:
+            return QueryResponse([])
+
+        with self._lock:
+            base = self._base_candidates(query, top_k, filter)
+            by_row = {}
+            if base:
+                placeholders = ','.join('?' * len(base))
+                for item_id, row, metadata in self._db.execute(
+                        f'SELECT id, row, metadata FROM items WHERE row IN ({placeholders})',
+                        [row for _, row in base]):
+                    by_row[row] = (item_id, metadata)
+
+            candidates = []
+            for score, row in base:
+                # Rows written by an interrupted compaction have no id yet
+                if row in by_row:
+                    item_id, metadata = by_row[row]
+                    values = self._vectors[row].tolist() if include_values else None
+                    candidates.append((score, item_id, json.loads(metadata) if include_metadata else None, values))
+
+            for item_id, (delta_vector, metadata, _) in self._delta.items():
+                if delta_vector is not None and matches_filter(metadata, filter):
+                    values = delta_vector.tolist() if include_values else None
+                    candidates.append((float(delta_vector @ query), item_id, metadata if include_metadata else None, values))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return QueryResponse([
+            Match(id=item_id, score=score, metadata=metadata, values=values)
+            for score, item_id, metadata, values in candidates[:top_k]
+        ])
+
+    def fetch(self, ids):
+        vectors = {}
+        with self._lock:
+            for item_id in ids:
+                if item_id in self._delta:
+                    vector, metadata, _ = self._delta[item_id]
+                    if vector is not None:
+                        vectors[item_id] = Match(id=item_id, metadata=metadata, values=vector.tolist())
+                    continue
+                found = self._db.execute('SELECT row, metadata FROM items WHERE id = ?', (item_id,)).fetchone()
+                if found:
+                    row, metadata = found
+                    vectors[item_id] = Match(id=item_id, metadata=json.loads(metadata), values=self._vectors[row].tolist())
+        return FetchResponse(vectors)
+
+    def count(self):
+        with self._lock:
+            total = self._db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            for vector, _, base_row in self._delta.values():
+                if vector is not None and base_row is None:
+                    total += 1
+                elif vector is None and base_row is not None:
+                    total -= 1
+            return total
+
+    def scan_metadata(self):
+        """(id, metadata) of every record, e.g. to rebuild the lexical index"""
+        with self._lock:
+            records = [(item_id, json.loads(metadata))
+                       for item_id, metadata in self._db.execute('SELECT id, metadata FROM items')
+                       if item_id not in self._delta]
+            records += [(item_id, metadata) for item_id, (vector, metadata, _) in self._delta.items()
+                        if vector is not None]
+        return records
+
+
+def create_mmap_store(read_only=None):
+    """MMAP_* settings; read_only defaults to MMAP_READ_ONLY"""
+    if read_only is None:
+        read_only = os.environ.get('MMAP_READ_ONLY', '0') == '1'
+    return MmapStore(
+        path=os.environ.get('MMAP_STORE_PATH', 'data/vectors'),
+        dim=int(os.environ.get('VECTOR_DIM', 512)),
+        compact_threshold=int(os.environ.get('MMAP_COMPACT_THRESHOLD', 4096)),
+        compact_interval=float(os.environ.get('MMAP_COMPACT_INTERVAL', 30)),
+        fsync=os.environ.get('MMAP_FSYNC', '0') == '1',
+        read_only=read_only
+    )
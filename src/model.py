@@ -1,17 +1,42 @@
 import sys
 import os 
+import json
+import hashlib
+import contextlib
 from PIL import Image
+import numpy as np
 import torch
 sys.path.append("ml-mobileclip")
 
 from mobileclip import create_model_and_transforms, get_tokenizer
+from preprocess import FastPreprocess
+from thread_policy import thread_config
 from dotenv import load_dotenv
 
 load_dotenv()
 
+EMBEDDING_DIM = 512
+
+# fp16 halves weight memory but CPU half kernels are slow or missing;
+# bf16 autocasts matmuls/convs; int8 dynamically quantizes every nn.Linear
+PRECISIONS = ('fp32', 'fp16', 'bf16', 'int8')
+
+# A text-only search replica or an image-only ingest worker keeps just one of these
+TOWERS = ('image', 'text')
+_TOWER_MODULES = {'image': 'image_encoder', 'text': 'text_encoder'}
+
 class ModelCLIP:
-    def __init__(self, model_name='mobileclip_s1', checkpoint=None, device='cpu'):
+    def __init__(self, model_name='mobileclip_s1', checkpoint=None, device='cpu', precision=None, towers=TOWERS,
+                 cache_dir=None, threads=None):
         self.model_name = model_name
+        self.precision = (precision or os.environ.get('MODEL_PRECISION', 'fp16')).lower()
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{self.precision}', expected one of {PRECISIONS}")
+        if not towers or set(towers) - set(TOWERS):
+            raise ValueError(f"Unknown towers {towers}, expected a subset of {TOWERS}")
+        self.towers = tuple(tower for tower in TOWERS if tower in towers)
+        self.cache_dir = cache_dir
+        self.threads = threads
         
         # Try multiple possible model paths for Railway deployment
         if checkpoint:
@@ -44,16 +69,56 @@ class ModelCLIP:
         import torch
         import gc
         
-        # Set ultra-low memory settings
-        torch.set_num_threads(1)
+        # Thread counts follow the host's cores, cgroup quota and worker count (see thread_policy)
+        self.apply_threads()
         torch.backends.cudnn.enabled = False
-        torch.backends.mkl.enabled = False
         
         # Force garbage collection before loading
         gc.collect()
         
         print("🔄 Loading model with minimal memory...")
+
+        # A cached copy of the ready-to-run model skips construction, checkpoint load and conversion
+        cache_path = self._cache_path()
+        cached = self._load_cached_model(cache_path) if cache_path else None
+        if cached is not None:
+            model, preprocess = cached
+        else:
+            model, preprocess = self._build_model()
+            if cache_path:
+                self._save_cached_model(cache_path, model, preprocess)
+
+        tokenizer = get_tokenizer(self.model_name)
+
+        # Reduced-resolution JPEG decode + single-step resize/crop (FAST_PREPROCESS=0 keeps torchvision)
+        if os.environ.get('FAST_PREPROCESS', '1') == '1':
+            fast_preprocess = FastPreprocess.from_transform(preprocess)
+            if fast_preprocess is not None:
+                preprocess = fast_preprocess
+                print("✅ Using fast image preprocessing")
+        
+        # Force cleanup
+        gc.collect()
         
+        print("✅ Model loaded with minimal memory footprint")
+        return model, preprocess, tokenizer
+
+    def apply_threads(self, threads=None):
+        """
+        Set torch's intra-/inter-op thread counts (a ThreadConfig; default: MODEL_THREADS_POLICY)
+        """
+        self.threads = threads or self.threads or thread_config()
+        torch.set_num_threads(self.threads.intra_op)
+        try:
+            torch.set_num_interop_threads(self.threads.inter_op)
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work in the process
+            pass
+        print(f"✅ Using {self.threads.describe()}")
+
+    def _build_model(self):
+        import gc
+
         model, _, preprocess = create_model_and_transforms(
             model_name=self.model_name,
             pretrained= self.checkpoint, 
@@ -66,40 +131,189 @@ class ModelCLIP:
         # Disable gradients completely
         for param in model.parameters():
             param.requires_grad = False
-        
-        # Force model to half precision to save memory (if supported)
+
+        # Free the weights of towers this process never runs
+        for tower in TOWERS:
+            if tower not in self.towers and getattr(model, _TOWER_MODULES[tower], None) is not None:
+                setattr(model, _TOWER_MODULES[tower], None)
+                print(f"✅ Skipping {tower} tower")
+        gc.collect()
+        self._release_memory()
+
+        return self._apply_precision(model), preprocess
+
+    def _cache_path(self):
+        """
+        MODEL_CACHE_DIR file for this model/checkpoint/precision/towers/torch combination, or None
+        """
+        cache_dir = os.environ.get('MODEL_CACHE_DIR', '') if self.cache_dir is None else self.cache_dir
+        if not cache_dir:
+            return None
+        source = [self.checkpoint]
+        if self.checkpoint:
+            stat = os.stat(self.checkpoint)
+            source += [stat.st_size, stat.st_mtime]
+        fingerprint = hashlib.sha256(json.dumps(
+            [self.model_name, self.precision, self.towers, torch.__version__] + source
+        ).encode()).hexdigest()[:16]
+        return os.path.join(cache_dir, f"{self.model_name}-{self.precision}-{'+'.join(self.towers)}-{fingerprint}.pt")
+
+    @staticmethod
+    def _load_cached_model(path):
+        if not os.path.exists(path):
+            return None
         try:
-            model = model.half()
-            print("✅ Using half precision to save memory")
-        except:
-            print("⚠️ Half precision not supported, using full precision")
-        
-        tokenizer = get_tokenizer(self.model_name)
-        
-        # Force cleanup
+            # mmap: weight pages are read lazily from the page cache instead of copied up front
+            cached = torch.load(path, map_location='cpu', mmap=True, weights_only=False)
+            print(f"✅ Loaded cached model from {path}")
+            return cached['model'], cached['preprocess']
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable model cache {path}: {e}")
+            return None
+
+    @staticmethod
+    def _save_cached_model(path, model, preprocess):
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            temporary = path + '.tmp'
+            torch.save({'model': model, 'preprocess': preprocess}, temporary)
+            os.replace(temporary, path)
+            print(f"💾 Cached model at {path} for faster boots")
+        except Exception as e:
+            print(f"⚠️ Could not cache model: {e}")
+
+    def has_tower(self, tower):
+        return tower in self.towers
+
+    def load_tower(self, model, tower):
+        """
+        Materialize a tower that was left out at load time, in place on model
+        """
+        if tower in self.towers:
+            return model
+        import gc
+
+        full_model, _, _ = create_model_and_transforms(
+            model_name=self.model_name,
+            pretrained=self.checkpoint,
+            device='cpu'
+        )
+        full_model.eval()
+        module = getattr(full_model, _TOWER_MODULES[tower])
+        for param in module.parameters():
+            param.requires_grad = False
+        setattr(model, _TOWER_MODULES[tower], self._apply_precision(module))
+
+        # Drop everything else the fresh model allocated
+        del full_model, module
         gc.collect()
-        
-        print("✅ Model loaded with minimal memory footprint")
-        return model, preprocess, tokenizer
+        self._release_memory()
+        self.towers = tuple(name for name in TOWERS if name in self.towers or name == tower)
+        return model
 
-    def encode_image(self,image_path, model ,preprocess):
-        image = Image.open(image_path).convert('RGB')
-        img = preprocess(image).unsqueeze(0).to(self.device)
+    def _require(self, tower):
+        if tower not in self.towers:
+            raise RuntimeError(f"The {tower} tower is not loaded (towers: {', '.join(self.towers)})")
 
-        with torch.no_grad():
-             image_feat = model.encode_image(img)
-             image_feat = image_feat / image_feat.norm(dim =-1, keepdim=True)
+    @staticmethod
+    def _release_memory():
+        """Hand freed weight pages back to the OS instead of keeping them in the malloc arena"""
+        try:
+            import ctypes
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+    def _apply_precision(self, model):
+        if self.precision == 'fp16':
+            # Force model to half precision to save memory (if supported)
+            try:
+                model = model.half()
+                print("✅ Using half precision to save memory")
+            except Exception:
+                print("⚠️ Half precision not supported, using full precision")
+                self.precision = 'fp32'
+        elif self.precision == 'int8':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            print("✅ Using dynamic int8 quantization for linear layers")
+        elif self.precision == 'bf16':
+            print("✅ Using bf16 autocast")
+        return model
 
-        return image_feat.squeeze().cpu().numpy()
+    def _inference(self):
+        """no_grad, plus bf16 autocast when that precision is selected"""
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.no_grad())
+        if self.precision == 'bf16':
+            stack.enter_context(torch.autocast(device_type=torch.device(self.device).type, dtype=torch.bfloat16))
+        return stack
+
+    def encode_image(self,image_path, model ,preprocess):
+        image = Image.open(image_path).convert('RGB')
+        return self.encode_pixels(preprocess(image).unsqueeze(0), model)[0]
     
     def encode_text(self, text, model, tokenizer):
-         
-         with torch.no_grad():
-              tokens = tokenizer(text).to(self.device)
-              text_feat = model.encode_text(tokens)
-              text_feat = text_feat / text_feat.norm(dim=-1, keepdim=True)
-         
-         return  text_feat.squeeze().cpu().numpy()
+         return self.encode_texts([text], model, tokenizer)[0]
+
+    def encode_images(self, images, model, preprocess, batch_size=32):
+        """
+        Encode many image paths or PIL images into a contiguous (N, 512) float32 matrix
+        """
+        features = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            if hasattr(preprocess, 'batch'):
+                # FastPreprocess decodes and fills one preallocated buffer itself
+                pixels = preprocess.batch(chunk)
+            else:
+                pixels = torch.stack([preprocess(self._to_rgb(image)) for image in chunk])
+            features.append(self.encode_pixels(pixels, model))
+
+        return self._stack_features(features)
+
+    def encode_pixels(self, pixels, model):
+        """
+        Encode an already preprocessed (N, 3, H, W) batch into (N, 512) float32
+        """
+        self._require('image')
+        pixels = pixels.to(self.device)
+        if self.precision == 'fp16':
+            pixels = pixels.half()
+        with self._inference():
+            image_feat = model.encode_image(pixels).float()
+            image_feat = image_feat / image_feat.norm(dim=-1, keepdim=True)
+
+        return image_feat.cpu().numpy()
+
+    def encode_texts(self, texts, model, tokenizer, batch_size=64):
+        """
+        Encode many strings into a contiguous (N, 512) float32 matrix
+        """
+        self._require('text')
+        features = []
+        for start in range(0, len(texts), batch_size):
+            chunk = list(texts[start:start + batch_size])
+
+            with self._inference():
+                tokens = tokenizer(chunk).to(self.device)
+                text_feat = model.encode_text(tokens).float()
+                text_feat = text_feat / text_feat.norm(dim=-1, keepdim=True)
+
+            features.append(text_feat.cpu().numpy())
+
+        return self._stack_features(features)
+
+    @staticmethod
+    def _to_rgb(image):
+        if isinstance(image, Image.Image):
+            return image.convert('RGB')
+        return Image.open(image).convert('RGB')
+
+    @staticmethod
+    def _stack_features(features):
+        if not features:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return np.ascontiguousarray(np.concatenate(features, axis=0), dtype=np.float32)
 
 
 # if __name__ == '__main__':
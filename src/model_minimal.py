@@ -91,9 +91,11 @@ class MinimalWrapper(nn.Module):
 
 class ModelCLIP:
     """Emergency minimal ModelCLIP wrapper for Railway"""
-    def __init__(self, model_name='mobileclip_s1', checkpoint=None, device='cpu'):
+    def __init__(self, model_name='mobileclip_s1', checkpoint=None, device='cpu', towers=('image', 'text'), threads=None):
         self.model_name = model_name
         self.device = device
+        # The minimal wrapper has no separable towers; both are always "loaded"
+        self.towers = ('image', 'text')
         
         # Find checkpoint
         if checkpoint:
@@ -138,6 +140,12 @@ class ModelCLIP:
         print("✅ Minimal model loaded")
         return model, simple_preprocess, simple_tokenizer
 
+    def has_tower(self, tower):
+        return True
+
+    def load_tower(self, model, tower):
+        return model
+
     def encode_image(self, image_path, model, preprocess):
         """Emergency image encoding"""
         try:
@@ -156,4 +164,14 @@ class ModelCLIP:
         except Exception as e:
             print(f"❌ Text encoding failed: {e}")
             # Return dummy vector as fallback
-            return np.random.randn(512).astype(np.float32)
\ No newline at end of file
+            return np.random.randn(512).astype(np.float32)
+
+    def encode_images(self, images, model, preprocess, batch_size=32):
+        """Emergency batched image encoding - falls back to one image at a time"""
+        vectors = [self.encode_image(image, model, preprocess) for image in images]
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32) if vectors else np.empty((0, 512), dtype=np.float32)
+
+    def encode_texts(self, texts, model, tokenizer, batch_size=64):
+        """Emergency batched text encoding - falls back to one text at a time"""
+        vectors = [self.encode_text(text, model, tokenizer) for text in texts]
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32) if vectors else np.empty((0, 512), dtype=np.float32)
@@ -0,0 +1,181 @@
+"""
+MobileCLIP on ONNX Runtime, with the same encode_* interface as ModelCLIP.
+
+Nothing here imports torch: graphs come from `python src/export_onnx.py`,
+preprocessing is FastPreprocess on numpy and tokenization is the numpy CLIP
+BPE tokenizer. Select it with INFERENCE_ENGINE=onnx.
+"""
+import os
+import json
+import numpy as np
+from dotenv import load_dotenv
+
+from preprocess import FastPreprocess
+from clip_tokenizer import ClipTokenizer
+from thread_policy import thread_config
+
+load_dotenv()
+
+EMBEDDING_DIM = 512
+
+GRAPH_OPTIMIZATIONS = ('disable', 'basic', 'extended', 'all')
+
+TOWERS = ('image', 'text')
+
+
+class OnnxTowers:
+    """The exported encoders behind the encode_image / encode_text calls of the torch model"""
+    def __init__(self, image_session=None, text_session=None):
+        self.sessions = {'image': image_session, 'text': text_session}
+
+    def encode_image(self, pixels):
+        return self._run('image', pixels)
+
+    def encode_text(self, tokens):
+        return self._run('text', tokens)
+
+    def _run(self, tower, inputs):
+        session = self.sessions[tower]
+        return session.run(None, {session.get_inputs()[0].name: inputs})[0]
+
+
+class OnnxModelCLIP:
+    def __init__(self, model_name='mobileclip_s1', model_dir=None, device='cpu', quantized=None,
+                 intra_op_threads=None, inter_op_threads=None, graph_optimization=None, towers=TOWERS,
+                 cache_dir=None, threads=None):
+        self.model_name = model_name
+        self.model_dir = model_dir or os.environ.get('ONNX_MODEL_DIR', os.path.join('models', 'onnx'))
+        if quantized is None:
+            quantized = os.environ.get('ONNX_QUANTIZED', '0') == '1'
+        self.quantized = quantized
+        self.precision = 'int8' if quantized else 'fp32'
+        # Explicit ORT_* settings win over the shared thread policy
+        policy = threads or thread_config()
+        self.intra_op_threads = int(intra_op_threads or os.environ.get('ORT_INTRA_OP_THREADS') or policy.intra_op)
+        self.inter_op_threads = int(inter_op_threads or os.environ.get('ORT_INTER_OP_THREADS') or policy.inter_op)
+        self.graph_optimization = (graph_optimization or os.environ.get('ORT_GRAPH_OPTIMIZATION', 'all')).lower()
+        if self.graph_optimization not in GRAPH_OPTIMIZATIONS:
+            raise ValueError(f"Unknown graph optimization '{self.graph_optimization}', expected one of {GRAPH_OPTIMIZATIONS}")
+        if not towers or set(towers) - set(TOWERS):
+            raise ValueError(f"Unknown towers {towers}, expected a subset of {TOWERS}")
+        self.towers = tuple(tower for tower in TOWERS if tower in towers)
+        self.device = device
+        self.cache_dir = cache_dir
+        self._config = None
+
+    def _read_config(self):
+        path = os.path.join(self.model_dir, f'{self.model_name}.json')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No exported model at {path} - run `python src/export_onnx.py` first")
+        with open(path) as f:
+            return json.load(f)
+
+    def _session_options(self, ort):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = {
+            'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[self.graph_optimization]
+        return options
+
+    def _session(self, tower):
+        import onnxruntime as ort
+
+        graph = self._config['graphs'][self.precision][tower]
+        path = os.path.join(self.model_dir, graph)
+        options = self._session_options(ort)
+
+        cache_dir = os.environ.get('MODEL_CACHE_DIR', '') if self.cache_dir is None else self.cache_dir
+        if cache_dir:
+            # Graph rewrites are done once and saved; later boots load the result with optimization off.
+            # The saved graph can contain kernels specific to this CPU, so keep the cache per machine type.
+            cached = os.path.join(cache_dir, f'{os.path.splitext(graph)[0]}.{self.graph_optimization}.optimized.onnx')
+            if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+                path = cached
+                print(f"✅ Using cached optimized graph {cached}")
+            else:
+                os.makedirs(cache_dir, exist_ok=True)
+                options.optimized_model_filepath = cached
+
+        return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def load_mobileclip_model(self):
+        """
+        Open an ONNX session per loaded tower; returns (towers, preprocess, tokenizer) like ModelCLIP
+        """
+        print("🔄 Loading ONNX model...")
+        config = self._config = self._read_config()
+        if self.precision not in config['graphs']:
+            raise FileNotFoundError(f"No {self.precision} graphs in {self.model_dir} - re-export with --quantize")
+
+        model = OnnxTowers(**{f'{tower}_session': self._session(tower) for tower in self.towers})
+        preprocess = FastPreprocess.from_config(config['preprocess'], tensor=False)
+        tokenizer = ClipTokenizer(os.path.join(self.model_dir, config['bpe']), context_length=config['context_length'])
+
+        print(f"✅ ONNX model loaded ({self.precision}, towers: {', '.join(self.towers)}, "
+              f"{self.intra_op_threads} intra-op / {self.inter_op_threads} inter-op threads, "
+              f"optimization={self.graph_optimization})")
+        return model, preprocess, tokenizer
+
+    def has_tower(self, tower):
+        return tower in self.towers
+
+    def load_tower(self, model, tower):
+        """
+        Open the session of a tower that was left out at load time, in place on model
+        """
+        if tower not in self.towers:
+            model.sessions[tower] = self._session(tower)
+            self.towers = tuple(name for name in TOWERS if name in self.towers or name == tower)
+        return model
+
+    def _require(self, tower):
+        if tower not in self.towers:
+            raise RuntimeError(f"The {tower} tower is not loaded (towers: {', '.join(self.towers)})")
+
+    def encode_image(self, image_path, model, preprocess):
+        return self.encode_pixels(preprocess.batch([image_path]), model)[0]
+
+    def encode_text(self, text, model, tokenizer):
+        return self.encode_texts([text], model, tokenizer)[0]
+
+    def encode_images(self, images, model, preprocess, batch_size=32):
+        """
+        Encode many image paths, bytes or PIL images into a contiguous (N, 512) float32 matrix
+        """
+        features = [self.encode_pixels(preprocess.batch(images[start:start + batch_size]), model)
+                    for start in range(0, len(images), batch_size)]
+        return self._stack_features(features)
+
+    def encode_pixels(self, pixels, model):
+        """
+        Encode an already preprocessed (N, 3, H, W) batch (numpy or CPU tensor) into (N, 512) float32
+        """
+        self._require('image')
+        return self._normalize(model.encode_image(np.ascontiguousarray(pixels, dtype=np.float32)))
+
+    def encode_texts(self, texts, model, tokenizer, batch_size=64):
+        """
+        Encode many strings into a contiguous (N, 512) float32 matrix
+        """
+        self._require('text')
+        features = [self._normalize(model.encode_text(tokenizer(list(texts[start:start + batch_size]))))
+                    for start in range(0, len(texts), batch_size)]
+        return self._stack_features(features)
+
+    @staticmethod
+    def _normalize(features):
+        features = features.astype(np.float32, copy=False)
+        return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+    @staticmethod
+    def _stack_features(features):
+        if not features:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return np.ascontiguousarray(np.concatenate(features, axis=0), dtype=np.float32)
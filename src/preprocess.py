@@ -0,0 +1,146 @@
+import io
+import math
+import numpy as np
+from PIL import Image
+
+_INTERPOLATION = {
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'nearest': Image.NEAREST,
+}
+_INTERPOLATION_NAMES = {value: name for name, value in _INTERPOLATION.items()}
+
+
+class FastPreprocess:
+    """
+    Drop-in replacement for the MobileCLIP Resize -> CenterCrop -> ToTensor (-> Normalize) transform.
+
+    - JPEGs are decoded at reduced resolution with PIL draft(), so a 3000px photo
+      is never fully decoded just to be shrunk to 256px
+    - resize and center crop happen in one PIL resize call using a source box
+    - pixels are written straight into a preallocated float32 batch buffer and
+      scaled/normalized in place for the whole batch
+
+    With tensor=False batches come back as numpy arrays and torch is never imported.
+    """
+    def __init__(self, resize=256, crop=256, interpolation=Image.BILINEAR, mean=None, std=None, draft=True, tensor=True):
+        self.resize = resize
+        self.crop = crop
+        self.interpolation = interpolation
+        self.draft = draft
+        self.tensor = tensor
+        self.mean = None if mean is None else [float(value) for value in mean]
+        self.std = None if std is None else [float(value) for value in std]
+
+        mean = np.zeros(3, dtype=np.float32) if mean is None else np.asarray(mean, dtype=np.float32)
+        std = np.ones(3, dtype=np.float32) if std is None else np.asarray(std, dtype=np.float32)
+        # (x / 255 - mean) / std == x * scale - offset
+        self._scale = (1.0 / (255.0 * std)).reshape(1, 3, 1, 1)
+        self._offset = (mean / std).reshape(1, 3, 1, 1)
+        self._normalize = bool(np.any(mean != 0) or np.any(std != 1))
+
+    @classmethod
+    def from_transform(cls, transform, draft=True):
+        """Build from a torchvision Compose; returns None when it contains steps we don't replicate"""
+        resize = crop = mean = std = None
+        interpolation = Image.BILINEAR
+        for step in getattr(transform, 'transforms', []):
+            kind = type(step).__name__
+            if kind == 'Resize':
+                if not isinstance(step.size, int) and len(step.size) != 1:
+                    return None
+                resize = step.size if isinstance(step.size, int) else step.size[0]
+                mode = getattr(step.interpolation, 'value', step.interpolation)
+                if str(mode).lower() not in _INTERPOLATION:
+                    return None
+                interpolation = _INTERPOLATION[str(mode).lower()]
+            elif kind == 'CenterCrop':
+                crop = step.size[0] if isinstance(step.size, (tuple, list)) else step.size
+            elif kind == 'Normalize':
+                mean, std = step.mean, step.std
+            elif kind == 'ToTensor' or getattr(step, '__name__', '') == '_convert_to_rgb':
+                # Both are covered by _fill
+                continue
+            else:
+                return None
+        if resize is None or crop is None:
+            return None
+        return cls(resize=resize, crop=crop, interpolation=interpolation, mean=mean, std=std, draft=draft)
+
+    def to_config(self):
+        """JSON-serialisable settings, e.g. to ship next to an exported model"""
+        return {
+            'resize': self.resize,
+            'crop': self.crop,
+            'interpolation': _INTERPOLATION_NAMES.get(self.interpolation, 'bilinear'),
+            'mean': self.mean,
+            'std': self.std,
+        }
+
+    @classmethod
+    def from_config(cls, config, draft=True, tensor=True):
+        return cls(
+            resize=config['resize'],
+            crop=config['crop'],
+            interpolation=_INTERPOLATION[config.get('interpolation', 'bilinear')],
+            mean=config.get('mean'),
+            std=config.get('std'),
+            draft=draft,
+            tensor=tensor
+        )
+
+    def open(self, source):
+        """Open a path, file-like or bytes-like source, requesting a reduced-size JPEG decode"""
+        if isinstance(source, Image.Image):
+            return source, source.size
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        image = Image.open(source)
+        original_size = image.size
+        if self.draft and image.format == 'JPEG':
+            width, height = image.size
+            ratio = self.resize / min(width, height)
+            if ratio < 1:
+                # draft() picks the largest 1/2, 1/4, 1/8 scale that stays at least this big
+                image.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+        return image, original_size
+
+    def _crop_box(self, width, height):
+        """torchvision Resize(shorter side) + CenterCrop expressed as a box in source pixels"""
+        if width <= height:
+            new_width, new_height = self.resize, int(self.resize * height / width)
+        else:
+            new_width, new_height = int(self.resize * width / height), self.resize
+        left = int(round((new_width - self.crop) / 2.0))
+        top = int(round((new_height - self.crop) / 2.0))
+        scale_x, scale_y = width / new_width, height / new_height
+        return (left * scale_x, top * scale_y, (left + self.crop) * scale_x, (top + self.crop) * scale_y)
+
+    def _fill(self, source, out):
+        image, (width, height) = self.open(source)
+        image = image.convert('RGB')
+
+        # Map the full-resolution crop box onto the (possibly draft-reduced) decoded image
+        box = self._crop_box(width, height)
+        reduce_x, reduce_y = image.size[0] / width, image.size[1] / height
+        box = (box[0] * reduce_x, box[1] * reduce_y, box[2] * reduce_x, box[3] * reduce_y)
+
+        resized = image.resize((self.crop, self.crop), self.interpolation, box=box)
+        out[...] = np.asarray(resized, dtype=np.uint8).transpose(2, 0, 1)
+
+    def batch(self, sources):
+        """Preprocess many images into one (N, 3, crop, crop) float32 tensor (or array)"""
+        buffer = np.empty((len(sources), 3, self.crop, self.crop), dtype=np.float32)
+        for i, source in enumerate(sources):
+            self._fill(source, buffer[i])
+        buffer *= self._scale
+        if self._normalize:
+            buffer -= self._offset
+        if not self.tensor:
+            return buffer
+        import torch
+        return torch.from_numpy(buffer)
+
+    def __call__(self, image):
+        """Same contract as the torchvision transform: one image in, (3, crop, crop) tensor out"""
+        return self.batch([image])[0]
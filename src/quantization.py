@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class Float32Codec:
+    """No quantization - 4 bytes per dimension"""
+    name = 'fp32'
+    dtype = np.float32
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors, np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, codes, scales):
+        return np.asarray(codes, dtype=np.float32)
+
+    def score(self, codes, scales, query):
+        return codes @ query
+
+
+class Float16Codec:
+    """Half precision storage - 2 bytes per dimension, dequantized on the fly"""
+    name = 'fp16'
+    dtype = np.float16
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, codes, scales):
+        return codes.astype(np.float32)
+
+    def score(self, codes, scales, query):
+        return codes.astype(np.float32) @ query
+
+
+class Int8Codec:
+    """
+    Symmetric int8 with one float32 scale per vector - 1 byte per dimension.
+    score() is exact for the dequantized vector: (codes @ q) * scale
+    """
+    name = 'int8'
+    dtype = np.int8
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(self, codes, scales):
+        return codes.astype(np.float32) * scales[:, None]
+
+    def score(self, codes, scales, query):
+        scores = codes.astype(np.float32) @ query
+        # query may be one vector or a (dim, B) matrix of queries
+        return scores * (scales[:, None] if scores.ndim == 2 else scales)
+
+
+CODECS = {
+    'fp32': Float32Codec,
+    'fp16': Float16Codec,
+    'int8': Int8Codec,
+}
+
+
+def get_codec(name='fp32'):
+    try:
+        return CODECS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown quantization '{name}', expected one of {list(CODECS)}")
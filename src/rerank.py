@@ -0,0 +1,53 @@
+"""
+Second search stage: exact re-scoring and Maximal Marginal Relevance.
+
+The first stage over-fetches limit x factor candidates from the vector store
+(approximate or quantized scores, plus any lexical hits). The second stage
+works on the small candidate matrix only: exact fp32 cosine scores, then,
+when a diversity lambda is given, MMR picks results that are relevant but
+not near-duplicates of the ones already picked.
+"""
+import numpy as np
+
+
+def exact_scores(query, vectors):
+    """Cosine of a unit query against candidate rows (zero rows score 0)"""
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    norms = np.linalg.norm(vectors, axis=1)
+    return (vectors @ query) / np.maximum(norms, 1e-12)
+
+
+def _scaled(relevance):
+    """Min-max to [0, 1] so relevance and cosine similarity are on one scale"""
+    relevance = np.asarray(relevance, dtype=np.float32)
+    span = relevance.max() - relevance.min() if len(relevance) else 0
+    return (relevance - relevance.min()) / span if span > 0 else np.ones_like(relevance)
+
+
+def mmr(relevance, vectors, k, diversity_lambda):
+    """
+    Positions of k candidates chosen greedily by
+    lambda * relevance - (1 - lambda) * max similarity to those already chosen.
+    lambda = 1 is plain relevance order, lower values trade relevance for variety.
+    """
+    count = len(relevance)
+    k = min(k, count)
+    if k <= 0:
+        return []
+    relevance = _scaled(relevance)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+
+    chosen = []
+    closest = np.full(count, -np.inf, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    for _ in range(k):
+        penalty = np.where(np.isfinite(closest), closest, 0.0)
+        score = diversity_lambda * relevance - (1 - diversity_lambda) * penalty
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        chosen.append(best)
+        available[best] = False
+        # One matrix-vector product per pick updates every candidate's nearest chosen item
+        closest = np.maximum(closest, unit @ unit[best])
+    return chosen
@@ -0,0 +1,351 @@
+"""
+Deadlines, retries, hedging and a circuit breaker around a network vector store.
+
+    query   -> breaker check -> attempt (hedged after hedge_after) -> retry with jittered backoff
+               until the deadline -> on failure, the local replica (if any) answers instead
+    upsert  -> same, without hedging, under the longer write deadline; mirrored to the replica
+    fetch / delete / count follow the query / upsert rules
+
+Query responses the replica answers have degraded=True so callers can say so, and
+an empty replica never answers: the call fails with StoreUnavailable instead.
+
+Every call runs on a bounded pool, so the caller stops waiting at its deadline even
+when the SDK would keep waiting out its own timeouts. After failure_threshold calls in
+a row fail the breaker opens and calls fail fast (or go to the replica) for
+reset_timeout seconds, then a single probe decides whether it closes again.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+from vector_store import VectorStore
+
+
+class StoreUnavailable(RuntimeError):
+    """The store could not answer within its deadline, or the breaker is open"""
+
+
+def _retryable(error):
+    """Rate limits, server errors and network failures are worth another attempt; other 4xx are not"""
+    # Older SDKs name it status, newer ones status_code
+    status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+    if status is None:
+        return not isinstance(error, (ValueError, TypeError, KeyError))
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold straight failures -> half-open probe after reset_timeout"""
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                    print(f"🔌 Circuit breaker open for {self.reset_timeout:g}s after {self.failures} failures")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
+
+
+class ResilientStore(VectorStore):
+    """
+    Wraps a network store (PineconeStore) with per-call deadlines, bounded retries,
+    optional hedged queries, a circuit breaker and an optional local replica.
+
+    hedge_after is seconds, 'auto' (the recent p95 query latency) or None.
+    With mirror_writes the replica also receives writes that succeed through this
+    wrapper; a replica has to be persistent and already filled, since it only ever
+    sees the writes made after it was opened.
+    """
+    def __init__(self, primary, replica=None, deadline=2.0, write_deadline=10.0, retries=2, backoff=0.05,
+                 max_backoff=1.0, hedge_after=None, breaker=None, pool_size=32, mirror_writes=True):
+        self.primary = primary
+        self.replica = replica
+        self.name = primary.name
+        self.dim = primary.dim
+        self.upsert_workers = primary.upsert_workers
+        self.query_workers = primary.query_workers
+        self.rerank_needs_values = primary.rerank_needs_values
+        self.deadline = deadline
+        self.write_deadline = write_deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.mirror_writes = mirror_writes
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='store-call')
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        self.calls = 0
+        self.attempts = 0
+        self.retried = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self.mirror_failures = 0
+        self._replica_filled = False
+
+    # ---- call machinery --------------------------------------------------------
+
+    def _hedge_delay(self):
+        if self.hedge_after != 'auto':
+            return self.hedge_after
+        with self._lock:
+            if len(self._latencies) < 50:
+                return None
+            return max(float(np.percentile(self._latencies, 95)), 0.005)
+
+    def _attempt(self, fn, remaining, hedge):
+        """One attempt, plus a hedged duplicate if the first is still running after the hedge delay"""
+        started = time.monotonic()
+        futures = [self._pool.submit(fn)]
+        delay = self._hedge_delay() if hedge else None
+        if delay is not None and delay < remaining:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                futures.append(self._pool.submit(fn))
+                with self._lock:
+                    self.hedges += 1
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(remaining - (time.monotonic() - started), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        if error is None:
+            with self._lock:
+                self.timeouts += 1
+            error = TimeoutError(f"no answer within {remaining * 1000:.0f}ms")
+        raise error
+
+    def _call(self, fn, deadline, hedge=False):
+        """fn() under the breaker, retried with full-jitter backoff until the deadline"""
+        if not self.breaker.allow():
+            raise StoreUnavailable(f"{self.name} circuit breaker is open")
+        started = time.monotonic()
+        with self._lock:
+            self.calls += 1
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            if attempt:
+                pause = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+                if pause >= remaining:
+                    break
+                time.sleep(pause)
+                remaining -= pause
+                with self._lock:
+                    self.retried += 1
+            with self._lock:
+                self.attempts += 1
+            try:
+                result = self._attempt(fn, remaining, hedge)
+            except Exception as e:
+                error = e
+                if not _retryable(e):
+                    # The request itself is wrong; the store is fine
+                    self.breaker.record_success()
+                    raise
+                continue
+            self.breaker.record_success()
+            if hedge:
+                with self._lock:
+                    self._latencies.append(time.monotonic() - started)
+            return result
+
+        self.breaker.record_failure()
+        with self._lock:
+            self.failures += 1
+        raise StoreUnavailable(f"{self.name} failed after {time.monotonic() - started:.2f}s: {error}") from error
+
+    def _replica_ready(self):
+        """An empty replica would answer with nothing, which is worse than a 503"""
+        if not self._replica_filled:
+            self._replica_filled = self.replica.count() > 0
+        return self._replica_filled
+
+    def _fallback(self, operation, error, fn):
+        if self.replica is None:
+            raise error
+        if not self._replica_ready():
+            raise StoreUnavailable(f"{error} (the {self.replica.name} replica is empty)") from error
+        with self._lock:
+            self.fallbacks += 1
+        print(f"🛟 {operation} served by the {self.replica.name} replica: {error}")
+        return fn()
+
+    # ---- VectorStore -----------------------------------------------------------
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        try:
+            return self._call(lambda: self.primary.query(vector, top_k, include_metadata, include_values, filter,
+                                                         **search_params), self.deadline, hedge=True)
+        except StoreUnavailable as e:
+            response = self._fallback('Query', e, lambda: self.replica.query(vector, top_k, include_metadata,
+                                                                              include_values, filter, **search_params))
+            response.degraded = True
+            return response
+
+    def fetch(self, ids):
+        ids = list(ids)
+        try:
+            return self._call(lambda: self.primary.fetch(ids), self.deadline, hedge=True)
+        except StoreUnavailable as e:
+            return self._fallback('Fetch', e, lambda: self.replica.fetch(ids))
+
+    def count(self):
+        try:
+            return self._call(self.primary.count, self.deadline)
+        except StoreUnavailable as e:
+            return self._fallback('Count', e, lambda: self.replica.count())
+
+    def upsert(self, vectors):
+        # Upserts are idempotent by id, so retrying a chunk that may have landed is safe
+        result = self._call(lambda: self.primary.upsert(vectors), self.write_deadline)
+        self._mirror('upsert', lambda: self.replica.upsert(vectors))
+        return result
+
+    def delete(self, ids):
+        ids = list(ids)
+        result = self._call(lambda: self.primary.delete(ids), self.write_deadline)
+        self._mirror('delete', lambda: self.replica.delete(ids))
+        return result
+
+    def _mirror(self, operation, fn):
+        """Copy a write the primary accepted to the replica; a replica failure never fails the write"""
+        if self.replica is None or not self.mirror_writes:
+            return
+        try:
+            fn()
+        except Exception as e:
+            with self._lock:
+                self.mirror_failures += 1
+            print(f"⚠️ Replica {operation} failed (primary write kept): {e}")
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            stats = {
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.retried,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'fallbacks': self.fallbacks,
+                'mirror_failures': self.mirror_failures,
+                'query_p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+                'query_p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+                'deadline_ms': self.deadline * 1000,
+                'hedge_after': self.hedge_after
+            }
+        stats['breaker'] = self.breaker.stats()
+        stats['replica'] = self.replica.name if self.replica is not None else None
+        return stats
+
+
+def parse_hedge(value):
+    """PINECONE_HEDGE_MS: milliseconds, 'auto' (recent p95) or empty / 0 for no hedging"""
+    value = (value or '').strip().lower()
+    if value == 'auto':
+        return 'auto'
+    return float(value) / 1000 if value and float(value) > 0 else None
+
+
+def create_resilient_store(primary):
+    """
+    Wrap primary with the PINECONE_* resilience settings.
+
+    PINECONE_REPLICA=mmap falls back to the mmap store at MMAP_STORE_PATH. It is
+    single-writer: the one process with PINECONE_REPLICA_MIRROR=1 (an ingest run,
+    say) feeds it, and every other process opens it read-only as of its boot.
+    In-process local / ivf replicas are refused - each worker's copy would start
+    empty and only see its own writes.
+    """
+    replica = None
+    replica_backend = os.environ.get('PINECONE_REPLICA', '').lower()
+    mirror_writes = os.environ.get('PINECONE_REPLICA_MIRROR', '0') == '1'
+    if replica_backend and replica_backend != 'mmap':
+        raise ValueError(f"PINECONE_REPLICA={replica_backend} is not persistent; use 'mmap' (fed by one writer)")
+    if replica_backend:
+        from mmap_store import create_mmap_store
+        try:
+            replica = create_mmap_store(read_only=not mirror_writes)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"⚠️ No Pinecone replica: {e}")
+        if replica is not None and not mirror_writes and replica.count() == 0:
+            print(f"⚠️ No Pinecone replica: {replica.path} is empty")
+            replica.close()
+            replica = None
+    return ResilientStore(
+        primary,
+        replica=replica,
+        deadline=float(os.environ.get('PINECONE_DEADLINE_MS', 2000)) / 1000,
+        write_deadline=float(os.environ.get('PINECONE_WRITE_DEADLINE_MS', 10000)) / 1000,
+        retries=int(os.environ.get('PINECONE_RETRIES', 2)),
+        hedge_after=parse_hedge(os.environ.get('PINECONE_HEDGE_MS')),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get('PINECONE_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.environ.get('PINECONE_BREAKER_RESET_S', 10))
+        ),
+        pool_size=int(os.environ.get('PINECONE_POOL_SIZE', 32)),
+        mirror_writes=mirror_writes
+    )
@@ -1,13 +1,66 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify
 from flask_cors import CORS
+import io
 import os
+import json
+import threading
+
+class InMemoryRequest(Request):
+    """Keep uploaded files in memory instead of spooling large ones to a temp file"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+# Werkzeug enforces this while streaming the body, so oversized uploads never land in memory
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('MAX_UPLOAD_MB', 10)) * 1024 * 1024)
 CORS(app)
 
-# Global indexer - simple lazy loading
+# Global indexer - created once, by the boot warm-up or the first request
 indexer = None
+_indexer_lock = threading.Lock()
+_warmup_thread = None
+_startup_error = None
+
+def get_indexer():
+    global indexer
+    if indexer is None:
+        with _indexer_lock:
+            if indexer is None:
+                from indexer import SimpleIndexer
+                indexer = SimpleIndexer()
+    return indexer
+
+def start_warm_up():
+    """Create the indexer, load the model and run both towers on a background thread (once)"""
+    global _warmup_thread
+    def warm_up():
+        global _startup_error
+        try:
+            get_indexer().start_warm_up()
+        except Exception as e:
+            _startup_error = str(e)
+            print(f"❌ Indexer startup failed: {e}")
+    with _indexer_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='indexer-startup', daemon=True)
+            _warmup_thread.start()
+
+# WARMUP=0 keeps the old behaviour of loading on the first request (or the first /ready probe)
+if os.environ.get('WARMUP', '1') == '1':
+    start_warm_up()
+
+@app.before_request
+def reject_oversized_body():
+    """Fail fast on a declared Content-Length above the limit, before any route reads the body"""
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return request_too_large(None)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return jsonify({'error': f'Request body too large (max {limit_mb:g}MB)'}), 413
 
 @app.route('/', methods=['GET'])
 def home():
@@ -16,7 +69,13 @@ def home():
         'service': 'Semantic Search API',
         'endpoints': {
             'POST /upload': 'Upload content',
+            'POST /upload/batch': 'Upload many files or texts at once',
             'POST /search': 'Search content',
+            'POST /search/batch': 'Many text and/or image searches in one request',
+            'POST /delete': 'Delete items by id',
+            'POST /flush': 'Wait for buffered uploads to reach the index',
+            'GET /stats': 'Cache and runtime counters',
+            'GET /ready': 'Readiness - 200 once the model is loaded and warm',
             'GET /ping': 'Health check'
         }
     })
@@ -26,6 +85,26 @@ def ping():
     """Simple health check"""
     return "OK"
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 until the model is loaded and both towers have run once"""
+    if indexer is None:
+        # Never blocks on startup; with WARMUP=0 the first probe kicks it off
+        start_warm_up()
+        if _startup_error:
+            return jsonify({'ready': False, 'status': 'failed', 'error': _startup_error}), 503
+        return jsonify({'ready': False, 'status': 'starting'}), 503
+    indexer.start_warm_up()
+    status = indexer.readiness()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Cache and runtime counters (empty until the indexer is created)"""
+    if indexer is None:
+        return jsonify({'indexer': 'not_loaded'})
+    return jsonify(indexer.stats())
+
 @app.route('/emergency', methods=['GET'])
 def emergency():
     """Emergency endpoint that works without model loading"""
@@ -43,9 +122,7 @@ def upload():
     
     try:
         # Initialize indexer if needed
-        if indexer is None:
-            from indexer import SimpleIndexer
-            indexer = SimpleIndexer()
+        indexer = get_indexer()
         
         # Handle image upload
         if 'file' in request.files:
@@ -56,14 +133,8 @@ def upload():
             if not file or not file.filename:
                 return jsonify({'error': 'No file provided'}), 400
             
-            # Save temp file
-            filepath = f"temp/{file.filename}"
-            os.makedirs('temp', exist_ok=True)
-            file.save(filepath)
-            
-            # Add to index
-            item_id = indexer.add_image(filepath, description, custom_id)
-            os.remove(filepath)
+            # Add to index straight from memory
+            item_id = indexer.add_image_data(file.read(), file.filename, description, custom_id)
             
             return jsonify({'id': item_id})
         
@@ -87,16 +158,172 @@ def upload():
         print(f"Upload error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload many items in one request:
+    - multipart/form-data with repeated 'files' (plus optional parallel 'id' / 'description' fields)
+    - application/json with a list of {text, id, category} (bare array or {"items": [...]})
+    """
+    global indexer
+    
+    try:
+        # Initialize indexer if needed
+        indexer = get_indexer()
+        
+        max_items = int(os.environ.get('UPLOAD_BATCH_MAX', 256))
+        
+        # Handle image batch
+        if request.files:
+            files = request.files.getlist('files') or request.files.getlist('file')
+            ids = request.form.getlist('id')
+            descriptions = request.form.getlist('description')
+            
+            if not files:
+                return jsonify({'error': 'No files provided'}), 400
+            if len(files) > max_items:
+                return jsonify({'error': f'Too many files (max {max_items})'}), 400
+            
+            items = []
+            for i, file in enumerate(files):
+                items.append({
+                    'data': file.read(),
+                    'name': file.filename or f'upload_{i}',
+                    'id': ids[i] if i < len(ids) and ids[i] else None,
+                    'description': descriptions[i] if i < len(descriptions) else ''
+                })
+            
+            results = indexer.add_image_batch(items)
+        
+        # Handle text batch
+        elif request.is_json:
+            data = request.get_json()
+            items = data.get('items') if isinstance(data, dict) else data
+            
+            if not isinstance(items, list) or not items:
+                return jsonify({'error': 'No items provided'}), 400
+            if len(items) > max_items:
+                return jsonify({'error': f'Too many items (max {max_items})'}), 400
+            if not all(isinstance(item, dict) for item in items):
+                return jsonify({'error': 'Each item must be an object with a text field'}), 400
+            
+            results = indexer.add_text_batch(items)
+        
+        else:
+            return jsonify({'error': 'Invalid request format'}), 400
+        
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'errors': sum(1 for result in results if result['error'])
+        })
+            
+    except Exception as e:
+        print(f"Batch upload error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/flush', methods=['POST'])
+def flush():
+    """Write barrier: returns once buffered uploads are in the vector store (WRITE_BEHIND=1)"""
+    global indexer
+
+    try:
+        indexer = get_indexer()
+        timeout = request.args.get('timeout', type=float)
+        if not indexer.flush(timeout):
+            return jsonify({'flushed': False, 'write_buffer': indexer.write_buffer.stats()}), 504
+        return jsonify({'flushed': True,
+                        'write_buffer': indexer.write_buffer.stats() if indexer.write_buffer else None})
+
+    except Exception as e:
+        print(f"Flush error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/delete', methods=['POST'])
+def delete():
+    """Delete items by id: {"ids": ["...", ...]}"""
+    global indexer
+
+    try:
+        indexer = get_indexer()
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(item_id, str) for item_id in ids):
+            return jsonify({'error': "'ids' must be a non-empty list of strings"}), 400
+        indexer.delete(ids)
+        return jsonify({'deleted': ids})
+
+    except Exception as e:
+        print(f"Delete error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def search_filter(source):
+    """
+    Metadata filter for a search: a Pinecone-style 'filter' object (a JSON string
+    in multipart forms) and/or the 'type' and 'category' shorthands.
+    Raises ValueError for a malformed filter.
+    """
+    from metadata_filter import parse_filter
+
+    conditions = []
+    custom = source.get('filter')
+    if isinstance(custom, str) and custom.strip():
+        custom = json.loads(custom)
+    if custom:
+        conditions.append(parse_filter(custom))
+    for field in ('type', 'category'):
+        if source.get(field):
+            conditions.append(parse_filter({field: source.get(field)}))
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+def second_stage(source):
+    """
+    (rerank_factor, mmr_lambda) of a search: over-fetch factor for exact re-ranking
+    (integer >= 1) and MMR diversity lambda (0-1, lower = more varied); None when absent.
+    Raises ValueError for values out of range.
+    """
+    factor, mmr_lambda = source.get('rerank_factor'), source.get('mmr_lambda')
+    try:
+        factor = int(factor) if factor not in (None, '') else None
+        mmr_lambda = float(mmr_lambda) if mmr_lambda not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('rerank_factor must be an integer and mmr_lambda a number')
+    if factor is not None and factor < 1:
+        raise ValueError('rerank_factor must be at least 1')
+    if mmr_lambda is not None and not 0 <= mmr_lambda <= 1:
+        raise ValueError('mmr_lambda must be between 0 and 1')
+    return factor, mmr_lambda
+
+def search_limit(value):
+    """
+    Result count of a search: an integer from 1 to SEARCH_MAX_LIMIT (default 100).
+    Raises ValueError otherwise.
+    """
+    max_limit = int(os.environ.get('SEARCH_MAX_LIMIT', 100))
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'limit must be an integer from 1 to {max_limit}')
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'limit must be an integer from 1 to {max_limit}')
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f'limit must be an integer from 1 to {max_limit}')
+    return limit
+
 @app.route('/search', methods=['POST'])
 def search():
-    """Search for similar content"""
+    """
+    Search for similar content, optionally restricted by metadata (see search_filter)
+    and re-ranked / diversified in a second stage (see second_stage).
+    consistent=true first waits for buffered uploads (read-your-writes).
+    """
     global indexer
     
     try:
         # Initialize indexer if needed
-        if indexer is None:
-            from indexer import SimpleIndexer
-            indexer = SimpleIndexer()
+        indexer = get_indexer()
         
         # Debug info
         print(f"Content-Type: {request.content_type}")
@@ -107,68 +334,82 @@ def search():
         if 'file' in request.files:
             file = request.files['file']
             limit = int(request.form.get('limit', 5))
+            nprobe = request.form.get('nprobe', type=int)
+            try:
+                filter = search_filter(request.form)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid filter: {e}'}), 400
+            try:
+                rerank_factor, mmr_lambda = second_stage(request.form)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
             if not file or not file.filename:
                 return jsonify({'error': 'No file provided'}), 400
             
             print(f"Searching with file: {file.filename}")
-            
-            # Save temp file
-            filepath = f"temp/search_{file.filename}"
-            os.makedirs('temp', exist_ok=True)
-            file.save(filepath)
+            if request.form.get('consistent', '').lower() in ('1', 'true'):
+                indexer.flush(float(os.environ.get('WRITE_BEHIND_BARRIER_TIMEOUT', 10)))
             
             try:
-                # Search
-                print(f"Calling indexer.search with file: {filepath}, limit: {limit}")
-                results = indexer.search(filepath, limit)
+                # Search straight from the request bytes
+                data = file.read()
+                print(f"Calling indexer.search_image with {len(data)} bytes, limit: {limit}")
+                # Only ids are returned, so metadata stays in the store
+                results = indexer.search_image(data, limit, nprobe=nprobe, filter=filter, include_metadata=False,
+                                               rerank_factor=rerank_factor, mmr_lambda=mmr_lambda)
                 print(f"Search returned {len(results)} results")
                 
                 # Extract IDs with debugging
                 result_ids = [r.id for r in results]
                 print(f"Result IDs: {result_ids}")
                 
-                return jsonify({'ids': result_ids})
+                # degraded: the store was down and its replica answered, so results may be stale
+                return jsonify({'ids': result_ids, 'degraded': indexer.served_degraded()})
             except Exception as search_error:
                 print(f"❌ Search failed: {search_error}")
-                # Emergency fallback - return dummy IDs
-                return jsonify({
-                    'ids': ['emergency-1', 'emergency-2'],
-                    'warning': 'Emergency mode - dummy results',
-                    'error': str(search_error)
-                })
-            finally:
-                # Always cleanup temp file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+                # No made-up ids: clients retry or degrade on a 503
+                return jsonify({'ids': [], 'error': str(search_error)}), 503
         
         # Handle text search
         elif request.is_json:
             data = request.get_json()
             query = data.get('query')
             limit = data.get('limit', 5)
+            nprobe = data.get('nprobe')
+            # Share of the BM25 ranking in the fused result (default HYBRID_WEIGHT, 0 = vector only)
+            lexical_weight = data.get('lexical_weight')
+            try:
+                filter = search_filter(data)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid filter: {e}'}), 400
+            try:
+                rerank_factor, mmr_lambda = second_stage(data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
             if not query:
                 return jsonify({'error': 'No query provided'}), 400
+            if data.get('consistent'):
+                indexer.flush(float(os.environ.get('WRITE_BEHIND_BARRIER_TIMEOUT', 10)))
             
             try:
-                print(f"Calling indexer.search with query: {query}, limit: {limit}")
-                results = indexer.search(query, limit)
+                print(f"Calling indexer.search_text with query: {query}, limit: {limit}")
+                results = indexer.search_text(query, limit, nprobe=nprobe, filter=filter, include_metadata=False,
+                                              lexical_weight=lexical_weight, rerank_factor=rerank_factor,
+                                              mmr_lambda=mmr_lambda)
                 print(f"Search returned {len(results)} results")
                 
                 # Extract IDs with debugging
                 result_ids = [r.id for r in results]
                 print(f"Result IDs: {result_ids}")
                 
-                return jsonify({'ids': result_ids})
+                # degraded: the store was down and its replica answered, so results may be stale
+                return jsonify({'ids': result_ids, 'degraded': indexer.served_degraded()})
             except Exception as search_error:
                 print(f"❌ Text search failed: {search_error}")
-                # Emergency fallback - return dummy IDs
-                return jsonify({
-                    'ids': ['emergency-text-1', 'emergency-text-2'],
-                    'warning': 'Emergency mode - dummy results',
-                    'error': str(search_error)
-                })
+                # No made-up ids: clients retry or degrade on a 503
+                return jsonify({'ids': [], 'error': str(search_error)}), 503
         
         else:
             return jsonify({
@@ -182,6 +423,90 @@ def search():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Answer many searches in one request:
+    - application/json: {"queries": [{"query": "...", "limit": 5}, ...]} (or a bare array)
+    - multipart/form-data: repeated 'files', plus an optional 'queries' JSON field whose
+      entries are {"query": "..."} or {"file": <index into files>}, each with an optional
+      limit, filter, rerank_factor and mmr_lambda (as for /search); text entries also
+      take lexical_weight
+    Returns {"ids": [[...], ...], "errors": [...], "degraded": [...]} in input order
+    (degraded: answered by the fallback replica while the store was down).
+    """
+    from resilient_store import StoreUnavailable
+    global indexer
+
+    try:
+        # Initialize indexer if needed
+        indexer = get_indexer()
+
+        max_queries = int(os.environ.get('SEARCH_BATCH_MAX', 64))
+
+        if request.files:
+            files = request.files.getlist('files') or request.files.getlist('file')
+            nprobe = request.form.get('nprobe', type=int)
+            if request.form.get('queries'):
+                try:
+                    entries = json.loads(request.form['queries'])
+                except ValueError:
+                    return jsonify({'error': "'queries' must be a JSON array"}), 400
+            else:
+                limit = request.form.get('limit', 5)
+                entries = [{'file': i, 'limit': limit} for i in range(len(files))]
+            blobs = [file.read() for file in files]
+        elif request.is_json:
+            data = request.get_json()
+            entries = data.get('queries') if isinstance(data, dict) else data
+            nprobe = data.get('nprobe') if isinstance(data, dict) else None
+            blobs = []
+        else:
+            return jsonify({'error': 'Invalid request format'}), 400
+
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'No queries provided'}), 400
+        if len(entries) > max_queries:
+            return jsonify({'error': f'Too many queries (max {max_queries})'}), 400
+
+        queries = []
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                return jsonify({'error': f'Query {position} must be an object'}), 400
+            try:
+                limit = search_limit(entry.get('limit', 5))
+            except ValueError:
+                return jsonify({'error': f'Query {position} has an invalid limit'}), 400
+            try:
+                filter = search_filter(entry)
+            except ValueError as e:
+                return jsonify({'error': f'Query {position} has an invalid filter: {e}'}), 400
+            try:
+                rerank_factor, mmr_lambda = second_stage(entry)
+            except ValueError as e:
+                return jsonify({'error': f'Query {position}: {e}'}), 400
+            stage = {'limit': limit, 'filter': filter, 'rerank_factor': rerank_factor, 'mmr_lambda': mmr_lambda}
+            if isinstance(entry.get('query'), str) and entry['query'].strip():
+                queries.append(dict(stage, text=entry['query'], lexical_weight=entry.get('lexical_weight')))
+            elif isinstance(entry.get('file'), int) and 0 <= entry['file'] < len(blobs):
+                queries.append(dict(stage, image=blobs[entry['file']]))
+            else:
+                return jsonify({'error': f'Query {position} needs a query text or a valid file index'}), 400
+
+        results = indexer.search_batch(queries, nprobe=nprobe)
+        return jsonify({
+            'ids': [[match.id for match in result['matches']] for result in results],
+            'errors': [result['error'] for result in results],
+            'degraded': [result['degraded'] for result in results]
+        })
+
+    except StoreUnavailable as e:
+        print(f"Batch search error: {str(e)}")
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        print(f"Batch search error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"🚀 Starting API on port {port}")
@@ -0,0 +1,100 @@
+"""
+How many inference threads a process should use.
+
+Usable cores are the smaller of the CPU affinity mask and the cgroup CPU quota
+(a container limited to 2 CPUs on a 64-core host must not start 64 threads).
+They are split between the serving workers of the host, so N workers x M
+intra-op threads never oversubscribes them.
+
+Policies (MODEL_THREADS_POLICY):
+    auto    usable cores / workers intra-op threads (default)
+    all     every usable core for this process - lowest single-request latency
+    single  one thread, the old behaviour - highest throughput per core under heavy concurrency
+
+MODEL_INTRA_OP_THREADS / MODEL_INTER_OP_THREADS override the policy's numbers.
+"""
+import os
+import math
+
+POLICIES = ('auto', 'all', 'single')
+
+
+class ThreadConfig:
+    def __init__(self, intra_op, inter_op=1, policy='explicit', usable_cpus=None, workers=1):
+        self.intra_op = intra_op
+        self.inter_op = inter_op
+        self.policy = policy
+        self.usable_cpus = usable_cpus
+        self.workers = workers
+
+    def __repr__(self):
+        return f"ThreadConfig(intra_op={self.intra_op}, inter_op={self.inter_op}, policy='{self.policy}')"
+
+    def describe(self):
+        return (f"{self.intra_op} intra-op / {self.inter_op} inter-op threads "
+                f"(policy {self.policy}, {self.usable_cpus} usable cores, {self.workers} workers)")
+
+
+def affinity_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def cgroup_cpu_limit():
+    """CPU quota of this container in cores, or None when unlimited / not in a cgroup"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota is -1 when unlimited
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def usable_cpus():
+    cpus = affinity_cpus()
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return max(1, cpus)
+
+
+def serving_workers():
+    """Worker processes sharing this host (gunicorn reads the same variable)"""
+    try:
+        return max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+    except ValueError:
+        return 1
+
+
+def thread_config(policy=None, workers=None):
+    """ThreadConfig for this process from the policy, the host and the explicit overrides"""
+    policy = (policy or os.environ.get('MODEL_THREADS_POLICY', 'auto')).lower()
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown thread policy '{policy}', expected one of {POLICIES}")
+    workers = workers or serving_workers()
+    cpus = usable_cpus()
+
+    if policy == 'single':
+        intra_op = 1
+    elif policy == 'all':
+        intra_op = cpus
+    else:
+        intra_op = max(1, cpus // workers)
+    # MobileCLIP's forward pass is one sequential chain of ops; inter-op threads only add idle workers
+    inter_op = 1
+
+    intra_op = int(os.environ.get('MODEL_INTRA_OP_THREADS') or intra_op)
+    inter_op = int(os.environ.get('MODEL_INTER_OP_THREADS') or inter_op)
+    return ThreadConfig(intra_op=intra_op, inter_op=inter_op, policy=policy, usable_cpus=cpus, workers=workers)
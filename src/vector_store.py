@@ -0,0 +1,456 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from quantization import get_codec
+from metadata_filter import FilterIndex, filter_key, parse_filter, matches_filter
+
+load_dotenv()
+
+
+class Match:
+    """A single search hit - mirrors the fields of a Pinecone match"""
+    def __init__(self, id, score=0.0, metadata=None, values=None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata or {}
+        self.values = values
+
+    def __repr__(self):
+        return f"Match(id={self.id!r}, score={self.score:.4f})"
+
+
+class QueryResponse:
+    """Result of a query - exposes .matches like the Pinecone response"""
+    def __init__(self, matches, degraded=False):
+        self.matches = matches
+        # True when a fallback replica answered instead of the store itself
+        self.degraded = degraded
+
+
+class FetchResponse:
+    """Result of a fetch - exposes .vectors (id -> Match) like the Pinecone response"""
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+
+class VectorStore:
+    """
+    Minimal interface every vector store backend implements.
+    Records use the Pinecone shape: {"id": ..., "values": [...], "metadata": {...}}
+    query filters use Pinecone's filter language (see metadata_filter).
+    """
+    name = 'base'
+    dim = 512
+    # Parallel upserts and queries only pay off for network backends
+    upsert_workers = 1
+    query_workers = 1
+    # Whether re-ranking should ask query() for values (else candidate_vectors looks them up itself)
+    rerank_needs_values = True
+    # Whether all metadata is already in memory, so scan_metadata() can rebuild the BM25 index at boot
+    lexical_bootstrap = False
+
+    def upsert(self, vectors):
+        raise NotImplementedError
+
+    def upsert_chunked(self, vectors, chunk_size=100, max_workers=None):
+        """
+        Upsert in chunks of chunk_size, in parallel for network backends.
+        Returns [(chunk, error or None), ...] so callers can report per item.
+        """
+        chunks = [vectors[start:start + chunk_size] for start in range(0, len(vectors), chunk_size)]
+        max_workers = max_workers or self.upsert_workers
+
+        def attempt(chunk):
+            try:
+                self.upsert(chunk)
+                return chunk, None
+            except Exception as e:
+                return chunk, e
+
+        if max_workers <= 1 or len(chunks) <= 1:
+            return [attempt(chunk) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            return list(pool.map(attempt, chunks))
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        raise NotImplementedError
+
+    def query_batch(self, vectors, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        """
+        One QueryResponse per row of vectors, in order. top_k and filter are
+        either shared or given one per query.
+        Runs the queries concurrently for network backends; in-process backends
+        may override this with a single scoring pass.
+        """
+        top_ks, filters = self._per_query(len(vectors), top_k, filter)
+
+        def run(args):
+            vector, k, query_filter = args
+            return self.query(vector, top_k=k, include_metadata=include_metadata,
+                              include_values=include_values, filter=query_filter, **search_params)
+
+        if self.query_workers <= 1 or len(vectors) <= 1:
+            return [run(args) for args in zip(vectors, top_ks, filters)]
+        with ThreadPoolExecutor(max_workers=min(self.query_workers, len(vectors))) as pool:
+            return list(pool.map(run, zip(vectors, top_ks, filters)))
+
+    @staticmethod
+    def _per_query(count, top_k, filter):
+        top_ks = [top_k] * count if isinstance(top_k, int) else list(top_k)
+        filters = list(filter) if isinstance(filter, (list, tuple)) else [filter] * count
+        return top_ks, filters
+
+    def candidate_vectors(self, matches):
+        """
+        (N, dim) float32 vectors behind matches, for second-stage re-ranking.
+        Uses the values returned with the query and fetches the rest in one call;
+        unknown ids get zero rows.
+        """
+        values = {match.id: match.values for match in matches if getattr(match, 'values', None)}
+        missing = [match.id for match in matches if match.id not in values]
+        if missing:
+            for item_id, record in self.fetch(missing).vectors.items():
+                values[item_id] = record.values
+        vectors = np.zeros((len(matches), self.dim), dtype=np.float32)
+        for position, match in enumerate(matches):
+            if match.id in values:
+                vectors[position] = values[match.id]
+        return vectors
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def fetch(self, ids):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+
+class PineconeStore(VectorStore):
+    """Hosted Pinecone index"""
+    name = 'pinecone'
+
+    def __init__(self, index_name='decormate', api_key=None, upsert_workers=4, query_workers=8, host=None):
+        # Import lazily so local mode does not need the Pinecone SDK
+        from pinecone import Pinecone
+
+        self.upsert_workers = upsert_workers
+        self.query_workers = query_workers
+        self.pc = Pinecone(api_key=api_key or os.environ.get('PINECONE_API_KEY'))
+        # One pooled connection per parallel upsert or batch-query worker;
+        # host skips the control-plane lookup (and points tests at a fake server)
+        extra = {'host': host} if host else {}
+        self.index = self.pc.Index(index_name, pool_threads=max(upsert_workers, query_workers), **extra)
+
+    def upsert(self, vectors):
+        # Pinecone wants plain lists; everything else keeps NumPy arrays
+        return self.index.upsert(vectors=[
+            dict(record, values=record["values"].tolist()) if isinstance(record["values"], np.ndarray) else record
+            for record in vectors
+        ])
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        if isinstance(vector, np.ndarray):
+            vector = vector.tolist()
+        # Pinecone speaks the same filter language and applies it server side
+        extra = {'filter': filter} if filter else {}
+        return self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values,
+            **extra
+        )
+
+    def delete(self, ids):
+        return self.index.delete(ids=list(ids))
+
+    def fetch(self, ids):
+        return self.index.fetch(ids=list(ids))
+
+    def count(self):
+        return self.index.describe_index_stats().total_vector_count
+
+
+class LocalStore(VectorStore):
+    """
+    In-process exact search over unit vectors.
+    Vectors live in a preallocated matrix that doubles when full;
+    a query is one matrix-vector product plus argpartition, and a
+    batch of queries is one matrix-matrix product.
+    With quantization='fp16' or 'int8' rows are stored compactly and
+    dequantized chunk by chunk while scoring.
+    A FilterIndex over the FILTER_FIELDS metadata turns a filter into the list
+    of rows to score, so filtered queries never touch excluded vectors.
+    full_precision_path keeps an fp32 copy of quantized rows in a file mapping
+    for exact re-ranking; only the pages of re-ranked candidates get read.
+    """
+    name = 'local'
+    rerank_needs_values = False
+    lexical_bootstrap = True
+
+    def __init__(self, dim=512, initial_capacity=1024, quantization='fp32', chunk_rows=8192, full_precision_path=None):
+        self.dim = dim
+        self.codec = get_codec(quantization)
+        self.chunk_rows = chunk_rows
+        capacity = max(1, initial_capacity)
+        self._codes = np.zeros((capacity, dim), dtype=self.codec.dtype)
+        self._scales = np.ones(capacity, dtype=np.float32)
+        self.full_precision_path = full_precision_path if self.codec.dtype != np.float32 else None
+        self._full = self._map_full(capacity) if self.full_precision_path else None
+        self._ids = []
+        self._metadata = []
+        self._rows = {}
+        self._filter_index = FilterIndex(capacity)
+        self._lock = threading.RLock()
+
+    def _grow(self, needed):
+        capacity = self._codes.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        count = len(self._ids)
+        codes = np.zeros((capacity, self.dim), dtype=self.codec.dtype)
+        codes[:count] = self._codes[:count]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:count] = self._scales[:count]
+        self._codes, self._scales = codes, scales
+        self._filter_index.grow(capacity)
+        if self._full is not None:
+            self._full.flush()
+            self._full = self._map_full(capacity)
+
+    def _map_full(self, capacity):
+        os.makedirs(os.path.dirname(self.full_precision_path) or '.', exist_ok=True)
+        with open(self.full_precision_path, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+        return np.memmap(self.full_precision_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    @staticmethod
+    def _normalize(values):
+        vector = np.asarray(values, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _decode_row(self, row):
+        return self.codec.decode(self._codes[row:row + 1], self._scales[row:row + 1])[0]
+
+    def _scores(self, query, count, rows=None):
+        """
+        Scores against the first count rows, or only the given rows:
+        (n,) for one query, (B, n) for a (B, dim) matrix of queries
+        """
+        total = count if rows is None else len(rows)
+
+        def block(start, end):
+            index = slice(start, end) if rows is None else rows[start:end]
+            return self._codes[index], self._scales[index]
+
+        if self.codec.dtype == np.float32:
+            codes, _ = block(0, total)
+            return codes @ query if query.ndim == 1 else query @ codes.T
+        scores = np.empty(query.shape[:-1] + (total,), dtype=np.float32)
+        for start in range(0, total, self.chunk_rows):
+            end = min(start + self.chunk_rows, total)
+            codes, scales = block(start, end)
+            scores[..., start:end] = self.codec.score(codes, scales, query.T).T
+        return scores
+
+    def _filtered_rows(self, filter, count):
+        """None for every row, else the rows passing the filter"""
+        if not filter:
+            return None
+        rows = np.flatnonzero(self._filter_index.mask(filter, count))
+        if not self._filter_index.exact(filter):
+            # Conditions on fields without bitmaps are checked against the candidates' metadata
+            keep = np.fromiter((matches_filter(self._metadata[row], filter) for row in rows), dtype=bool, count=len(rows))
+            rows = rows[keep]
+        return rows
+
+    @staticmethod
+    def _top_rows(scores, k):
+        """Rows of the k best scores, best first"""
+        count = len(scores)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k] if k < count else np.arange(count)
+        return top[np.argsort(-scores[top], kind='stable')]
+
+    def _matches(self, scores, top, rows, include_metadata, include_values):
+        """Matches for positions top of scores, which were computed over rows (None: all)"""
+        matches = []
+        for position in top:
+            row = position if rows is None else rows[position]
+            matches.append(Match(
+                id=self._ids[row],
+                score=float(scores[position]),
+                metadata=self._metadata[row] if include_metadata else None,
+                values=self._decode_row(row).tolist() if include_values else None
+            ))
+        return matches
+
+    def upsert(self, vectors):
+        with self._lock:
+            self._grow(len(self._ids) + len(vectors))
+            for record in vectors:
+                item_id = record["id"]
+                vector = self._normalize(record["values"])
+                if vector.shape[0] != self.dim:
+                    raise ValueError(f"Vector for {item_id} has dimension {vector.shape[0]}, expected {self.dim}")
+
+                row = self._rows.get(item_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[item_id] = row
+                    self._ids.append(item_id)
+                    self._metadata.append(record.get("metadata") or {})
+                else:
+                    self._metadata[row] = record.get("metadata") or {}
+                self._filter_index.add(row, self._metadata[row])
+                codes, scales = self.codec.encode(vector[None, :])
+                self._codes[row] = codes[0]
+                self._scales[row] = scales[0]
+                if self._full is not None:
+                    self._full[row] = vector
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        filter = parse_filter(filter)
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return QueryResponse([])
+
+            rows = self._filtered_rows(filter, count)
+            if rows is not None and len(rows) == 0:
+                return QueryResponse([])
+            scores = self._scores(query, count, rows)
+            matches = self._matches(scores, self._top_rows(scores, top_k), rows, include_metadata, include_values)
+        return QueryResponse(matches)
+
+    def query_batch(self, vectors, top_k=5, include_metadata=True, include_values=False, filter=None, **search_params):
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        top_ks, filters = self._per_query(len(queries), top_k, filter)
+        filters = [parse_filter(query_filter) for query_filter in filters]
+        responses = [QueryResponse([]) for _ in queries]
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return responses
+
+            # Queries sharing a filter share one pass over its rows
+            groups = {}
+            for position, query_filter in enumerate(filters):
+                groups.setdefault(filter_key(query_filter), []).append(position)
+            for positions in groups.values():
+                rows = self._filtered_rows(filters[positions[0]], count)
+                if rows is not None and len(rows) == 0:
+                    continue
+                scores = self._scores(queries[positions], count, rows)
+                for position, query_scores in zip(positions, scores):
+                    if top_ks[position] > 0:
+                        responses[position] = QueryResponse(self._matches(
+                            query_scores, self._top_rows(query_scores, top_ks[position]), rows,
+                            include_metadata, include_values))
+        return responses
+
+    def delete(self, ids):
+        with self._lock:
+            for item_id in ids:
+                row = self._rows.pop(item_id, None)
+                if row is None:
+                    continue
+                # Move the last row into the hole so the live rows stay contiguous
+                last = len(self._ids) - 1
+                self._filter_index.remove(row)
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._codes[row] = self._codes[last]
+                    self._scales[row] = self._scales[last]
+                    if self._full is not None:
+                        self._full[row] = self._full[last]
+                    self._ids[row] = moved_id
+                    self._metadata[row] = self._metadata[last]
+                    self._rows[moved_id] = row
+                    self._filter_index.move(last, row)
+                self._ids.pop()
+                self._metadata.pop()
+        return {}
+
+    def candidate_vectors(self, matches):
+        """fp32 rows for matches - exact from the full-precision copy when there is one"""
+        vectors = np.zeros((len(matches), self.dim), dtype=np.float32)
+        with self._lock:
+            found = [(position, self._rows.get(match.id)) for position, match in enumerate(matches)]
+            found = [(position, row) for position, row in found if row is not None]
+            if found:
+                positions, rows = map(list, zip(*found))
+                if self._full is not None:
+                    vectors[positions] = self._full[rows]
+                else:
+                    vectors[positions] = self.codec.decode(self._codes[rows], self._scales[rows])
+        return vectors
+
+    def fetch(self, ids):
+        with self._lock:
+            vectors = {}
+            for item_id in ids:
+                row = self._rows.get(item_id)
+                if row is not None:
+                    vectors[item_id] = Match(
+                        id=item_id,
+                        metadata=self._metadata[row],
+                        values=self._decode_row(row).tolist()
+                    )
+        return FetchResponse(vectors)
+
+    def count(self):
+        return len(self._ids)
+
+    def scan_metadata(self):
+        """(id, metadata) of every record, e.g. to rebuild the lexical index"""
+        with self._lock:
+            return list(zip(self._ids, self._metadata))
+
+    def memory_bytes(self):
+        """Bytes held by the live vector rows"""
+        count = len(self._ids)
+        return self._codes[:count].nbytes + (self._scales[:count].nbytes if self.codec.name == 'int8' else 0)
+
+
+def create_vector_store(backend=None):
+    """
+    Build the vector store selected by VECTOR_STORE (pinecone | local | ivf | mmap)
+    """
+    backend = (backend or os.environ.get('VECTOR_STORE', 'pinecone')).lower()
+    if backend == 'pinecone':
+        store = PineconeStore(
+            index_name=os.environ.get('PINECONE_INDEX', 'decormate'),
+            upsert_workers=int(os.environ.get('PINECONE_UPSERT_WORKERS', 4)),
+            query_workers=int(os.environ.get('PINECONE_QUERY_WORKERS', 8)),
+            host=os.environ.get('PINECONE_HOST') or None
+        )
+        # Deadlines, retries, hedging, circuit breaker and replica fallback (PINECONE_RESILIENT=0 disables)
+        if os.environ.get('PINECONE_RESILIENT', '1') == '1':
+            from resilient_store import create_resilient_store
+            return create_resilient_store(store)
+        return store
+    if backend == 'local':
+        return LocalStore(
+            dim=int(os.environ.get('VECTOR_DIM', 512)),
+            initial_capacity=int(os.environ.get('LOCAL_STORE_CAPACITY', 1024)),
+            quantization=os.environ.get('VECTOR_QUANTIZATION', 'fp32'),
+            # Exact fp32 re-ranking for a quantized store, paged in from disk per candidate
+            full_precision_path=os.environ.get('LOCAL_STORE_FP32_PATH') or None
+        )
+    if backend == 'ivf':
+        from ann_index import create_ivf_store
+        return create_ivf_store()
+    if backend == 'mmap':
+        from mmap_store import create_mmap_store
+        return create_mmap_store()
+    raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")
@@ -0,0 +1,364 @@
+"""
+Write-behind buffer for single-item upserts.
+
+    submit(records)  -> journaled, queued, returns at once
+    flusher thread   -> batches of flush_size (or whatever arrived within flush_interval)
+                        -> store.upsert_chunked, failed chunks retried with backoff
+    flush(timeout)   -> barrier: returns once everything submitted before it is stored
+
+The journal is a SQLite table shared by every worker: a record is written there
+before submit() returns and deleted once the store accepted it. Each row carries
+the pid of its worker, so on start (and when idle) a worker replays the rows of
+workers that are no longer running. Records that still fail after max_retries
+move to a failed table instead of blocking the queue.
+"""
+import os
+import json
+import time
+import queue
+import random
+import sqlite3
+import threading
+import numpy as np
+
+_FLUSH = object()
+
+
+def _alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindBuffer:
+    """
+    Bounded queue of upserts drained by one background thread. on_flushed(records)
+    runs after each batch the store accepted (lexical index, result cache).
+    """
+    def __init__(self, store, journal_path='data/write_journal.sqlite', max_pending=10000, flush_size=100,
+                 flush_interval=0.2, max_retries=5, backoff=0.5, max_backoff=30.0, on_flushed=None,
+                 name='write-behind'):
+        self.store = store
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_flushed = on_flushed
+        self.name = name
+        # Orphaned journal rows are looked for at most this often while idle
+        self.recover_every = 30.0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        # Tickets are taken and queued under one lock so queue order is ticket order
+        self._submit_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._submitted = 0
+        self._completed = 0
+        self._last_recovery = 0.0
+
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.recovered = 0
+        self.coalesced = 0
+        self.max_queue_depth = 0
+        self._flush_seconds = 0.0
+        self._oldest = {}
+        self.last_error = None
+
+        self.journal_path = journal_path or None
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        if self.journal_path:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._journal = sqlite3.connect(self.journal_path, check_same_thread=False, timeout=10)
+            self._journal.execute('PRAGMA journal_mode=WAL')
+            self._journal.execute('PRAGMA synchronous=NORMAL')
+            self._journal.execute('CREATE TABLE IF NOT EXISTS pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                  'owner INTEGER NOT NULL, id TEXT NOT NULL, vector BLOB NOT NULL, '
+                                  'metadata TEXT, queued_at REAL NOT NULL)')
+            self._journal.execute('CREATE TABLE IF NOT EXISTS failed (seq INTEGER PRIMARY KEY, id TEXT NOT NULL, '
+                                  'vector BLOB NOT NULL, metadata TEXT, error TEXT, failed_at REAL NOT NULL)')
+            self._journal.commit()
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+        self._recover(startup=True)
+
+    # ---- producers -------------------------------------------------------------
+
+    def submit(self, records, timeout=5.0):
+        """
+        Journal and queue records ({'id', 'values', 'metadata'}) for a background upsert.
+        Blocks up to timeout while the queue is full, then raises RuntimeError.
+        """
+        seqs = self._journal_add(records)
+        for position, (record, seq) in enumerate(zip(records, seqs)):
+            try:
+                self._enqueue(record, seq, timeout)
+            except RuntimeError:
+                # Still journaled: hand the rest to a later recovery, the caller hears about the backlog
+                self._journal_release(seqs[position:])
+                raise
+
+    def _enqueue(self, record, seq, timeout=None):
+        with self._submit_lock:
+            with self._lock:
+                self._submitted += 1
+                ticket = self._submitted
+            try:
+                self._queue.put((ticket, seq, record, time.time()), timeout=timeout)
+            except queue.Full:
+                with self._lock:
+                    self._submitted -= 1
+                raise RuntimeError(f"Write buffer full ({self._queue.maxsize} pending upserts)")
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def flush(self, timeout=None):
+        """Barrier: wait until everything submitted so far is stored (or given up). False on timeout"""
+        with self._lock:
+            target = self._submitted
+            if self._completed >= target:
+                return True
+        try:
+            # Wake the flusher instead of letting it sit out flush_interval
+            self._queue.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            pass
+        with self._done:
+            return self._done.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self, timeout=30.0):
+        """Flush before exit; whatever is left stays in the journal for the next start"""
+        return self.flush(timeout)
+
+    # ---- journal ---------------------------------------------------------------
+
+    def _journal_add(self, records):
+        if self._journal is None:
+            return [None] * len(records)
+        now = time.time()
+        seqs = []
+        with self._journal_lock:
+            for record in records:
+                cursor = self._journal.execute(
+                    'INSERT INTO pending (owner, id, vector, metadata, queued_at) VALUES (?, ?, ?, ?, ?)',
+                    (os.getpid(), record['id'], np.asarray(record['values'], dtype=np.float32).tobytes(),
+                     json.dumps(record.get('metadata')), now))
+                seqs.append(cursor.lastrowid)
+            self._journal.commit()
+        return seqs
+
+    def _journal_release(self, seqs):
+        """Give journal rows up to whichever worker recovers orphans next"""
+        seqs = [(seq,) for seq in seqs if seq is not None]
+        if self._journal is None or not seqs:
+            return
+        with self._journal_lock:
+            self._journal.executemany('UPDATE pending SET owner = 0 WHERE seq = ?', seqs)
+            self._journal.commit()
+
+    def _journal_done(self, seqs):
+        seqs = [(seq,) for seq in seqs if seq is not None]
+        if self._journal is None or not seqs:
+            return
+        with self._journal_lock:
+            self._journal.executemany('DELETE FROM pending WHERE seq = ?', seqs)
+            self._journal.commit()
+
+    def _journal_failed(self, entries, error):
+        seqs = [seq for _, seq, _, _ in entries if seq is not None]
+        if self._journal is None or not seqs:
+            return
+        with self._journal_lock:
+            for seq in seqs:
+                self._journal.execute('INSERT OR REPLACE INTO failed (seq, id, vector, metadata, error, failed_at) '
+                                      'SELECT seq, id, vector, metadata, ?, ? FROM pending WHERE seq = ?',
+                                      (str(error), time.time(), seq))
+                self._journal.execute('DELETE FROM pending WHERE seq = ?', (seq,))
+            self._journal.commit()
+
+    def _recover(self, startup=False):
+        """
+        Re-queue journal rows whose worker is gone (a crash, an OOM kill, a restart),
+        and on startup this process's own leftovers - as many as the queue has room for
+        """
+        self._last_recovery = time.monotonic()
+        if self._journal is None:
+            return 0
+        pid = os.getpid()
+        room = self._queue.maxsize - self._queue.qsize()
+        with self._journal_lock:
+            owners = [row[0] for row in self._journal.execute('SELECT DISTINCT owner FROM pending')]
+            orphaned = [owner for owner in owners if (owner == pid and startup) or (owner != pid and not _alive(owner))]
+            if not orphaned or room <= 0:
+                return 0
+            marks = ','.join('?' * len(orphaned))
+            rows = self._journal.execute(f'SELECT seq, id, vector, metadata FROM pending WHERE owner IN ({marks}) '
+                                         'ORDER BY seq LIMIT ?', (*orphaned, room)).fetchall()
+            self._journal.executemany('UPDATE pending SET owner = ? WHERE seq = ?', [(pid, row[0]) for row in rows])
+            self._journal.commit()
+
+        for position, (seq, item_id, vector, metadata) in enumerate(rows):
+            record = {'id': item_id, 'values': np.frombuffer(vector, dtype=np.float32).copy(),
+                      'metadata': json.loads(metadata) if metadata else None}
+            try:
+                # The flusher thread recovers too, so it must never block on its own queue
+                self._enqueue(record, seq, timeout=None if startup else 0)
+            except RuntimeError:
+                self._journal_release([row[0] for row in rows[position:]])
+                rows = rows[:position]
+                break
+        if rows:
+            with self._lock:
+                self.recovered += len(rows)
+            print(f"♻️ Replaying {len(rows)} journaled upserts")
+        return len(rows)
+
+    # ---- flusher ---------------------------------------------------------------
+
+    def _collect(self):
+        """First entry blocks (waking up now and then to recover orphans), then up to flush_interval for more"""
+        while True:
+            try:
+                first = self._queue.get(timeout=self.recover_every)
+                break
+            except queue.Empty:
+                if time.monotonic() - self._last_recovery >= self.recover_every:
+                    try:
+                        self._recover()
+                    except Exception as e:
+                        print(f"⚠️ Journal recovery failed: {e}")
+        if first is _FLUSH:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _FLUSH:
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            with self._lock:
+                for ticket, _, _, queued_at in batch:
+                    self._oldest[ticket] = queued_at
+            started = time.perf_counter()
+            try:
+                self._flush_batch(batch)
+            except Exception as e:
+                # Never let the flusher die; the journal still holds the batch
+                self.last_error = str(e)
+                print(f"❌ Write-behind flush failed: {e}")
+            with self._lock:
+                self.batches += 1
+                self._flush_seconds += time.perf_counter() - started
+                for ticket, _, _, _ in batch:
+                    self._oldest.pop(ticket, None)
+                self._completed_ticket(batch[-1][0])
+
+    def _completed_ticket(self, ticket):
+        # Entries are flushed in queue order, so the newest ticket of a batch covers the older ones
+        if ticket > self._completed:
+            self._completed = ticket
+            self._done.notify_all()
+
+    def _flush_batch(self, batch):
+        # Repeated writes of one id collapse into the latest; the older ones are done once it lands
+        latest = {}
+        for entry in batch:
+            latest[entry[2]['id']] = entry
+        pending = list(latest.values())
+        superseded = [entry for entry in batch if latest[entry[2]['id']] is not entry]
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                # Full jitter keeps workers that failed together from retrying together
+                time.sleep(random.uniform(0, delay))
+                with self._lock:
+                    self.retries += 1
+            retry = []
+            offset = 0
+            for chunk, chunk_error in self.store.upsert_chunked([entry[2] for entry in pending], chunk_size=self.flush_size):
+                entries = pending[offset:offset + len(chunk)]
+                offset += len(chunk)
+                if chunk_error is None:
+                    self._stored(entries)
+                else:
+                    error = chunk_error
+                    retry.extend(entries)
+            if not retry:
+                break
+            self.last_error = str(error)
+            print(f"⚠️ Write-behind upsert of {len(retry)} vectors failed (attempt {attempt + 1}): {error}")
+            pending = retry
+        else:
+            with self._lock:
+                self.failed += len(pending)
+            self._journal_failed(pending, error)
+            print(f"❌ Gave up on {len(pending)} vectors after {self.max_retries} retries: {error}")
+        self._journal_done([seq for _, seq, _, _ in superseded])
+        if superseded:
+            with self._lock:
+                self.coalesced += len(superseded)
+
+    def _stored(self, entries):
+        self._journal_done([seq for _, seq, _, _ in entries])
+        with self._lock:
+            self.flushed += len(entries)
+        if self.on_flushed:
+            try:
+                self.on_flushed([record for _, _, record, _ in entries])
+            except Exception as e:
+                print(f"⚠️ Post-flush hook failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            oldest = min(self._oldest.values()) if self._oldest else None
+            stats = {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'max_pending': self._queue.maxsize,
+                'in_flight': len(self._oldest),
+                'submitted': self._submitted,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'coalesced': self.coalesced,
+                'retries': self.retries,
+                'recovered': self.recovered,
+                'batches': self.batches,
+                'avg_batch_size': round(self.flushed / self.batches, 2) if self.batches else 0.0,
+                'avg_flush_ms': round(self._flush_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+                'oldest_in_flight_s': round(time.time() - oldest, 3) if oldest is not None else None,
+                'last_error': self.last_error
+            }
+        if self._journal is not None:
+            with self._journal_lock:
+                stats['journal_pending'] = self._journal.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+                stats['journal_failed'] = self._journal.execute('SELECT COUNT(*) FROM failed').fetchone()[0]
+        return stats
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tests import modules the way the benchmarks do: straight from src/ and benchmarks/
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks')]
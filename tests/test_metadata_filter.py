@@ -0,0 +1,151 @@
+"""
+Filter parsing and matching, and FilterIndex masks against matches_filter
+as rows are added, replaced, moved and removed.
+"""
+import numpy as np
+import pytest
+
+from metadata_filter import FilterIndex, matches_filter, parse_filter, filter_key
+
+ROWS = [
+    {'type': 'image', 'category': 'sofa', 'price': 120, 'tags': ['oak', 'vintage']},
+    {'type': 'text', 'category': 'lamp', 'price': 40.5},
+    {'type': 'image', 'category': 'chair', 'tags': 'outdoor', 'in_stock': True},
+    {'type': 'image', 'category': 'sofa', 'price': 900, 'in_stock': False},
+    {'category': 'rug', 'price': '75', 'code': 1},
+    {},
+    {'type': 'text', 'category': ['lamp', 'table'], 'price': [10, 20], 'code': '1'},
+]
+
+FILTERS = [
+    {'type': 'image'},
+    {'category': {'$in': ['sofa', 'table']}},
+    {'category': {'$nin': ['sofa']}},
+    {'type': {'$ne': 'image'}},
+    {'price': {'$gte': 40.5, '$lt': 900}},
+    {'price': {'$lte': 75}},
+    {'tags': 'oak'},
+    {'tags': {'$in': ['outdoor']}},
+    {'in_stock': True},
+    {'in_stock': {'$eq': False}},
+    {'code': 1},
+    {'code': '1'},
+    {'$or': [{'category': 'lamp'}, {'price': {'$gt': 500}}]},
+    {'$and': [{'type': 'image'}, {'category': {'$ne': 'chair'}}]},
+    {'type': 'image', 'price': {'$gt': 100}},
+]
+
+
+def expected(filter, rows):
+    parsed = parse_filter(filter)
+    return np.array([metadata is not None and matches_filter(metadata, parsed) for metadata in rows], dtype=bool)
+
+
+def answered(index, filter, rows):
+    """The mask, narrowed with matches_filter the way the stores do when it is not exact"""
+    parsed = parse_filter(filter)
+    mask = index.mask(parsed, len(rows))
+    if not index.exact(parsed):
+        assert not (expected(filter, rows) & ~mask).any(), 'the mask must be a superset of the matches'
+        mask &= expected(filter, rows)
+    return mask
+
+
+def test_parse_filter_expands_shorthands_and_rejects_bad_filters():
+    assert parse_filter(None) is None and parse_filter({}) is None
+    assert parse_filter({'type': 'image'}) == {'type': {'$eq': 'image'}}
+    assert parse_filter({'$or': [{'a': 1}, {'b': {'$in': [2]}}]}) == {'$or': [{'a': {'$eq': 1}}, {'b': {'$in': [2]}}]}
+    assert filter_key({'a': 1, 'b': 2}) == filter_key({'b': 2, 'a': 1})
+    for bad in (['type'], {'$or': []}, {'$xor': [{'a': 1}]}, {'price': {'$gt': 'cheap'}}, {'a': {'$in': 'x'}},
+                {'a': {'$like': 'x'}}):
+        with pytest.raises(ValueError):
+            parse_filter(bad)
+
+
+def test_matches_filter_semantics():
+    parsed = parse_filter
+    # List values match equality on any element, never a range
+    assert matches_filter(ROWS[6], parsed({'category': 'table'}))
+    assert not matches_filter(ROWS[6], parsed({'price': {'$gt': 5}}))
+    # $ne / $nin also match a missing field
+    assert matches_filter(ROWS[5], parsed({'type': {'$ne': 'image'}}))
+    assert matches_filter(ROWS[5], parsed({'category': {'$nin': ['sofa']}}))
+    # Ranges are numeric only; True, 1 and '1' stay apart
+    assert not matches_filter(ROWS[4], parsed({'price': {'$lt': 100}}))
+    assert matches_filter(ROWS[4], parsed({'code': 1})) and not matches_filter(ROWS[4], parsed({'code': '1'}))
+    assert not matches_filter(ROWS[4], parsed({'code': True}))
+    assert matches_filter(ROWS[0], None)
+
+
+@pytest.mark.parametrize('fields', ['*', ['type', 'category'], ['price'], []], ids=['all', 'type-category', 'price', 'none'])
+@pytest.mark.parametrize('filter', FILTERS, ids=[str(filter) for filter in FILTERS])
+def test_mask_matches_the_filter(fields, filter):
+    index = FilterIndex(capacity=4, fields=fields)
+    index.grow(len(ROWS))
+    for row, metadata in enumerate(ROWS):
+        index.add(row, metadata)
+    assert (answered(index, filter, ROWS) == expected(filter, ROWS)).all()
+
+
+def test_exact_only_for_indexed_fields():
+    index = FilterIndex(fields=['type', 'price'])
+    assert index.exact(parse_filter({'type': 'image', 'price': {'$gt': 1}}))
+    assert not index.exact(parse_filter({'category': 'sofa'}))
+    assert not index.exact(parse_filter({'$or': [{'type': 'image'}, {'name': 'x'}]}))
+
+
+def test_rows_replaced_moved_and_removed():
+    rng = np.random.default_rng(0)
+    categories = ['sofa', 'chair', 'lamp', 'table']
+    index = FilterIndex(capacity=16, fields='*')
+    rows = []
+    for step in range(600):
+        metadata = {'type': str(rng.choice(['image', 'text'])), 'category': str(rng.choice(categories)),
+                    'price': int(rng.integers(0, 100))}
+        if rng.random() < 0.3:
+            metadata['category'] = [str(item) for item in rng.choice(categories, size=2, replace=False)]
+        action = rng.random()
+        if action < 0.6 or not rows:
+            if len(rows) == index.capacity:
+                index.grow(index.capacity * 2)
+            index.add(len(rows), metadata)
+            rows.append(metadata)
+        elif action < 0.8:
+            row = int(rng.integers(len(rows)))
+            index.add(row, metadata)
+            rows[row] = metadata
+        else:
+            # LocalStore's delete: the last row fills the hole
+            row, last = int(rng.integers(len(rows))), len(rows) - 1
+            if row != last:
+                index.move(last, row)
+                rows[row] = rows[last]
+            else:
+                index.remove(row)
+            rows.pop()
+        if step % 50 == 0:
+            for filter in FILTERS:
+                assert (answered(index, filter, rows) == expected(filter, rows)).all()
+    for filter in FILTERS:
+        assert (answered(index, filter, rows) == expected(filter, rows)).all()
+
+
+def test_values_no_row_has_anymore_are_forgotten():
+    index = FilterIndex(fields='*')
+    index.add(0, {'category': 'sofa'})
+    index.add(0, {'category': 'chair'})
+    assert set(index._postings['category']) == {('s', 'chair')}
+    index.remove(0)
+    assert not index._postings['category']
+
+
+def test_field_past_max_values_falls_back_to_a_scan():
+    index = FilterIndex(fields='*', max_values=3)
+    rows = [{'name': f"item-{row}", 'type': 'image'} for row in range(10)]
+    for row, metadata in enumerate(rows):
+        index.add(row, metadata)
+    assert 'name' not in index._postings and 'name' not in index._codes
+    assert index.exact(parse_filter({'type': 'image'}))
+    assert not index.exact(parse_filter({'name': 'item-4'}))
+    for filter in ({'name': 'item-4'}, {'name': {'$nin': ['item-1', 'item-2']}}, {'type': 'image', 'name': 'item-9'}):
+        assert (answered(index, filter, rows) == expected(filter, rows)).all()
@@ -0,0 +1,69 @@
+"""
+ONNX engine against the PyTorch model, with the tolerances of benchmarks/onnx_parity.py.
+
+Needs the MobileCLIP checkpoint and an export (python src/export_onnx.py [--quantize]);
+skipped when either is missing.
+"""
+import numpy as np
+import pytest
+
+from onnx_parity import (parity_failures, MIN_COSINE, MAX_ABS, MIN_COSINE_INT8, MAX_ABS_INT8)
+from precision_benchmark import TEXTS
+from preprocess_benchmark import synthetic_jpeg
+
+# Casing, punctuation, accents, emoji, an empty query and one past the context length
+TOKENIZER_TEXTS = TEXTS + [
+    "Mid-Century MODERN sofa!!", "chaise longue à l'ancienne", "sofá café naïve", "lamp 💡 w/ dimmer",
+    "", "  extra   spaces  ", "oak " * 100
+]
+
+
+def _load(module, name, **kwargs):
+    try:
+        clip = getattr(__import__(module), name)(**kwargs)
+        return clip, clip.load_mobileclip_model()
+    except (ImportError, FileNotFoundError, OSError, RuntimeError) as e:
+        pytest.skip(f"engine unavailable: {e}")
+
+
+@pytest.fixture(scope='module')
+def images():
+    return [synthetic_jpeg(1200, 900, seed=i) for i in range(4)]
+
+
+@pytest.fixture(scope='module')
+def torch_reference(images):
+    clip, (model, preprocess, tokenizer) = _load('model', 'ModelCLIP', precision='fp32')
+    return _embed(clip, model, preprocess, tokenizer, images)
+
+
+def _embed(clip, model, preprocess, tokenizer, images):
+    return {
+        'images': clip.encode_images(images, model, preprocess, batch_size=len(images)),
+        'texts': clip.encode_texts(TEXTS, model, tokenizer),
+        'tokens': np.asarray(tokenizer(TOKENIZER_TEXTS)),
+    }
+
+
+@pytest.mark.parametrize('quantized, min_cosine, max_abs', [
+    (False, MIN_COSINE, MAX_ABS),
+    (True, MIN_COSINE_INT8, MAX_ABS_INT8),
+], ids=['onnx', 'onnx-int8'])
+def test_onnx_matches_torch(torch_reference, images, quantized, min_cosine, max_abs):
+    pytest.importorskip('onnxruntime')
+    clip, (model, preprocess, tokenizer) = _load('onnx_engine', 'OnnxModelCLIP', quantized=quantized)
+    result = _embed(clip, model, preprocess, tokenizer, images)
+    assert parity_failures(result, torch_reference, min_cosine, max_abs) == []
+
+
+def test_parity_failures_reports_drift():
+    rng = np.random.default_rng(0)
+    reference = {'images': rng.standard_normal((3, 512)), 'texts': rng.standard_normal((2, 512)),
+                 'tokens': np.arange(10)}
+    assert parity_failures(reference, reference, MIN_COSINE, MAX_ABS) == []
+
+    drifted = dict(reference, images=reference['images'] + 0.01, tokens=np.arange(1, 11))
+    failures = parity_failures(drifted, reference, MIN_COSINE, MAX_ABS)
+    assert any(failure.startswith('images: max abs') for failure in failures)
+    assert any(failure.startswith('tokens') for failure in failures)
+    assert not any(failure.startswith('texts') for failure in failures)
@@ -0,0 +1,196 @@
+"""
+ResilientStore against the fake Pinecone data plane (benchmarks/fake_pinecone.py):
+breaker, retries, deadlines, hedging and replica mirroring.
+"""
+import time
+import threading
+import numpy as np
+import pytest
+
+from fake_pinecone import serve
+from vector_store import LocalStore, PineconeStore, QueryResponse
+from resilient_store import ResilientStore, CircuitBreaker, StoreUnavailable
+
+
+@pytest.fixture(scope='module')
+def fake():
+    server, url, faults = serve()
+    yield url, faults
+    server.shutdown()
+
+
+@pytest.fixture
+def primary(fake):
+    url, faults = fake
+    faults.update({'latency_ms': 0, 'jitter_ms': 0, 'slow_rate': 0, 'slow_ms': 0, 'error_rate': 0,
+                   'error_status': 503, 'requests': 0})
+    return PineconeStore(api_key='fake', host=url)
+
+
+def vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'id': str(i), 'values': rng.standard_normal(512).astype(np.float32)} for i in range(count)]
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_reset(fake, primary):
+    _, faults = fake
+    store = ResilientStore(primary, deadline=1.0, retries=0,
+                           breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.3))
+    query = vectors(1)[0]['values']
+    faults.update({'error_rate': 1.0})
+    for _ in range(3):
+        with pytest.raises(StoreUnavailable):
+            store.query(query, top_k=1)
+    assert store.breaker.state == 'open'
+
+    # Open: fails fast without reaching the server
+    sent = faults.requests
+    with pytest.raises(StoreUnavailable, match='circuit breaker is open'):
+        store.query(query, top_k=1)
+    assert faults.requests == sent
+    assert store.breaker.rejected == 1
+
+    # After reset_timeout one probe goes through; a failed probe reopens at once
+    time.sleep(0.35)
+    with pytest.raises(StoreUnavailable):
+        store.query(query, top_k=1)
+    assert store.breaker.state == 'open'
+    assert faults.requests > sent
+
+    # A successful probe closes it again
+    time.sleep(0.35)
+    faults.update({'error_rate': 0.0})
+    store.query(query, top_k=1)
+    assert store.breaker.state == 'closed'
+    # The failed probe counts as a second trip
+    assert store.breaker.trips == 2
+
+
+def test_client_errors_are_not_retried(fake, primary):
+    _, faults = fake
+    store = ResilientStore(primary, deadline=2.0, retries=3, backoff=0.01)
+    faults.update({'error_rate': 1.0, 'error_status': 400})
+    with pytest.raises(Exception) as raised:
+        store.query(vectors(1)[0]['values'], top_k=1)
+    assert not isinstance(raised.value, StoreUnavailable)
+    # Older SDKs name it status, newer ones status_code
+    assert (getattr(raised.value, 'status', None) or getattr(raised.value, 'status_code', None)) == 400
+    assert store.attempts == 1 and store.retried == 0
+    assert faults.requests == 1
+    # The request was wrong, not the store
+    assert store.breaker.state == 'closed' and store.breaker.failures == 0
+
+
+class ServerError(Exception):
+    status = 503
+
+
+class FailsFirst(LocalStore):
+    """Local store that answers its first few queries with a 503, like a briefly overloaded index"""
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def query(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ServerError('Service unavailable')
+        return super().query(*args, **kwargs)
+
+
+def test_server_errors_are_retried_until_one_succeeds():
+    primary = FailsFirst(failures=2)
+    primary.upsert(vectors(5))
+    store = ResilientStore(primary, deadline=2.0, retries=2, backoff=0.01)
+    assert store.query(vectors(5)[1]['values'], top_k=1).matches[0].id == '1'
+    assert store.attempts == 3 and store.retried == 2
+    assert store.breaker.state == 'closed'
+
+
+def test_server_errors_past_the_retries_are_unavailable(fake, primary):
+    _, faults = fake
+    store = ResilientStore(primary, deadline=1.0, retries=1, backoff=0.01)
+    faults.update({'error_rate': 1.0})
+    started = time.monotonic()
+    with pytest.raises(StoreUnavailable):
+        store.query(vectors(1)[0]['values'], top_k=1)
+    assert time.monotonic() - started < 1.3
+    assert store.failures == 1 and store.breaker.failures == 1
+
+
+def test_deadline_is_honoured_when_the_sdk_hangs(fake, primary):
+    _, faults = fake
+    store = ResilientStore(primary, deadline=0.2, retries=2, backoff=0.01)
+    faults.update({'latency_ms': 3000})
+    started = time.monotonic()
+    with pytest.raises(StoreUnavailable):
+        store.query(vectors(1)[0]['values'], top_k=1)
+    assert time.monotonic() - started < 0.5
+    assert store.timeouts >= 1
+
+
+class SlowFirstCall(LocalStore):
+    """Local store whose first query stalls, the way one slow Pinecone replica would"""
+    def __init__(self, stall):
+        super().__init__()
+        self.stall = stall
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def query(self, *args, **kwargs):
+        with self._calls_lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            time.sleep(self.stall)
+        return super().query(*args, **kwargs)
+
+
+def test_hedged_query_answers_before_a_stalled_attempt():
+    primary = SlowFirstCall(stall=1.0)
+    primary.upsert(vectors(20))
+    store = ResilientStore(primary, deadline=2.0, hedge_after=0.05)
+    started = time.monotonic()
+    response = store.query(vectors(20)[3]['values'], top_k=1)
+    assert time.monotonic() - started < 0.5
+    assert response.matches[0].id == '3'
+    assert store.hedges == 1 and store.hedge_wins == 1
+
+
+class BrokenReplica(LocalStore):
+    def upsert(self, vectors):
+        raise OSError('disk full')
+
+    def delete(self, ids):
+        raise OSError('disk full')
+
+
+def test_replica_failure_does_not_fail_the_primary_write(fake, primary):
+    store = ResilientStore(primary, replica=BrokenReplica(), deadline=2.0)
+    records = vectors(5)
+    assert store.upsert(records) is not None
+    assert primary.fetch(['0', '4']).vectors.keys() == {'0', '4'}
+    store.delete(['0'])
+    assert '0' not in primary.fetch(['0']).vectors
+    assert store.stats()['mirror_failures'] == 2
+
+
+def test_outage_falls_back_to_a_filled_replica_and_flags_it(fake, primary):
+    _, faults = fake
+    records = vectors(10)
+    replica = LocalStore()
+    replica.upsert(records)
+    store = ResilientStore(primary, replica=replica, deadline=0.3, retries=0)
+    faults.update({'error_rate': 1.0})
+    response = store.query(records[2]['values'], top_k=1)
+    assert isinstance(response, QueryResponse)
+    assert response.degraded and response.matches[0].id == '2'
+    assert store.count() == 10
+
+
+def test_outage_with_an_empty_replica_is_unavailable(fake, primary):
+    _, faults = fake
+    store = ResilientStore(primary, replica=LocalStore(), deadline=0.3, retries=0)
+    faults.update({'error_rate': 1.0})
+    with pytest.raises(StoreUnavailable, match='replica is empty'):
+        store.query(vectors(1)[0]['values'], top_k=1)
@@ -0,0 +1,258 @@
+"""
+LocalStore, IVFStore and MmapStore against a brute-force reference: after
+upserts, replacements and deletes every store must return the reference's
+top-k, with and without metadata filters, one query at a time and batched.
+"""
+import numpy as np
+import pytest
+
+from metadata_filter import matches_filter, parse_filter
+from vector_store import LocalStore
+from ann_index import IVFStore
+from mmap_store import MmapStore
+
+DIM = 32
+CATEGORIES = ['sofa', 'chair', 'lamp', 'table', 'rug', 'bed']
+TAGS = ['outdoor', 'vintage', 'oak', 'velvet']
+
+FILTERS = [
+    {'type': 'image'},
+    {'type': {'$eq': 'text'}},
+    {'category': {'$in': ['sofa', 'lamp']}},
+    {'category': {'$nin': ['sofa', 'chair']}},
+    {'category': {'$ne': 'rug'}},
+    {'price': {'$gte': 100, '$lt': 500}},
+    {'price': {'$gt': 800}},
+    {'type': 'image', 'category': {'$in': ['bed', 'table']}, 'price': {'$lte': 600}},
+    {'$or': [{'type': 'text'}, {'price': {'$gt': 900}}]},
+    {'$and': [{'category': {'$ne': 'lamp'}}, {'in_stock': True}]},
+    {'tags': 'outdoor'},
+    {'tags': {'$in': ['velvet', 'oak']}, 'type': 'image'},
+    {'name': 'item-17'},
+    {'category': 'no-such-category'},
+]
+
+
+def metadata(rng, number):
+    record = {'type': 'image' if rng.random() < 0.7 else 'text', 'category': str(rng.choice(CATEGORIES)),
+              'name': f"item-{number}", 'in_stock': bool(rng.random() < 0.5)}
+    if rng.random() < 0.8:
+        record['price'] = int(rng.integers(0, 1000))
+    if rng.random() < 0.6:
+        record['tags'] = [str(tag) for tag in rng.choice(TAGS, size=int(rng.integers(1, 3)), replace=False)]
+    return record
+
+
+def records(rng, ids):
+    return [{'id': item_id, 'values': rng.standard_normal(DIM).astype(np.float32), 'metadata': metadata(rng, i)}
+            for i, item_id in enumerate(ids)]
+
+
+class Reference:
+    """Every record in a dict, every query a full scan"""
+    def __init__(self):
+        self.items = {}
+
+    def upsert(self, vectors):
+        for record in vectors:
+            values = np.asarray(record['values'], dtype=np.float32)
+            self.items[record['id']] = (values / np.linalg.norm(values), record.get('metadata') or {})
+
+    def delete(self, ids):
+        for item_id in ids:
+            self.items.pop(item_id, None)
+
+    def query(self, vector, top_k, filter=None):
+        filter = parse_filter(filter)
+        query = np.asarray(vector, dtype=np.float32)
+        scored = sorted(((float(values @ query), item_id) for item_id, (values, meta) in self.items.items()
+                         if matches_filter(meta, filter)), reverse=True)
+        return [item_id for _, item_id in scored[:top_k]]
+
+
+@pytest.fixture(params=['local', 'local-all-fields', 'local-overflow', 'ivf', 'mmap'])
+def store(request, tmp_path, monkeypatch):
+    # 'local' indexes type/category only (the rest falls back to a scan), 'local-all-fields'
+    # posts every field, and 'local-overflow' drops category's postings past 3 values
+    monkeypatch.setenv('FILTER_FIELDS', 'type,category')
+    if request.param == 'local-all-fields':
+        monkeypatch.setenv('FILTER_FIELDS', '*')
+    if request.param == 'local-overflow':
+        monkeypatch.setenv('FILTER_FIELDS', '*')
+        monkeypatch.setenv('FILTER_MAX_VALUES', '3')
+    if request.param.startswith('local'):
+        yield LocalStore(dim=DIM, initial_capacity=16)
+    elif request.param == 'ivf':
+        # Trained after 100 vectors; probing all 4 cells keeps it exact
+        yield IVFStore(dim=DIM, nlist=4, nprobe=4, train_size=100)
+    else:
+        store = MmapStore(path=str(tmp_path / 'vectors'), dim=DIM, compact_threshold=10 ** 6,
+                          compact_interval=3600)
+        yield store
+        store.close()
+
+
+def compact(store):
+    """Fold pending mmap writes into the mapped files, so queries cover base rows and delta alike"""
+    if isinstance(store, MmapStore):
+        store.compact()
+
+
+def churn(store, reference, rng):
+    """Insert, replace, delete and re-insert, mirroring every write into the reference"""
+    for write in (
+        lambda: records(rng, [str(i) for i in range(300)]),
+        lambda: records(rng, [str(i) for i in range(0, 300, 6)]),
+    ):
+        batch = write()
+        store.upsert(batch)
+        reference.upsert(batch)
+        compact(store)
+
+    deleted = [str(i) for i in range(1, 300, 7)] + ['missing']
+    store.delete(deleted)
+    reference.delete(deleted)
+    # Back after a delete, plus fresh ids, left uncompacted
+    batch = records(rng, [str(i) for i in range(1, 100, 7)] + [f"new-{i}" for i in range(20)])
+    store.upsert(batch)
+    reference.upsert(batch)
+    return deleted
+
+
+def queries(rng, count=8):
+    return rng.standard_normal((count, DIM)).astype(np.float32)
+
+
+def ids(response):
+    return [match.id for match in response.matches]
+
+
+def test_store_matches_brute_force_after_upserts_replaces_and_deletes(store):
+    rng = np.random.default_rng(0)
+    reference = Reference()
+    deleted = churn(store, reference, rng)
+
+    assert store.count() == len(reference.items)
+    fetched = store.fetch(['0', '6', '8', '29', 'missing']).vectors
+    assert set(fetched) == {item_id for item_id in ['0', '6', '8', '29'] if item_id in reference.items}
+    for item_id, match in fetched.items():
+        assert match.metadata == reference.items[item_id][1]
+        assert np.allclose(match.values, reference.items[item_id][0], atol=1e-6)
+
+    for query in queries(rng):
+        assert ids(store.query(query, top_k=10)) == reference.query(query, 10)
+        assert ids(store.query(query, top_k=len(reference.items) + 5)) == reference.query(query, 10 ** 6)
+        scores = [match.score for match in store.query(query, top_k=10).matches]
+        assert scores == sorted(scores, reverse=True)
+    assert not {item_id for item_id in deleted if item_id not in reference.items} & {
+        match.id for query in queries(rng) for match in store.query(query, top_k=50).matches}
+
+
+@pytest.mark.parametrize('filter', FILTERS, ids=[str(filter) for filter in FILTERS])
+def test_filtered_query_matches_brute_force(store, filter):
+    rng = np.random.default_rng(1)
+    reference = Reference()
+    churn(store, reference, rng)
+    for query in queries(rng, 4):
+        response = store.query(query, top_k=15, filter=filter)
+        assert ids(response) == reference.query(query, 15, filter)
+        assert all(matches_filter(match.metadata, parse_filter(filter)) for match in response.matches)
+
+
+def test_query_batch_matches_single_queries(store):
+    rng = np.random.default_rng(2)
+    reference = Reference()
+    churn(store, reference, rng)
+    batch = queries(rng, len(FILTERS))
+    top_ks = [int(k) for k in rng.integers(0, 20, size=len(FILTERS))]
+
+    shared = store.query_batch(batch, top_k=7, filter={'type': 'image'})
+    assert [ids(response) for response in shared] == [reference.query(query, 7, {'type': 'image'}) for query in batch]
+
+    # Per-query top_k and filters, with some queries sharing a filter
+    filters = FILTERS[:len(FILTERS) // 2] * 2
+    per_query = store.query_batch(batch, top_k=top_ks, filter=filters)
+    assert [ids(response) for response in per_query] == [
+        reference.query(query, k, filter) for query, k, filter in zip(batch, top_ks, filters)]
+
+
+def test_invalid_filter_is_rejected(store):
+    store.upsert(records(np.random.default_rng(3), ['a']))
+    with pytest.raises(ValueError):
+        store.query(np.ones(DIM, dtype=np.float32), top_k=1, filter={'price': {'$gt': 'cheap'}})
+
+
+# ---- MmapStore persistence ---------------------------------------------------
+
+def open_mmap(path, **kwargs):
+    return MmapStore(path=str(path), dim=DIM, compact_threshold=10 ** 6, compact_interval=3600, **kwargs)
+
+
+def assert_same_answers(store, reference, rng):
+    assert store.count() == len(reference.items)
+    for query in queries(rng, 4):
+        assert ids(store.query(query, top_k=10)) == reference.query(query, 10)
+        for filter in FILTERS:
+            assert ids(store.query(query, top_k=10, filter=filter)) == reference.query(query, 10, filter)
+
+
+def test_mmap_reopens_after_compaction(tmp_path):
+    rng = np.random.default_rng(4)
+    reference = Reference()
+    store = open_mmap(tmp_path)
+    churn(store, reference, rng)
+    store.close()
+
+    reopened = open_mmap(tmp_path)
+    assert not reopened._delta
+    assert_same_answers(reopened, reference, rng)
+
+    # Writes after the reopen reuse the rows freed by the deletes
+    rows = reopened._rows
+    free = reopened._db.execute('SELECT COUNT(*) FROM free_rows').fetchone()[0]
+    assert 0 < free < 10
+    batch = records(rng, [f"late-{i}" for i in range(10)])
+    reopened.upsert(batch)
+    reference.upsert(batch)
+    reopened.compact()
+    assert reopened._rows == rows + 10 - free
+    assert_same_answers(reopened, reference, rng)
+    reopened.close()
+
+
+def test_mmap_replays_the_log_after_a_crash(tmp_path):
+    rng = np.random.default_rng(5)
+    reference = Reference()
+    store = open_mmap(tmp_path)
+    churn(store, reference, rng)
+    # No close(): the last writes are only in the append log, as after a crash
+    with open(tmp_path / 'append.log', 'ab') as log:
+        log.write(b'\x01torn')
+
+    recovered = open_mmap(tmp_path)
+    assert recovered._delta
+    assert_same_answers(recovered, reference, rng)
+    recovered.compact()
+    assert_same_answers(recovered, reference, rng)
+    recovered.close()
+    store._closed = True
+
+
+def test_mmap_read_only_snapshot(tmp_path):
+    rng = np.random.default_rng(6)
+    reference = Reference()
+    store = open_mmap(tmp_path)
+    churn(store, reference, rng)
+    store.compact()
+
+    snapshot = open_mmap(tmp_path, read_only=True)
+    assert_same_answers(snapshot, reference, rng)
+    with pytest.raises(RuntimeError, match='read-only'):
+        snapshot.upsert(records(rng, ['x']))
+    with pytest.raises(RuntimeError, match='read-only'):
+        snapshot.delete(['0'])
+    snapshot.close()
+    store.close()
+
+    with pytest.raises(FileNotFoundError):
+        open_mmap(tmp_path / 'elsewhere', read_only=True)